@@ -0,0 +1,55 @@
+"""Compare an archive of a game's saves against the saves themselves.
+
+Reports the storage used by the saves vs. the delta compressed archive and the
+time to restore a turn from the archive vs. parsing the save it came from.
+
+Usage:
+    python benchmarks/archive.py path/to/auto/*.CivBeyondSwordSave
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from civ4save import SaveFile
+from civ4save.archive import Archive, turn_state
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("saves", nargs="+", type=Path, help="saves of one game")
+    parser.add_argument("--keyframe-interval", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.c4a"
+        arc = Archive(path, args.keyframe_interval)
+        start = time.perf_counter()
+        arc.add(args.saves)
+        ingest = time.perf_counter() - start
+
+        saves_size = sum(f.stat().st_size for f in args.saves)
+        archive_size = path.stat().st_size
+        print(f"saves:   {len(args.saves)} files {saves_size / 1024:10.1f} KB")
+        print(
+            f"archive: {len(arc)} turns {archive_size / 1024:10.1f} KB "
+            f"({archive_size / saves_size:.1%} of saves), ingest {ingest:.2f}s"
+        )
+
+        start = time.perf_counter()
+        for turn in arc.turns:
+            arc.turn(turn)
+        from_archive = (time.perf_counter() - start) / len(arc)
+
+        start = time.perf_counter()
+        for file in args.saves:
+            turn_state(SaveFile(file))
+        from_saves = (time.perf_counter() - start) / len(args.saves)
+
+    print(f"load a turn from archive: {from_archive * 1000:8.1f} ms")
+    print(f"load a turn from save:    {from_saves * 1000:8.1f} ms")
+    print(f"speedup: {from_saves / from_archive:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time every parse backend on some saves.
+
+Reports the prefix (settings, game state, players) and full parse time of each
+backend and its speedup over the reference `construct` backend. Compiled
+structs are compiled, or loaded from the cache, before timing.
+
+Usage:
+    python benchmarks/backends.py tests/saves/*.CivBeyondSwordSave
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from civ4save.backends import BACKENDS
+from civ4save.save_file import _read_savefile
+
+
+def best(func: Callable[[bytes], Any], data: bytes, repeat: int) -> float:  # noqa: D103
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("saves", nargs="+", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--prefix-only", action="store_true")
+    args = parser.parse_args()
+
+    for file in args.saves:
+        try:
+            data = _read_savefile(file)
+            BACKENDS["construct"].parse_prefix(data)
+        except Exception as ex:
+            print(f"{file.name}: skipped, {ex}")
+            continue
+        print(file.name)
+        reference = {}
+        for name, backend in BACKENDS.items():
+            backend.parse_prefix(data)  # warm up, compiles the compiled structs
+            kinds = [("prefix", backend.parse_prefix)]
+            if not args.prefix_only:
+                kinds.append(("full", backend.parse))
+            for kind, func in kinds:
+                try:
+                    secs = best(func, data, args.repeat)
+                except Exception as ex:
+                    print(f"  {name:10} {kind:7} failed: {ex}")
+                    continue
+                reference.setdefault(kind, secs)
+                print(
+                    f"  {name:10} {kind:7} {secs * 1000:8.1f} ms "
+                    f"{reference[kind] / secs:5.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare parsing saves in a process pool with and without shared memory.
+
+The baseline workers return the parsed prefix `Container` and the `Plot` list,
+pickled, which is how a pool of `SaveFile`s hands back results. `iter_batch`
+returns small attrs objects and plot columns in shared memory.
+
+Usage:
+    python benchmarks/batch.py tests/saves/*.CivBeyondSwordSave --workers 4
+"""
+import argparse
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Tuple
+
+from civ4save import SaveFile
+from civ4save.batch import BatchResult, iter_batch, parse_record
+
+
+def parse_containers(file: str) -> Tuple[Any, Any]:  # noqa: D103
+    save = SaveFile(file)
+    return save._prefix, save.plots
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("saves", nargs="+", type=Path)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    files = []
+    sizes = [0, 0]
+    for file in map(str, args.saves):
+        try:
+            sizes[0] += len(pickle.dumps(parse_containers(file)))
+            record = parse_record(file)
+        except Exception as ex:
+            print(f"{file}: skipped, {ex}")
+            continue
+        sizes[1] += len(pickle.dumps(record))
+        BatchResult(record).close()
+        files.append(file)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        for _ in pool.map(parse_containers, files):
+            pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for result in iter_batch(files, args.workers):
+        result.close()
+    batch = time.perf_counter() - start
+
+    print(f"pickled containers: {baseline:6.2f}s {sizes[0] / 1024:10.1f} KB pickled")
+    print(f"shared memory:      {batch:6.2f}s {sizes[1] / 1024:10.1f} KB pickled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the installed zlib implementations on every bundled test save.
+
+For each save and each decompressor of `civ4save.decompressors`, times
+decompressing the whole payload (`_decompress_savefile`) and, through the
+on-demand `_Inflater` that `SaveFile.settings` uses, only up to the plots.
+Times are the fastest of `--repeat`, the speedup is of the whole payload over
+the standard library.
+
+Usage:
+    python benchmarks/decompress.py
+    pip install isal zlib-ng && python benchmarks/decompress.py --repeat 20
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from civ4save import SaveFile
+from civ4save.decompressors import DECOMPRESSORS
+from civ4save.save_file import _decompress_savefile, _Inflater
+
+ROOT = Path(__file__).resolve().parent.parent
+SAVES = sorted((ROOT / "tests" / "saves").glob("*.CivBeyondSwordSave"))
+
+
+def best(func: Callable[[], Any], repeat: int) -> float:
+    """Return the fastest time of calling `func` `repeat` times."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("saves", nargs="*", type=Path, default=SAVES)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"installed: {', '.join(DECOMPRESSORS)}")
+    print(
+        f"{'save':32} {'decompressor':12} {'full ms':>9} {'prefix ms':>10} "
+        f"{'speedup':>7}"
+    )
+    for file in args.saves:
+        if file.name.startswith("not-a-real"):
+            continue
+        contents = file.read_bytes()
+        plots = SaveFile(file)._prefix._plots_offset
+        baseline = best(
+            lambda: _decompress_savefile(contents, DECOMPRESSORS["zlib"]), args.repeat
+        )
+        for name, decompressor in DECOMPRESSORS.items():
+            full = best(
+                lambda: _decompress_savefile(contents, decompressor), args.repeat
+            )
+            prefix = best(
+                lambda: _Inflater(contents, decompressor).ensure(plots), args.repeat
+            )
+            print(
+                f"{file.name[:32]:32} {name:12} {full * 1000:9.2f} "
+                f"{prefix * 1000:10.2f} {baseline / full:7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
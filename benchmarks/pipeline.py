@@ -0,0 +1,232 @@
+"""Time each phase of loading a save, for every bundled test save.
+
+Phases, each timed on its own with the output of the previous one:
+```
+read           read the file
+find_zlib_end  find where the compressed chunks end
+decompress     _decompress_savefile
+prefix         parse everything before the plots (with --backend)
+parse          the full CivBeyondSwordSave parse (with --backend)
+settings       Settings.from_struct
+game_state     GameState.from_struct
+players        get_players
+plot_index     walk the plot records from the prefix's _plots_offset
+decode_plots   Plot.from_header of every record of the plot_index
+json           export.dumps of all of the above
+```
+Each phase is run `--repeat` times and the fastest time kept. Every run is
+appended to a JSON history file, `--compare` then checks the run against an
+earlier one and exits with status 1 if a phase got slower by more than
+`--threshold`.
+
+Usage:
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --compare --threshold 0.1
+    python benchmarks/pipeline.py --compare-only --baseline before-change
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from civ4save import export
+from civ4save.backends import get_backend
+from civ4save.objects import GameState, Plot, Settings, get_players
+from civ4save.save_file import _decompress_savefile, _find_zlib_end
+from civ4save.vanilla.plot_index import PlotIndex
+
+ROOT = Path(__file__).resolve().parent.parent
+SAVES = sorted((ROOT / "tests" / "saves").glob("*.CivBeyondSwordSave"))
+HISTORY = ROOT / "benchmarks" / "history.json"
+PHASES = [
+    "read",
+    "find_zlib_end",
+    "decompress",
+    "prefix",
+    "parse",
+    "settings",
+    "game_state",
+    "players",
+    "plot_index",
+    "decode_plots",
+    "json",
+]
+# differences smaller than this are noise whatever the ratio
+MIN_DIFF = 0.0005
+
+Results = Dict[str, Dict[str, Optional[float]]]
+
+
+def best(func: Callable[[], Any], repeat: int) -> Any:
+    """Return (fastest time, result) of calling `func` `repeat` times."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def time_save(file: Path, repeat: int, backend: str) -> Dict[str, Optional[float]]:
+    """Time every phase of `file`, phases after a failing one are None."""
+    times: Dict[str, Optional[float]] = dict.fromkeys(PHASES)
+    out: Dict[str, Any] = {}
+
+    def plot_index() -> PlotIndex:
+        prefix = out["prefix"]
+        return PlotIndex(
+            out["decompress"],
+            prefix._plots_offset,
+            prefix.grid_width,
+            prefix.grid_height,
+        )
+
+    phases: Dict[str, Callable[[], Any]] = {
+        "read": file.read_bytes,
+        "find_zlib_end": lambda: _find_zlib_end(
+            out["read"], out["read"].find(b"\x78\x9c")
+        ),
+        "decompress": lambda: _decompress_savefile(out["read"]),
+        "prefix": lambda: get_backend(backend).parse_prefix(out["decompress"]),
+        "parse": lambda: get_backend(backend).parse(out["decompress"]),
+        "settings": lambda: Settings.from_struct(out["parse"]),
+        "game_state": lambda: GameState.from_struct(out["parse"]),
+        "players": lambda: get_players(out["parse"]),
+        "plot_index": plot_index,
+        "decode_plots": lambda: [
+            Plot.from_header(header) for header in out["plot_index"].iter_headers()
+        ],
+        "json": lambda: export.dumps(
+            dict(
+                settings=out["settings"],
+                game_state=out["game_state"],
+                players=out["players"],
+                plots=out["decode_plots"],
+            )
+        ),
+    }
+    for phase in PHASES:
+        try:
+            times[phase], out[phase] = best(phases[phase], repeat)
+        except Exception as ex:
+            print(f"  {phase} failed: {type(ex).__name__}: {ex}")
+            break
+    return times
+
+
+def load_history(path: Path) -> List[Dict[str, Any]]:  # noqa: D103
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())["runs"]
+
+
+def find_run(runs: List[Dict[str, Any]], label: Optional[str]) -> Dict[str, Any]:
+    """Return the latest run labelled `label`, or the latest run."""
+    for run in reversed(runs):
+        if label is None or run["label"] == label:
+            return run
+    raise SystemExit(f"no run labelled {label} in the history")
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Print the phases of both runs side by side, return the regressions."""
+    print(f"\n{baseline['label']} -> {current['label']}")
+    regressions = []
+    for save, phases in current["results"].items():
+        old_phases = baseline["results"].get(save, {})
+        for phase, new in phases.items():
+            old = old_phases.get(phase)
+            if new is None or old is None:
+                continue
+            ratio = new / old if old else float("inf")
+            flag = ""
+            if ratio > 1 + threshold and new - old > MIN_DIFF:
+                flag = "  REGRESSION"
+                regressions.append(f"{save} {phase}")
+            print(
+                f"  {save[:32]:32} {phase:14} {old * 1000:9.2f} ms "
+                f"{new * 1000:9.2f} ms {ratio:6.2f}x{flag}"
+            )
+    return regressions
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("saves", nargs="*", type=Path, default=SAVES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default=None, help="see civ4save.backends")
+    parser.add_argument("--history", type=Path, default=HISTORY)
+    parser.add_argument("--label", default=None, help="defaults to the time")
+    parser.add_argument(
+        "--no-record", action="store_true", help="don't add the run to the history"
+    )
+    parser.add_argument(
+        "--compare", action="store_true", help="compare against --baseline"
+    )
+    parser.add_argument(
+        "--compare-only",
+        action="store_true",
+        help="compare the latest recorded run against --baseline, don't run",
+    )
+    parser.add_argument(
+        "--baseline", default=None, help="label of the run to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown ratio counted as a regression",
+    )
+    args = parser.parse_args()
+    runs = load_history(args.history)
+
+    if args.compare_only:
+        if not runs:
+            raise SystemExit(f"no runs recorded in {args.history}")
+        if len(runs) < 2 and args.baseline is None:
+            raise SystemExit("need two recorded runs to compare")
+        baseline = find_run(runs[:-1], args.baseline)
+        current = runs[-1]
+    else:
+        backend = get_backend(args.backend).name
+        results: Results = {}
+        for file in args.saves:
+            print(file.name)
+            results[file.name] = time_save(file, args.repeat, backend)
+            for phase, secs in results[file.name].items():
+                if secs is not None:
+                    print(f"  {phase:14} {secs * 1000:9.2f} ms")
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        current = dict(
+            label=args.label or now,
+            time=now,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            backend=backend,
+            repeat=args.repeat,
+            results=results,
+        )
+        baseline = {}
+        if args.compare:
+            if not runs:
+                raise SystemExit(f"no earlier run in {args.history} to compare")
+            baseline = find_run(runs, args.baseline)
+        if not args.no_record:
+            args.history.write_text(json.dumps(dict(runs=runs + [current]), indent=1))
+
+    if baseline:
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Time and measure the memory of loading saves of growing size.
+
+Each size is a synthetic save (see `civ4save.synthetic`) made from the
+template, for which loading settings, game state, players and plots is timed
+(fastest of `--repeat`) and its peak memory measured with tracemalloc in a
+separate run. Doubling the map should roughly double both, except with
+`--stream`, which counts the terrain of every plot with
+`civ4save.streaming.iter_events` and whose peak should stay flat.
+
+Usage:
+    python benchmarks/scaling.py
+    python benchmarks/scaling.py --sizes 100x60 200x120 400x240 --players 18
+    python benchmarks/scaling.py --replay-messages 1000 10000 100000
+    python benchmarks/scaling.py --sizes 100x60 200x120 400x240 --stream
+"""
+import argparse
+import functools
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from civ4save import SaveFile
+from civ4save.streaming import PlotEvent, iter_events
+from civ4save.synthetic import synthesize
+
+ROOT = Path(__file__).resolve().parent.parent
+TEMPLATE = ROOT / "tests" / "saves" / "mehmed-epic.CivBeyondSwordSave"
+
+
+def load(file: Path, backend: Optional[str]) -> Any:
+    """Load everything `civ4save parse` shows."""
+    save = SaveFile(file, backend=backend)
+    return save.settings, save.game_state, save.players, save.plots
+
+
+def stream(file: Path) -> Any:
+    """Count the terrain of every plot without keeping the save around."""
+    terrain: Counter = Counter()
+    for event in iter_events(file):
+        if isinstance(event, PlotEvent):
+            terrain[event.header["terrain_type"]] += 1
+    return terrain
+
+
+def measure(file: Path, repeat: int, run: Callable[[Path], Any]) -> Dict[str, float]:
+    """Return the fastest time and the peak memory of `run(file)`."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(file)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run(file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(seconds=min(times), peak=peak)
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--template", type=Path, default=TEMPLATE)
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["50x30", "100x60", "200x120"],
+        help="map sizes, WIDTHxHEIGHT",
+    )
+    parser.add_argument("--players", type=int, default=None)
+    parser.add_argument(
+        "--replay-messages",
+        type=int,
+        nargs="+",
+        default=[None],
+        help="replay message counts, each run with every size",
+    )
+    parser.add_argument("--deals", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default=None, help="see civ4save.backends")
+    parser.add_argument(
+        "--stream", action="store_true", help="stream the plots instead of loading"
+    )
+    args = parser.parse_args()
+    run = stream if args.stream else functools.partial(load, backend=args.backend)
+
+    print(
+        f"{'map':>9} {'messages':>9} {'file KB':>9} {'plots':>7} "
+        f"{'load ms':>9} {'peak MB':>8} {'us/plot':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for messages in args.replay_messages:
+            for size in args.sizes:
+                width, height = (int(n) for n in size.split("x"))
+                file = Path(tmp) / f"{size}-{messages}.CivBeyondSwordSave"
+                file.write_bytes(
+                    synthesize(
+                        args.template,
+                        grid_width=width,
+                        grid_height=height,
+                        players=args.players,
+                        replay_messages=messages,
+                        deals=args.deals,
+                    )
+                )
+                result = measure(file, args.repeat, run)
+                plots = width * height
+                print(
+                    f"{size:>9} {messages or '-':>9} "
+                    f"{file.stat().st_size / 1024:9.0f} {plots:7} "
+                    f"{result['seconds'] * 1000:9.1f} {result['peak'] / 2**20:8.1f} "
+                    f"{result['seconds'] / plots * 1e6:8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
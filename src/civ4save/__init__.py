@@ -1,5 +1,7 @@
 """Public API and metadata for civ4save package."""
 
+from .aio import aiter_saves  # noqa: F401
+from .batch import iter_batch  # noqa: F401
 from .save_file import NotASaveFile, SaveFile  # noqa: F401
 
 __version__ = "0.7.0"
@@ -0,0 +1,67 @@
+"""Load many saves concurrently from asyncio code.
+
+Reading happens in a thread and zlib releases the GIL while decompressing, so
+those steps overlap. The construct parse is pure Python and holds the GIL, but
+it runs off the event loop so the loop stays responsive.
+"""
+import asyncio
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Set, Union
+
+from .save_file import NotASaveFile, SaveFile
+
+SAVE_PATTERN = "*.CivBeyondSwordSave"
+
+
+async def aiter_saves(
+    directory: Union[str, Path],
+    pattern: str = SAVE_PATTERN,
+    concurrency: int = 4,
+    executor: Optional[Executor] = None,
+    full: bool = False,
+    skip_invalid: bool = False,
+    **kwargs: Any,
+) -> AsyncIterator[SaveFile]:
+    """Yield the saves in `directory` as they finish loading.
+
+    Args:
+        directory (str | Path): Folder of saves.
+        pattern (str): Glob of the files to load. Defaults to all saves.
+        concurrency (int): Most saves loading at once. Defaults to 4.
+        executor (Executor | None): See `SaveFile.aopen`.
+        full (bool): See `SaveFile.aopen`.
+        skip_invalid (bool): Skip files that aren't saves instead of raising
+            `NotASaveFile`. Defaults to False.
+        **kwargs: Passed on to `SaveFile`, such as `backend` or
+            `decompressor`.
+    """
+    loop = asyncio.get_running_loop()
+    files = await loop.run_in_executor(
+        None, lambda: sorted(Path(directory).glob(pattern))
+    )
+    remaining = iter(files)
+    pending: Set[asyncio.Future] = set()
+    try:
+        while True:
+            for file in remaining:
+                opening = SaveFile.aopen(file, executor, full, **kwargs)
+                pending.add(asyncio.ensure_future(opening))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                try:
+                    save = task.result()
+                except NotASaveFile:
+                    if skip_invalid:
+                        continue
+                    raise
+                yield save
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,331 @@
+"""Delta compressed archive of the saves of a single game.
+
+An archive is a zip file holding a `manifest.json` and one JSON entry per
+archived turn. Every `keyframe_interval`-th turn is stored in full, the turns in
+between only store the plot values and player stats that changed since the
+previous turn. Consecutive autosaves share almost all of their plots, so a long
+game's history takes a fraction of the space of the saves and any turn can be
+restored without parsing a save.
+
+Saves are matched to a game by settings that can't change during play (map,
+leaders, civs, ...). `map_random_seed` and `soren_random_seed` are the current
+state of the game's random number generators rather than fixed seeds, so they
+advance from turn to turn and can't identify a game.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import warnings
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import attrs
+
+from .objects import Player, Settings
+from .save_file import SaveFile
+
+MANIFEST = "manifest.json"
+ARCHIVE_VERSION = 1
+KEYFRAME_INTERVAL = 16
+
+PLOT_COLUMNS = (
+    "owner",
+    "plot_type",
+    "terrain_type",
+    "feature_type",
+    "bonus_type",
+    "improvement_type",
+    "route_type",
+    "irrigated",
+    "yields",
+)
+"""Fixed width `CvPlot` fields kept for every plot, see `PlotIndex.column`"""
+
+PlotColumns = Dict[str, List[int]]
+PlayerStats = Dict[int, Dict[str, Any]]
+
+
+class ArchiveError(Exception):
+    """Raised when a save can't be added to an archive."""
+
+    pass
+
+
+@attrs.define(slots=True)
+class TurnState:
+    """Plot columns and player stats of one archived save."""
+
+    turn: int
+    file: str
+    plots: PlotColumns
+    players: PlayerStats
+
+
+def player_stats(player: Player) -> Dict[str, Any]:
+    """Return the per-turn stats kept for `player`."""
+    civics = player.civics
+    return dict(
+        name=player.name,
+        civ=player.civ.name,
+        leader=player.leader.name,
+        team=player.team,
+        score=player.score,
+        rank=player.rank,
+        owned_plots=player.owned_plots,
+        cities=len(player.cities),
+        great_people=len(player.great_people),
+        projects=len(player.projects),
+        trades=len(player.trades),
+        religion=player.religion.name,
+        government=civics.government.name,
+        legal=civics.legal.name,
+        labor=civics.labor.name,
+        economy=civics.economy.name,
+        religion_civic=civics.religion.name,
+    )
+
+
+def game_key(save: SaveFile) -> str:
+    """Return a key identifying the game `save` belongs to."""
+    return settings_key(save.settings, save.players)
+
+
+def settings_key(settings: Settings, players: Dict[int, Player]) -> str:
+    """Return the `game_key` of a save with `settings` and `players`."""
+    ident = [
+        settings.map_script,
+        settings.world_size.name,
+        settings.climate.name,
+        settings.sea_level.name,
+        settings.game_speed.name,
+        settings.start_year,
+        settings.grid_width,
+        settings.grid_height,
+        [(p.civ.name, p.leader.name) for p in players.values()],
+    ]
+    return hashlib.sha1(json.dumps(ident).encode()).hexdigest()
+
+
+def turn_state(save: SaveFile) -> TurnState:
+    """Decode the archived columns and stats of `save`."""
+    index = save.plot_index
+    plots = {col: index.column(col).tolist() for col in PLOT_COLUMNS}
+    players = {idx: player_stats(p) for idx, p in save.players.items()}
+    return TurnState(save.current_turn, Path(save.file).name, plots, players)
+
+
+def encode_delta(prev: TurnState, cur: TurnState) -> Dict[str, Any]:
+    """Return what changed from `prev` to `cur`.
+
+    Plots are stored as (changed indexes, new values) per column, players as
+    the changed stats of each player.
+    """
+    plots = {}
+    for col, values in cur.plots.items():
+        old = prev.plots[col]
+        changed = [n for n, (a, b) in enumerate(zip(old, values)) if a != b]
+        if changed:
+            plots[col] = [changed, [values[n] for n in changed]]
+    players = {}
+    for idx, stats in cur.players.items():
+        old_stats = prev.players.get(idx, {})
+        diff = {k: v for k, v in stats.items() if old_stats.get(k) != v}
+        if diff:
+            players[idx] = diff
+    removed = [idx for idx in prev.players if idx not in cur.players]
+    return dict(plots=plots, players=players, removed_players=removed)
+
+
+def apply_delta(prev: TurnState, turn: int, file: str, delta: Dict) -> TurnState:
+    """Return the state after applying `delta` to `prev`."""
+    plots = {col: list(values) for col, values in prev.plots.items()}
+    for col, (changed, values) in delta["plots"].items():
+        column = plots[col]
+        for n, val in zip(changed, values):
+            column[n] = val
+    players = {idx: dict(stats) for idx, stats in prev.players.items()}
+    for idx, diff in delta["players"].items():
+        players.setdefault(int(idx), {}).update(diff)
+    for idx in delta["removed_players"]:
+        players.pop(idx, None)
+    return TurnState(turn, file, plots, players)
+
+
+def _entry_name(turn: int) -> str:
+    return f"turns/{turn:06d}.json"
+
+
+class Archive:
+    """History of one game stored as per-turn deltas."""
+
+    def __init__(
+        self, path: Union[str, Path], keyframe_interval: int = KEYFRAME_INTERVAL
+    ) -> None:
+        """Open the archive at `path`, it's created by the first `add`.
+
+        Args:
+            path (str | Path): Archive file.
+            keyframe_interval (int): Store every nth turn in full. Only used
+                when creating a new archive. Defaults to 16.
+        """
+        self.path = Path(path)
+        self.game: Optional[str] = None
+        self.grid_size: Tuple[int, int] = (0, 0)
+        self.keyframe_interval = keyframe_interval
+        self.turns: List[int] = []
+        self.files: Dict[int, str] = {}
+        if self.path.exists():
+            with zipfile.ZipFile(self.path) as zf:
+                manifest = json.loads(zf.read(MANIFEST))
+            if manifest.get("version") != ARCHIVE_VERSION:
+                raise ArchiveError(f"{self.path} is not a supported archive")
+            self.game = manifest["game"]
+            width, height = manifest["grid_size"]
+            self.grid_size = (width, height)
+            self.keyframe_interval = manifest["keyframe_interval"]
+            self.turns = manifest["turns"]
+            self.files = {int(t): f for t, f in manifest["files"].items()}
+
+    def __len__(self) -> int:
+        """Return number of archived turns."""
+        return len(self.turns)
+
+    def _is_keyframe(self, n: int) -> bool:
+        return n % self.keyframe_interval == 0
+
+    def _decode(
+        self, zf: zipfile.ZipFile, n: int, prev: Optional[TurnState]
+    ) -> TurnState:
+        turn = self.turns[n]
+        entry = json.loads(zf.read(_entry_name(turn)))
+        if self._is_keyframe(n) or prev is None:
+            players = {int(idx): stats for idx, stats in entry["players"].items()}
+            return TurnState(turn, entry["file"], entry["plots"], players)
+        return apply_delta(prev, turn, entry["file"], entry["delta"])
+
+    def __iter__(self) -> Iterator[TurnState]:
+        """Iterate every archived turn in order."""
+        if not self.turns:
+            return
+        with zipfile.ZipFile(self.path) as zf:
+            state = None
+            for n in range(len(self.turns)):
+                state = self._decode(zf, n, state)
+                yield state
+
+    def turn(self, turn: int) -> TurnState:
+        """Restore the state of `turn`, decoding at most one keyframe interval.
+
+        Raises:
+            KeyError: If `turn` isn't archived.
+        """
+        try:
+            n = self.turns.index(turn)
+        except ValueError:
+            raise KeyError(f"turn {turn} not in archive")
+        keyframe = n - n % self.keyframe_interval
+        with zipfile.ZipFile(self.path) as zf:
+            state = None
+            for i in range(keyframe, n + 1):
+                state = self._decode(zf, i, state)
+        return state  # type: ignore
+
+    def add(self, files: Iterable[Union[str, Path]]) -> List[int]:
+        """Add saves to the archive, returning the newly archived turns.
+
+        Every save is read before anything is written, so on error the archive
+        is left as it was. Turns that are already archived are skipped. Turns
+        after the last archived one are appended to a copy of the archive,
+        which only decodes the turns since the last keyframe, any other turn
+        has the whole archive rewritten in turn order. Either way the archive
+        is replaced atomically.
+
+        Raises:
+            ArchiveError: If a save is from a different game.
+        """
+        game, grid_size = self.game, self.grid_size
+        new: Dict[int, TurnState] = {}
+        for file in files:
+            save = SaveFile(file)
+            key = game_key(save)
+            if game is None:
+                game, grid_size = key, save.map_size
+            elif key != game:
+                raise ArchiveError(f"{file} is not from the archived game")
+            turn = save.current_turn
+            if turn in self.files or turn in new:
+                continue
+            new[turn] = turn_state(save)
+        if not new:
+            return []
+
+        previous = self.game, self.grid_size
+        self.game, self.grid_size = game, grid_size
+        try:
+            if self.turns and min(new) > self.turns[-1]:
+                self._append([new[t] for t in sorted(new)])
+            else:
+                states = {s.turn: s for s in self}
+                states.update(new)
+                self._write([states[t] for t in sorted(states)])
+        except BaseException:
+            self.game, self.grid_size = previous
+            raise
+        return sorted(new)
+
+    def _write(self, states: List[TurnState]) -> None:
+        """Write an archive of the turns `states`, replacing this one."""
+        self._save([], {}, None, states)
+
+    def _append(self, states: List[TurnState]) -> None:
+        """Append the turns `states`, all after the last archived turn."""
+        self._save(self.turns, self.files, self.turn(self.turns[-1]), states)
+
+    def _save(
+        self,
+        turns: List[int],
+        files: Dict[int, str],
+        prev: Optional[TurnState],
+        states: List[TurnState],
+    ) -> None:
+        """Write `states` after the archived `turns`, then replace the archive.
+
+        `prev` is the state of the last of `turns`. If there is one the archive
+        is copied and appended to, rather than written from scratch.
+        """
+        start = len(turns)
+        turns = turns + [s.turn for s in states]
+        files = {**files, **{s.turn: s.file for s in states}}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        if prev is None:
+            zf = zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED)
+        else:
+            shutil.copyfile(self.path, tmp)
+            zf = zipfile.ZipFile(tmp, "a", compression=zipfile.ZIP_DEFLATED)
+        with zf:
+            for n, state in enumerate(states, start):
+                entry: Dict[str, Any] = dict(turn=state.turn, file=state.file)
+                if self._is_keyframe(n) or prev is None:
+                    entry.update(plots=state.plots, players=state.players)
+                else:
+                    entry.update(delta=encode_delta(prev, state))
+                zf.writestr(_entry_name(state.turn), json.dumps(entry))
+                prev = state
+            manifest = dict(
+                version=ARCHIVE_VERSION,
+                game=self.game,
+                grid_size=self.grid_size,
+                keyframe_interval=self.keyframe_interval,
+                turns=turns,
+                files=files,
+            )
+            with warnings.catch_warnings():
+                # appending adds a second manifest, the last one is read
+                warnings.simplefilter("ignore", UserWarning)
+                zf.writestr(MANIFEST, json.dumps(manifest))
+        os.replace(tmp, self.path)
+        self.turns, self.files = turns, files
@@ -0,0 +1,215 @@
+"""Interchangeable parsers of a decompressed save.
+
+`SaveFile` only needs two things from a parser: the fields before the plots
+(`parse_prefix`, enough for settings, game state and players) and the whole
+struct (`parse`, for `SaveFile.raw`). Every backend returns the same fields
+with the same values as the reference `construct` backend, which the
+differential tests in `tests/test_backends.py` check on every bundled save.
+
+Backends:
+    construct: The `CivBeyondSwordSave` struct, the reference.
+    struct: Decodes replay messages, most of the prefix parse time, with
+        `struct` and the remaining sections with construct.
+    compiled: The same structs compiled by construct, see `vanilla.compiled`.
+
+The backend is picked by `SaveFile(file, backend=...)`, else the
+`CIV4SAVE_BACKEND` environment variable, else `auto` (the fastest one).
+"""
+import abc
+import io
+import os
+from typing import IO, Any, Dict, List, Optional
+
+from construct import Construct, Container, EnumInteger
+
+from .vanilla.compiled import compile_struct
+from .vanilla.replay import read_replay_messages
+from .vanilla.structure import (
+    PREFIX_SECTIONS,
+    SECTIONS,
+    CivBeyondSwordSave,
+    CivBeyondSwordSavePrefix,
+    ReplayMessage,
+    parse_section,
+    section_struct,
+)
+
+BACKEND_ENV = "CIV4SAVE_BACKEND"
+AUTO = "auto"
+
+
+class Backend(abc.ABC):
+    """Parse the decompressed bytes of a save."""
+
+    name = ""
+
+    @abc.abstractmethod
+    def parse_prefix(self, data: bytes) -> Any:
+        """Return the fields of `CivBeyondSwordSavePrefix`."""
+
+    @abc.abstractmethod
+    def parse(self, data: bytes) -> Any:
+        """Return the fields of `CivBeyondSwordSave`."""
+
+    def parse_prefix_stream(self, stream: IO[bytes]) -> Any:
+        """Return the fields of `CivBeyondSwordSavePrefix` read from `stream`.
+
+        Backends that parse streams read no further than the prefix, which
+        lets `SaveFile` decompress only that much. The others read it all.
+        """
+        return self.parse_prefix(stream.read())
+
+    def _parse_section(self, name: str, stream: IO[bytes], **context: Any) -> Any:
+        return parse_section(name, stream, **context)
+
+    def parse_section(
+        self, data: bytes, name: str, stream: IO[bytes], parsed: Container
+    ) -> Container:
+        """Parse section `name` at the position of `stream`.
+
+        Args:
+            data (bytes): Decompressed save, the contents of `stream`, or
+                empty if only the stream is available.
+            name (str): Key of `structure.SECTIONS`.
+            stream (IO[bytes]): Positioned at the start of the section.
+            parsed (Container): Fields of the sections before it.
+
+        Returns:
+            Container: Only the section's own fields.
+        """
+        context = {}
+        if name == "plots":
+            context = dict(grid_width=parsed.grid_width, grid_height=parsed.grid_height)
+        section = self._parse_section(name, stream, **context)
+        section.pop("_io", None)
+        for key in context:
+            del section[key]
+        return section
+
+    def parse_sections(
+        self, data: bytes, names: List[str], stream: IO[bytes], parsed: Container
+    ) -> Container:
+        """Parse the consecutive sections `names` into `parsed`, with offsets."""
+        for name in names:
+            parsed[f"_{name}_offset"] = stream.tell()
+            parsed.update(self.parse_section(data, name, stream, parsed))
+        return parsed
+
+
+class ConstructBackend(Backend):
+    """The construct structs, everything else is checked against it."""
+
+    name = "construct"
+
+    def parse_prefix(self, data: bytes) -> Any:  # noqa: D102
+        return CivBeyondSwordSavePrefix.parse(data)
+
+    def parse(self, data: bytes) -> Any:  # noqa: D102
+        return CivBeyondSwordSave.parse(data)
+
+    def parse_prefix_stream(self, stream: IO[bytes]) -> Any:  # noqa: D102
+        return CivBeyondSwordSavePrefix.parse_stream(stream)
+
+
+class CompiledBackend(Backend):
+    """The construct structs compiled, each compiled on first use."""
+
+    name = "compiled"
+
+    def __init__(self) -> None:  # noqa: D107
+        self._structs: Dict[str, Construct] = {}
+
+    def _struct(self, name: str, struct: Construct) -> Construct:
+        if name not in self._structs:
+            self._structs[name] = compile_struct(name, struct)
+        return self._structs[name]
+
+    def parse_prefix(self, data: bytes) -> Any:  # noqa: D102
+        return self._struct("prefix", CivBeyondSwordSavePrefix).parse(data)
+
+    def parse(self, data: bytes) -> Any:  # noqa: D102
+        return self._struct("save", CivBeyondSwordSave).parse(data)
+
+    def parse_prefix_stream(self, stream: IO[bytes]) -> Any:  # noqa: D102
+        return self._struct("prefix", CivBeyondSwordSavePrefix).parse_stream(stream)
+
+    def _parse_section(self, name: str, stream: IO[bytes], **context: Any) -> Any:
+        key = f"section_{name}"
+        if key not in self._structs:
+            self._structs[key] = compile_struct(key, section_struct(name, context))
+        return self._structs[key].parse_stream(stream, **context)
+
+
+def _enum_table(field: str) -> Dict[int, Any]:
+    """Return the value -> decoded value table of Enum `field` of ReplayMessage."""
+    (subcon,) = [sc.subcon for sc in ReplayMessage.subcons if sc.name == field]
+    return dict(subcon.decmapping)
+
+
+_MESSAGE_TYPES = _enum_table("type")
+_COLORS = _enum_table("e_color")
+
+
+def decode_replay_messages(data: bytes, stream: IO[bytes]) -> Container:
+    """Decode the replay_messages section at the position of `stream`."""
+    raw, pos = read_replay_messages(data, stream.tell())
+    messages = [
+        Container(
+            turn=turn,
+            type=_MESSAGE_TYPES.get(type_) or EnumInteger(type_),
+            plot_x=plot_x,
+            plot_y=plot_y,
+            player=player,
+            text=text,
+            e_color=_COLORS.get(color) or EnumInteger(color),
+        )
+        for turn, type_, plot_x, plot_y, player, text, color in raw
+    ]
+    stream.seek(pos)
+    return Container(_sz_replay_messages=len(messages), replay_messages=messages)
+
+
+class StructBackend(Backend):
+    """Decode replay messages with `struct`, the rest with construct."""
+
+    name = "struct"
+
+    def parse_section(  # noqa: D102
+        self, data: bytes, name: str, stream: IO[bytes], parsed: Container
+    ) -> Container:
+        # without the whole save, as when streaming, construct reads the stream
+        if name == "replay_messages" and data:
+            return decode_replay_messages(data, stream)
+        return super().parse_section(data, name, stream, parsed)
+
+    def parse_prefix(self, data: bytes) -> Any:  # noqa: D102
+        stream = io.BytesIO(data)
+        prefix = self.parse_sections(data, PREFIX_SECTIONS, stream, Container())
+        prefix["_plots_offset"] = stream.tell()
+        return prefix
+
+    def parse(self, data: bytes) -> Any:  # noqa: D102
+        stream = io.BytesIO(data)
+        return self.parse_sections(data, list(SECTIONS), stream, Container())
+
+
+BACKENDS: Dict[str, Backend] = {
+    b.name: b for b in (ConstructBackend(), StructBackend(), CompiledBackend())
+}
+"""Every backend by name, the reference first"""
+_FASTEST = "compiled"
+
+
+def get_backend(name: Optional[str] = None) -> Backend:
+    """Return the backend `name`, falling back to `CIV4SAVE_BACKEND` and `auto`.
+
+    Raises:
+        ValueError: If there is no backend called `name`.
+    """
+    name = name or os.environ.get(BACKEND_ENV) or AUTO
+    if name == AUTO:
+        name = _FASTEST
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown backend {name}, expected one of {list(BACKENDS)}")
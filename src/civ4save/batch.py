@@ -0,0 +1,328 @@
+"""Parse many saves in a process pool and hand the results back without copies.
+
+Sending a parsed save back from a worker normally means pickling construct
+`Container`s, which is slow and large, and the parent then decompresses the file
+again to look at anything else. Instead each worker decompresses its save once,
+decodes the plot columns and writes both into one `multiprocessing.shared_memory`
+block:
+
+```
+| decompressed save | plot offsets | column | column | ... |
+```
+
+Only the block's name and layout are pickled, along with the small attrs
+objects (`Settings`, `GameState`, `Player`). The parent maps the block and
+`BatchResult` exposes its parts as memoryviews, so plot columns cost nothing to
+receive however big the map is.
+
+A block is freed on Windows as soon as its last handle is closed, so a worker
+keeps the handle of each block it made until the parent has attached it:
+`iter_batch` counts the results it attached in a shared value, and each worker
+closes the handles of attached blocks before its next task.
+
+`shared_memory` is new in Python 3.8, older versions pickle the block as bytes.
+"""
+import itertools
+import multiprocessing
+import os
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from pathlib import Path
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+import attrs
+
+from .objects import GameState, Player, Settings
+from .save_file import NotASaveFile, SaveFile
+from .vanilla.plot_index import PLOT_FIELDS, decode_columns
+
+DATA = "data"
+"""Layout key of the decompressed save"""
+OFFSETS = "plot_offsets"
+"""Layout key of the plot record boundaries, `PlotIndex.offsets`"""
+WINDOW_PER_WORKER = 2
+"""Saves parsed ahead of the consumer of `iter_batch`, per worker"""
+_ALIGN = 8
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None  # type: ignore
+
+_held: Dict[str, Tuple[Optional[int], Any]] = {}
+"""Name -> (task number, handle) of the blocks made by this process and not yet
+attached by the parent. The task number is None outside `iter_batch`."""
+_attached: Any = None
+"""In a worker of `iter_batch`, the shared count of results the parent attached"""
+
+
+@attrs.define(slots=True)
+class SharedBlock:
+    """Where a worker put a save's buffers."""
+
+    name: Optional[str]
+    """Name of the shared memory block, None if `payload` holds the bytes"""
+    layout: Dict[str, Tuple[str, int, int]]
+    """Part name -> (typecode, start byte, end byte)"""
+    payload: Optional[bytes] = None
+
+
+@attrs.define(slots=True)
+class SaveRecord:
+    """Everything a worker sends back about one save."""
+
+    file: str
+    settings: Settings
+    game_state: GameState
+    players: Dict[int, Player]
+    block: SharedBlock
+
+
+def _build_block(
+    parts: List[Tuple[str, str, bytes]], task: Optional[int] = None
+) -> SharedBlock:
+    """Copy `(name, typecode, bytes)` parts into one block, each 8 byte aligned.
+
+    The handle of the block is kept in `_held` until the parent attaches it.
+    """
+    layout = {}
+    size = 0
+    for name, typecode, data in parts:
+        start = -(-size // _ALIGN) * _ALIGN
+        size = start + len(data)
+        layout[name] = (typecode, start, size)
+    if shared_memory is None:
+        payload = bytearray(size)
+        for name, _, data in parts:
+            _, start, end = layout[name]
+            payload[start:end] = data
+        return SharedBlock(None, layout, bytes(payload))
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for name, _, data in parts:
+            _, start, end = layout[name]
+            cast(memoryview, shm.buf)[start:end] = data
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    _held[shm.name] = (task, shm)
+    return SharedBlock(shm.name, layout)
+
+
+def _release(name: str) -> None:
+    """Close this process's handle of the block `name`, if it made it."""
+    _, shm = _held.pop(name, (None, None))
+    if shm is not None:
+        shm.close()
+
+
+def _init_worker(attached: Any) -> None:
+    global _attached
+    _attached = attached
+
+
+def _parse_task(task: int, file: str, columns: Optional[List[str]]) -> SaveRecord:
+    """Run `parse_record` in a worker of `iter_batch`, as its `task`th file."""
+    count = _attached.value
+    for name, (n, _) in list(_held.items()):
+        if n is not None and n < count:
+            _release(name)
+    return parse_record(file, columns, task)
+
+
+def parse_record(
+    file: str, columns: Optional[List[str]] = None, task: Optional[int] = None
+) -> SaveRecord:
+    """Parse `file` into a `SaveRecord`, run in the workers of `iter_batch`.
+
+    Args:
+        file (str): Save to parse.
+        columns (List[str] | None): Plot fields to decode, all of
+            `plot_index.PLOT_FIELDS` by default. An empty list skips the plots.
+        task (int | None): Position of `file` in the batch of `iter_batch`.
+            The block stays open in this process until the parent has
+            attached it, or until `BatchResult.close` if None.
+
+    Raises:
+        NotASaveFile: If `file` can't be parsed.
+        ValueError: If the plot records can't be walked.
+    """
+    save = SaveFile(file)
+    data = save._read()
+    settings, game_state, players = save.settings, save.game_state, save.players
+    parts = [(DATA, "B", data)]
+    names = list(PLOT_FIELDS) if columns is None else columns
+    if names:
+        index = save.plot_index
+        parts.append((OFFSETS, index.offsets.typecode, index.offsets.tobytes()))
+        decoded = decode_columns(data, index.offsets[:-1], names)
+        for name, column in decoded.items():
+            parts.append((name, column.typecode, column.tobytes()))
+    return SaveRecord(file, settings, game_state, players, _build_block(parts, task))
+
+
+def _unlink(block: SharedBlock) -> None:
+    if block.name is not None:
+        shm = shared_memory.SharedMemory(name=block.name)
+        shm.close()
+        shm.unlink()
+        _release(block.name)
+
+
+class BatchResult:
+    """A parsed save whose buffers live in shared memory.
+
+    Close it (or use it as a context manager) to free the block. Views taken
+    from `data`, `plot_offsets` or `columns` must be released, or copied with
+    `array(typecode, view)`, before then.
+    """
+
+    def __init__(self, record: SaveRecord) -> None:  # noqa: D107
+        self.file = record.file
+        self.settings = record.settings
+        self.game_state = record.game_state
+        self.players = record.players
+        self._block = record.block
+        self._shm: Any = None
+        if record.block.name is not None:
+            self._shm = shared_memory.SharedMemory(name=record.block.name)
+            self._buf = cast(memoryview, self._shm.buf)
+        else:
+            self._buf = memoryview(cast(bytes, record.block.payload))
+        self._views: Dict[str, memoryview] = {}
+        for name, (typecode, start, end) in record.block.layout.items():
+            view = self._buf[start:end]
+            if typecode != "B":
+                view = view.cast(typecode)  # type: ignore
+            self._views[name] = view
+
+    @property
+    def data(self) -> memoryview:
+        """The decompressed save."""
+        return self._views[DATA]
+
+    @property
+    def plot_offsets(self) -> Optional[memoryview]:
+        """`PlotIndex.offsets` of the save, None if plots weren't decoded."""
+        return self._views.get(OFFSETS)
+
+    @property
+    def columns(self) -> Dict[str, memoryview]:
+        """Raw values of each decoded plot field, see `PlotIndex.column`."""
+        return {
+            name: view
+            for name, view in self._views.items()
+            if name not in (DATA, OFFSETS)
+        }
+
+    def column(self, name: str) -> array:
+        """Return a copy of the plot field `name` that outlives `close`."""
+        view = self._views[name]
+        return array(view.format, view)
+
+    def close(self) -> None:
+        """Release the views and free the shared memory block."""
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        self._buf.release()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            _release(self._shm.name)
+            self._shm = None
+
+    def __enter__(self) -> "BatchResult":  # noqa: D105
+        return self
+
+    def __exit__(self, *exc: Any) -> None:  # noqa: D105
+        self.close()
+
+
+def iter_batch(
+    files: Iterable[Union[str, Path]],
+    workers: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+    skip_invalid: bool = False,
+    mp_context: Optional[BaseContext] = None,
+) -> Iterator[BatchResult]:
+    """Parse `files` in a process pool, yielding the results in order.
+
+    At most `WINDOW_PER_WORKER` saves per worker are parsed ahead of the
+    consumer, so the shared memory in use stays bounded however many files
+    there are, besides the results still open.
+
+    Args:
+        files (Iterable[str | Path]): Saves to parse.
+        workers (int | None): Number of processes. Defaults to one per CPU.
+        columns (List[str] | None): See `parse_record`.
+        skip_invalid (bool): Skip files that can't be parsed instead of
+            raising. Defaults to False.
+        mp_context (BaseContext | None): Context the workers are started
+            with, the default context of `multiprocessing` if None.
+
+    Raises:
+        NotASaveFile: If a file can't be parsed, unless `skip_invalid`.
+        ValueError: If the plots of a file can't be walked, unless
+            `skip_invalid`.
+    """
+    if shared_memory is not None and os.name == "posix":
+        # workers forked before the tracker runs would each start their own,
+        # which unlinks the blocks they created when they exit
+        resource_tracker.ensure_running()
+    workers = workers or os.cpu_count() or 1
+    window = WINDOW_PER_WORKER * workers
+    ctx = mp_context or multiprocessing.get_context()
+    # results are attached in order, the workers keep the handles of the blocks
+    # of results past this count open
+    attached = ctx.Value("q", 0, lock=False)
+    tasks = enumerate(files)
+    with ProcessPoolExecutor(
+        workers, ctx, initializer=_init_worker, initargs=(attached,)
+    ) as pool:
+        pending: Deque[Future] = deque()
+
+        def fill() -> None:
+            for n, file in itertools.islice(tasks, window - len(pending)):
+                pending.append(pool.submit(_parse_task, n, str(file), columns))
+
+        done = 0
+        try:
+            fill()
+            while pending:
+                future = pending.popleft()
+                done += 1
+                try:
+                    record = future.result()
+                except (NotASaveFile, ValueError):
+                    attached.value = done
+                    if skip_invalid:
+                        fill()
+                        continue
+                    raise
+                result = BatchResult(record)
+                attached.value = done
+                fill()
+                yield result
+        finally:
+            # free the blocks of results that were never handed out
+            for future in pending:
+                if not future.cancel():
+                    try:
+                        _unlink(future.result().block)
+                    except Exception:
+                        pass
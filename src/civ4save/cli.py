@@ -6,6 +6,13 @@ Commands:
     leaders: List on or all of the Leaders found in the XML files.
     civs: List one or all of the Civilizations found in the XML files.
     xml: Generate python code or JSON from XML files.
+    archive: Store a game's saves as per-turn deltas.
+    export: Write saves as partitioned Parquet or Arrow datasets.
+    ingest: Load saves into a SQLite database.
+    index: Record the payload hash of every save in a directory.
+    diff: Show what changed between two saves of a game.
+    watch: Parse new autosaves as they're written.
+    serve: Answer queries about saves over HTTP.
 
 Examples:
 ```
@@ -14,25 +21,65 @@ $ civ4save gamefiles
 $ civ4save leaders Shaka
 $ civ4save civs Germany
 $ civ4save xml --text-map --lang Spanish
+$ civ4save archive add game.c4a single/auto/*.CivBeyondSwordSave
+$ civ4save export --format parquet dataset/ single/auto/*.CivBeyondSwordSave
+$ civ4save ingest saves.db single/auto/*.CivBeyondSwordSave
+$ civ4save index uploads/
+$ civ4save ingest --index uploads/.civ4save-index.db saves.db uploads/*
+$ civ4save diff Rome-turn100.CivBeyondSwordSave Rome-turn101.CivBeyondSwordSave
+$ civ4save watch --port 4000
+$ civ4save serve --port 8000 single/
 ```
 """
 
 import json
-from functools import partial
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Callable, List, Tuple
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
 import click
 from rich import print
 
-from . import __version__, utils
+from . import __version__, columnar, export, utils
+from .archive import Archive, ArchiveError
 from .contrib.civs import get_civ, get_civs
 from .contrib.leaders import get_leader, leader_attributes, rank_leaders
+from .corpus import INDEX_NAME as CORPUS_INDEX_NAME
+from .corpus import CorpusIndex
+from .database import Database
 from .save_file import SaveFile
+from .server import SaveServer
+from .watch import SocketPublisher, Watcher, stream_publisher
 from .xml_files import make_enums as write_enums
 
 TEXT_MAP_LANGS = ["English", "French", "German", "Italian", "Spanish"]
 
+index_option = click.option(
+    "--index",
+    "index_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Corpus index (see `civ4save index`) to skip duplicate saves and saves "
+    "this command already processed",
+)
+
+
+@contextmanager
+def _corpus(
+    index_file: Optional[Path], command: str, files: Tuple[Path, ...]
+) -> Iterator[Tuple[List[Path], Callable[[Path], None]]]:
+    """Yield the files to process and a function marking one as processed."""
+    if index_file is None:
+        yield list(files), lambda file: None
+        return
+    with CorpusIndex(index_file) as index:
+        process, skipped = index.select(files, command)
+        if skipped:
+            print(f"Skipping {len(skipped)} duplicate or already processed saves")
+        yield process, lambda file: index.mark_processed(command, file)
+
 
 @click.group()
 @click.version_option(__version__)
@@ -68,6 +115,13 @@ def cli() -> None:  # noqa: D103
     default=False,
     help="List all player (idx, name, leader, civ) in the game",
 )
+@click.option(
+    "--plots",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Every plot on the map. With --json streamed as an array, one per line",
+)
 @click.option(
     "--json",
     "json_",
@@ -76,28 +130,65 @@ def cli() -> None:  # noqa: D103
     default=False,
     help="Format output as JSON. Default is text",
 )
+@click.option(
+    "--ndjson",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Format output as newline delimited JSON, one plot or player per line",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Load everything and report the time and memory of each stage to stderr",
+)
 @click.argument("file", type=click.Path(exists=True, path_type=Path))
 def parse(
     settings: bool,
     spoilers: bool,
     player: int,
     list_players: bool,
+    plots: bool,
     json_: bool,
+    ndjson: bool,
+    profile: bool,
     file: Path,
 ) -> None:
     """Parse a .CivBeyondSwordSave file.
 
     FILE is a save file or directory of save files
     """
-    save = SaveFile(file=file)
-    print(save)
+    save = SaveFile(file=file, profile=profile)
+    if save.profile is not None:
+        # load every section and object up front so the report covers them all
+        save.raw, save.settings, save.game_state, save.players, save.plots
+        report = save.profile
+        click.get_current_context().call_on_close(
+            lambda: click.echo(
+                export.dumps(report) if json_ or ndjson else report.format(), err=True
+            )
+        )
 
-    print_fn = print
-    if json_:
-        # call json.dumps on the arg before calling print
-        j = partial(json.dumps, indent=4, cls=utils.CustomJsonEncoder)
-        print_fn = partial(print, j)
+    print_fn: Callable[[Any], None] = print
+    if ndjson:
+        print_fn = _echo_ndjson
+    elif json_:
+        print_fn = _echo_json
+    else:
+        print(save)
 
+    if plots:
+        # Plots are decoded one at a time so memory use doesn't grow with map size
+        if ndjson:
+            export.dump_lines(save.iter_plots(), sys.stdout)
+        elif json_:
+            export.dump_array(save.iter_plots(), sys.stdout)
+        else:
+            for plot in save.iter_plots():
+                print(plot)
+        return
     if spoilers:
         print_fn(save.game_state)
         return
@@ -105,12 +196,25 @@ def parse(
         print_fn(save.get_player(player))
         return
     if list_players:
+        if ndjson:
+            export.dump_lines(save.players.values(), sys.stdout)
+            return
         print_fn(save.players)
         return
     print_fn(save.settings)
     return
 
 
+def _echo_json(obj: Any) -> None:
+    """Print `obj` as JSON, without rich markup so it can be piped."""
+    click.echo(export.dumps(obj, indent=4))
+
+
+def _echo_ndjson(obj: Any) -> None:
+    """Print `obj` as JSON on a single line."""
+    click.echo(export.dumps(obj))
+
+
 @cli.command(help="Find and print relevant game files paths.")
 def gamefiles() -> None:
     """Print commonly used Civ4 file paths to `stdout`."""
@@ -230,5 +334,317 @@ def civs(civ_name: str, list_: bool) -> None:
     print(civ)
 
 
+@cli.group()
+def archive() -> None:
+    """Store the saves of a game as per-turn deltas."""
+    pass
+
+
+@archive.command("add")
+@click.option(
+    "--keyframe-interval",
+    type=int,
+    default=16,
+    show_default=True,
+    help="Store every nth turn in full. Only used for a new archive",
+)
+@index_option
+@click.argument("archive_file", type=click.Path(path_type=Path))
+@click.argument(
+    "files", nargs=-1, required=True, type=click.Path(exists=True, path_type=Path)
+)
+def archive_add(
+    archive_file: Path,
+    files: Tuple[Path],
+    keyframe_interval: int,
+    index_file: Optional[Path],
+) -> None:
+    """Add saves to ARCHIVE_FILE, creating it if needed.
+
+    FILES are saves from the same game
+    """
+    arc = Archive(archive_file, keyframe_interval)
+    with _corpus(index_file, f"archive:{archive_file.resolve()}", files) as (
+        todo,
+        processed,
+    ):
+        try:
+            added = arc.add(todo)
+        except ArchiveError as ex:
+            raise click.ClickException(str(ex))
+        for file in todo:
+            processed(file)
+    print(f"Added {len(added)} turns, {len(arc)} turns archived")
+
+
+@archive.command("turns")
+@click.argument("archive_file", type=click.Path(exists=True, path_type=Path))
+def archive_turns(archive_file: Path) -> None:
+    """List the turns in ARCHIVE_FILE."""
+    arc = Archive(archive_file)
+    for turn in arc.turns:
+        print(f"{turn:4} {arc.files[turn]}")
+
+
+@archive.command("show")
+@click.option(
+    "--json",
+    "json_",
+    is_flag=True,
+    default=False,
+    help="Dump the players and plot columns as JSON",
+)
+@click.argument("archive_file", type=click.Path(exists=True, path_type=Path))
+@click.argument("turn", type=int)
+def archive_show(archive_file: Path, turn: int, json_: bool) -> None:
+    """Show the player stats of TURN from ARCHIVE_FILE."""
+    try:
+        state = Archive(archive_file).turn(turn)
+    except KeyError as ex:
+        raise click.ClickException(str(ex))
+    if json_:
+        dump = dict(turn=state.turn, players=state.players, plots=state.plots)
+        click.echo(json.dumps(dump))
+        return
+    print(state.players)
+
+
+@cli.command("export")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(list(columnar.FORMATS)),
+    default="parquet",
+    show_default=True,
+    help="File format of the tables",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Processes decoding the plots of big maps, shared by all the saves",
+)
+@index_option
+@click.argument("out_dir", type=click.Path(file_okay=False, path_type=Path))
+@click.argument(
+    "files", nargs=-1, required=True, type=click.Path(exists=True, path_type=Path)
+)
+def export_(
+    out_dir: Path,
+    files: Tuple[Path],
+    fmt: str,
+    workers: int,
+    index_file: Optional[Path],
+) -> None:
+    """Export the plots, players, deals and replay messages of FILES.
+
+    Each table is written to OUT_DIR/<table>/game=<game>/turn=<turn>/
+    """
+    command = f"export:{fmt}:{out_dir.resolve()}"
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    with _corpus(index_file, command, files) as (todo, processed), (
+        pool or nullcontext()
+    ):
+        for file in todo:
+            save = SaveFile(file, workers=workers, pool=pool)
+            try:
+                columnar.export_save(save, out_dir, fmt)
+            except ImportError as ex:
+                raise click.ClickException(str(ex))
+            processed(file)
+            print(f"Exported {file}")
+
+
+@cli.command()
+@index_option
+@click.argument("db", type=click.Path(dir_okay=False, path_type=Path))
+@click.argument(
+    "saves", nargs=-1, required=True, type=click.Path(exists=True, path_type=Path)
+)
+def ingest(db: Path, saves: Tuple[Path], index_file: Optional[Path]) -> None:
+    """Load SAVES into the SQLite database DB, creating it if needed.
+
+    Saves that are already in DB (same file contents) are skipped, files that
+    can't be parsed are reported at the end
+    """
+    with _corpus(index_file, f"ingest:{db.resolve()}", saves) as (todo, processed):
+        with Database(db) as database:
+            ingested, skipped, failed = database.ingest_many(todo)
+        for file in todo:
+            if Path(file) not in failed:
+                processed(file)
+    print(
+        f"Ingested {len(ingested)} saves, "
+        f"skipped {len(skipped) + len(saves) - len(todo)}, failed {len(failed)}"
+    )
+    for file in failed:
+        print(f"  not a save: {file}")
+
+
+@cli.command()
+@click.option(
+    "--index",
+    "index_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Index file. Defaults to DIRECTORY/.civ4save-index.db",
+)
+@click.option(
+    "--duplicates",
+    "show_duplicates",
+    is_flag=True,
+    default=False,
+    help="List the files of each duplicated payload",
+)
+@click.argument(
+    "directory", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+def index(directory: Path, index_file: Optional[Path], show_duplicates: bool) -> None:
+    """Record the payload hash of every save under DIRECTORY.
+
+    The size and mtime of each file are recorded too, only new or changed
+    files are read again. Pass the index to ingest, export
+    or archive add with --index to skip duplicates and saves already processed
+    """
+    if index_file is None:
+        index_file = directory / CORPUS_INDEX_NAME
+    with CorpusIndex(index_file) as corpus:
+        result = corpus.scan(directory)
+        print(
+            f"Indexed {len(result.entries)} files: {result.hashed} read, "
+            f"{len(result.entries) - result.hashed} unchanged, "
+            f"{result.duplicates} duplicates, {result.invalid} not saves, "
+            f"{result.removed} removed"
+        )
+        if show_duplicates:
+            for hash_, paths in corpus.duplicates().items():
+                print(hash_)
+                for path in paths:
+                    print(f"  {path}")
+
+
+@cli.command()
+@click.option(
+    "--json",
+    "json_",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Format output as JSON. Default is text",
+)
+@click.option(
+    "--use-index/--no-use-index",
+    show_default=True,
+    default=True,
+    help="Read OLD's plot offsets from its sidecar index, and write NEW's so "
+    "diffing the next save against it is as quick",
+)
+@click.argument("old", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def diff(old: Path, new: Path, json_: bool, use_index: bool) -> None:
+    """Show the plots, players and replay events that changed from OLD to NEW.
+
+    OLD and NEW are saves of the same game, usually consecutive autosaves
+    """
+    try:
+        changes = SaveFile(old, use_index=use_index).diff(
+            SaveFile(new, use_index=use_index)
+        )
+    except ValueError as ex:
+        raise click.ClickException(str(ex))
+    if json_:
+        _echo_json(changes)
+        return
+    click.echo(changes.format())
+
+
+@cli.command()
+@click.option(
+    "--interval",
+    type=float,
+    default=0.25,
+    show_default=True,
+    help="Seconds between polls of DIRECTORY",
+)
+@click.option(
+    "--existing",
+    is_flag=True,
+    default=False,
+    help="Also parse the saves already in DIRECTORY",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=None,
+    help="Publish to clients of this localhost TCP port instead of stdout",
+)
+@click.argument(
+    "directory",
+    required=False,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+def watch(directory: Path, interval: float, existing: bool, port: int) -> None:
+    """Parse each new save in DIRECTORY and publish it as NDJSON.
+
+    DIRECTORY defaults to the single player autosaves folder. Each line has the
+    settings, game state and players of a save and the plots that changed
+    since the previous save
+    """
+    if directory is None:
+        try:
+            directory = utils.get_saves_dir() / "auto"
+        except FileNotFoundError as ex:
+            raise click.ClickException(str(ex))
+    if port is None:
+        publish = stream_publisher(sys.stdout)
+    else:
+        publish = SocketPublisher(port=port)
+        click.echo(f"Publishing to {publish.address[0]}:{publish.address[1]}", err=True)
+    try:
+        for event in Watcher(directory, interval, existing):
+            publish(event)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8000, show_default=True)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=16,
+    show_default=True,
+    help="Number of parsed saves kept in memory",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes parsing saves. Defaults to one per CPU",
+)
+@click.argument(
+    "directory",
+    required=False,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+def serve(directory: Path, host: str, port: int, cache_size: int, workers: int) -> None:
+    """Serve JSON queries about the saves in DIRECTORY over HTTP.
+
+    DIRECTORY defaults to the single player saves folder. Endpoints are
+    /saves and /saves/NAME/{settings,game_state,players,players/IDX,plots},
+    plots takes an x0, y0, x1, y1 bounding box
+    """
+    if directory is None:
+        try:
+            directory = utils.get_saves_dir()
+        except FileNotFoundError as ex:
+            raise click.ClickException(str(ex))
+    server = SaveServer(directory, cache_size, ProcessPoolExecutor(workers))
+    click.echo(f"Serving {directory} on http://{host}:{port}/saves", err=True)
+    server.serve_forever(host, port)
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,211 @@
+"""Export saves as Apache Arrow tables, written as Parquet or Arrow IPC files.
+
+Plot columns are handed to Arrow straight from `PlotIndex.column` and replay
+messages are read with `struct` (`vanilla.replay`), so no Python object is
+created per plot and no construct `Container` per message. Tables are written
+to hive style partitions, `DIR/<table>/game=<game key>/turn=<turn>/part-0.<ext>`,
+so exporting many saves builds up one dataset per table that can be queried
+without reparsing.
+
+Requires the optional `pyarrow` dependency, `pip install civ4save[parquet]`.
+"""
+from array import array
+from enum import EnumMeta
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from .archive import game_key, player_stats
+from .save_file import SaveFile
+from .vanilla import enums as e
+from .vanilla.replay import read_replay_messages
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+TABLES = ("plots", "players", "deals", "replay_messages")
+
+PLOT_COLUMNS: Dict[str, Any] = {
+    "x": None,
+    "y": None,
+    "area_id": None,
+    "owner": None,
+    "plot_type": e.PlotType,
+    "terrain_type": e.TerrainType,
+    "feature_type": e.FeatureType,
+    "bonus_type": e.BonusType,
+    "improvement_type": e.ImprovementType,
+    "route_type": None,
+    "hills": bool,
+    "irrigated": bool,
+    "starting_plot": bool,
+    "ownership_duration": None,
+    "improvement_duration": None,
+    "plot_city_owner": None,
+    "working_city_owner": None,
+}
+"""Exported `CvPlot` fields, with the Enum to name them or bool"""
+YIELDS = ("food", "production", "commerce")
+
+
+def _pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow is needed for Arrow/Parquet export: pip install civ4save[parquet]"
+        )
+    return pyarrow
+
+
+_ARROW_TYPES = {"b": "int8", "h": "int16", "H": "uint16", "i": "int32", "I": "uint32"}
+
+
+def _from_array(values: array) -> Any:
+    """Wrap an `array.array` as an Arrow array without copying."""
+    pa = _pyarrow()
+    typ = getattr(pa, _ARROW_TYPES[values.typecode])()
+    return pa.Array.from_buffers(typ, len(values), [None, pa.py_buffer(values)])
+
+
+def _enum_array(values: array, enum: EnumMeta) -> Any:
+    """Dictionary encode enum values as their names.
+
+    Falls back to the plain integers if a value isn't a member of `enum`.
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    ints = _from_array(values)
+    members = sorted(enum, key=lambda m: m.value)  # type: ignore
+    low = members[0].value
+    if [m.value for m in members] != list(range(low, low + len(members))):
+        return ints
+    indices = pc.subtract(ints.cast(pa.int32()), low)
+    if len(values) and (
+        pc.min(indices).as_py() < 0 or pc.max(indices).as_py() >= len(members)
+    ):
+        return ints
+    dictionary = pa.array([m.name for m in members])
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+def plot_table(save: SaveFile) -> Any:
+    """Return the plot grid, one row per plot in map order."""
+    pa = _pyarrow()
+    raw = save.plot_columns(*PLOT_COLUMNS, "yields")
+    columns = {}
+    for name, kind in PLOT_COLUMNS.items():
+        values = raw[name]
+        if kind is bool:
+            columns[name] = _from_array(values).cast(pa.bool_())
+        elif kind is not None:
+            columns[name] = _enum_array(values, kind)
+        else:
+            columns[name] = _from_array(values)
+    yields = raw["yields"]
+    for n, name in enumerate(YIELDS):
+        columns[f"yield_{name}"] = _from_array(yields[n :: len(YIELDS)])
+    return pa.table(columns)
+
+
+def player_table(save: SaveFile) -> Any:
+    """Return the stats of every player, see `archive.player_stats`."""
+    pa = _pyarrow()
+    rows = [dict(idx=idx, **player_stats(p)) for idx, p in save.players.items()]
+    return pa.Table.from_pylist(rows)
+
+
+def deal_table(save: SaveFile) -> Any:
+    """Return one row per item traded in an active deal."""
+    pa = _pyarrow()
+    columns: Dict[str, List[Any]] = {
+        k: []
+        for k in (
+            "deal",
+            "first_player",
+            "second_player",
+            "initial_game_turn",
+            "from_player",
+            "item",
+            "amount",
+        )
+    }
+    for n, deal in enumerate(save._prefix.deals):
+        for side, player in (("first", "first_player"), ("second", "second_player")):
+            for trade in deal[f"{side}_trades"]:
+                columns["deal"].append(n)
+                columns["first_player"].append(deal["first_player"])
+                columns["second_player"].append(deal["second_player"])
+                columns["initial_game_turn"].append(deal["initial_game_turn"])
+                columns["from_player"].append(deal[player])
+                columns["item"].append(trade["item"].name)
+                columns["amount"].append(trade["amount"])
+    schema = pa.schema(
+        [
+            ("deal", pa.int32()),
+            ("first_player", pa.int32()),
+            ("second_player", pa.int32()),
+            ("initial_game_turn", pa.int32()),
+            ("from_player", pa.int32()),
+            ("item", pa.string()),
+            ("amount", pa.int32()),
+        ]
+    )
+    return pa.table(columns, schema=schema)
+
+
+def replay_table(save: SaveFile) -> Any:
+    """Return the replay messages, read straight from the decompressed save."""
+    pa = _pyarrow()
+    # the plots needn't be walked to find the section
+    pos = save._prefix._replay_messages_offset
+    messages, _ = read_replay_messages(save._read(), pos)
+    names = ("turn", "type", "plot_x", "plot_y", "player", "text", "color")
+    columns = dict(zip(names, zip(*messages)))
+    ints = {k: array("i", columns.get(k, ())) for k in names[:5]}
+    texts = list(columns.get("text", ()))
+    colors = array("i", columns.get("color", ()))
+    return pa.table(
+        {
+            "turn": _from_array(ints["turn"]),
+            "type": _enum_array(ints["type"], e.ReplayMessageType),
+            "plot_x": _from_array(ints["plot_x"]),
+            "plot_y": _from_array(ints["plot_y"]),
+            "player": _from_array(ints["player"]),
+            "text": pa.array(texts, pa.string()),
+            "color": _enum_array(colors, e.ColorValsType),
+        }
+    )
+
+
+def export_save(
+    save: SaveFile, out_dir: Union[str, Path], fmt: str = "parquet"
+) -> Dict[str, Path]:
+    """Write every table of `save` into its game/turn partition of `out_dir`.
+
+    Exporting the same save again overwrites its partition, so a dataset can
+    be extended with new saves at any time.
+
+    Returns:
+        Dict[str, Path]: The file written for each table.
+    """
+    _pyarrow()
+    from pyarrow import feather, parquet
+
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt}, expected one of {list(FORMATS)}")
+    tables = {
+        "plots": plot_table(save),
+        "players": player_table(save),
+        "deals": deal_table(save),
+        "replay_messages": replay_table(save),
+    }
+    partition = Path(f"game={game_key(save)}", f"turn={save.current_turn}")
+    written = {}
+    for name, table in tables.items():
+        path = Path(out_dir, name, partition, f"part-0{FORMATS[fmt]}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if fmt == "parquet":
+            parquet.write_table(table, path)
+        else:
+            feather.write_feather(table, path)
+        written[name] = path
+    return written
@@ -0,0 +1,300 @@
+"""Persistent index of a directory of saves, to skip duplicates and unchanged files.
+
+Players upload the same save again and again, and autosaves get copied around,
+so a corpus is full of files with identical contents under different names.
+`CorpusIndex` records for each file its size, modification time, a hash of the
+compressed payload (the chunks found by the zlib header scan, without the
+uncompressed header and trailer) and a few probe fields from the uncompressed
+header. Files are read one at a time, and nothing is decompressed.
+
+A rescan only reads files whose size or modification time changed, the others
+keep their recorded hash. Batch commands (`civ4save ingest/export/archive add
+--index`) ask the index which of their files to process: the first file of
+each hash that the command hasn't processed yet.
+
+The index is SQLite, `.civ4save-index.db` in the scanned directory by default.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import attrs
+from construct import Container
+
+from .backends import get_backend
+from .save_file import _savefile_layout
+
+INDEX_NAME = ".civ4save-index.db"
+SCHEMA_VERSION = 1
+SAVE_GLOB = "*.CivBeyondSwordSave"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    version INTEGER,
+    turn INTEGER,
+    game_name TEXT,
+    map_script TEXT,
+    world_size TEXT,
+    game_speed TEXT,
+    players INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+
+CREATE TABLE IF NOT EXISTS processed (
+    command TEXT,
+    hash TEXT,
+    PRIMARY KEY (command, hash)
+);
+"""
+
+
+@attrs.define(slots=True)
+class Probe:
+    """Fields of the uncompressed header (`init_core`) of a save."""
+
+    version: int
+    turn: int
+    game_name: str
+    map_script: str
+    world_size: str
+    game_speed: str
+    players: int
+    """Number of player slots with a civ, the barbarians included"""
+
+
+@attrs.define(slots=True)
+class Entry:
+    """What the index knows about one file."""
+
+    path: str
+    """Absolute path of the file"""
+    size: int
+    mtime_ns: int
+    hash: Optional[str]
+    """Hash of the compressed payload, None if the file isn't a save"""
+    probe: Optional[Probe]
+
+
+@attrs.define(slots=True)
+class ScanResult:
+    """What a scan of a directory did."""
+
+    entries: List[Entry] = attrs.field(factory=list)
+    """Every save file found, in path order"""
+    hashed: int = 0
+    """Files read because they were new or changed"""
+    removed: int = 0
+    """Entries dropped because their file is gone"""
+
+    @property
+    def invalid(self) -> int:
+        """Files that aren't saves."""
+        return sum(1 for e in self.entries if e.hash is None)
+
+    @property
+    def duplicates(self) -> int:
+        """Files with the same payload as an earlier file of `entries`."""
+        hashes = [e.hash for e in self.entries if e.hash is not None]
+        return len(hashes) - len(set(hashes))
+
+
+def payload_hash(contents: bytes) -> str:
+    """Return the hex BLAKE2b digest of the compressed chunks of a save file.
+
+    Raises:
+        NotASaveFile: If the contents have no compressed chunks.
+    """
+    z_start, trailer = _savefile_layout(contents)
+    view = memoryview(contents)
+    return hashlib.blake2b(
+        view[z_start : len(view) - trailer], digest_size=16
+    ).hexdigest()
+
+
+def probe(contents: bytes) -> Probe:
+    """Return the `Probe` fields of a save file, parsing only its header.
+
+    Raises:
+        NotASaveFile: If the contents have no compressed chunks.
+        construct.ConstructError: If the header can't be parsed.
+    """
+    z_start, _ = _savefile_layout(contents)
+    header = contents[:z_start]
+    core = get_backend().parse_section(
+        header, "init_core", io.BytesIO(header), Container()
+    )
+    return Probe(
+        version=core.version,
+        turn=core.game_turn,
+        game_name=core.game_name,
+        map_script=core.map_script_name,
+        world_size=str(core.world_size),
+        game_speed=str(core.game_speed),
+        players=sum(1 for civ in core.civs if str(civ) != "NO_CIVILIZATION"),
+    )
+
+
+def _entry(row: Tuple[Any, ...]) -> Entry:
+    path, size, mtime_ns, hash_, *fields = row
+    return Entry(path, size, mtime_ns, hash_, None if hash_ is None else Probe(*fields))
+
+
+def _row(entry: Entry) -> Tuple[Any, ...]:
+    fields = attrs.astuple(entry.probe) if entry.probe else (None,) * 7
+    return (entry.path, entry.size, entry.mtime_ns, entry.hash, *fields)
+
+
+class CorpusIndex:
+    """SQLite index of save files by payload hash."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Open (or create) the index at `path`.
+
+        Raises:
+            sqlite3.DatabaseError: If `path` was made by a newer version.
+        """
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(path))
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(f"unsupported schema version {version}")
+        if version < SCHEMA_VERSION:
+            with self.conn:
+                self.conn.executescript(SCHEMA)
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @classmethod
+    def for_directory(cls, directory: Union[str, Path]) -> CorpusIndex:
+        """Open the default index of `directory`."""
+        return cls(Path(directory) / INDEX_NAME)
+
+    def __enter__(self) -> CorpusIndex:  # noqa: D105
+        return self
+
+    def __exit__(self, *exc: Any) -> None:  # noqa: D105
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.conn.close()
+
+    def get(self, file: Union[str, Path]) -> Optional[Entry]:
+        """Return the recorded entry of `file`, stale or not."""
+        cur = self.conn.execute(
+            "SELECT * FROM files WHERE path = ?", (str(Path(file).resolve()),)
+        )
+        row = cur.fetchone()
+        return None if row is None else _entry(row)
+
+    def _refresh(self, file: Union[str, Path]) -> Tuple[Entry, bool]:
+        """Return the entry of `file`, and whether it had to be read."""
+        path = str(Path(file).resolve())
+        stat = os.stat(path)
+        size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        entry = self.get(path)
+        if entry is not None and (entry.size, entry.mtime_ns) == (size, mtime_ns):
+            return entry, False
+        contents = Path(path).read_bytes()
+        try:
+            entry = Entry(path, size, mtime_ns, payload_hash(contents), probe(contents))
+        except Exception:
+            # recorded too, so an unchanged invalid file isn't read again
+            entry = Entry(path, size, mtime_ns, None, None)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _row(entry),
+        )
+        return entry, True
+
+    def update(self, files: Iterable[Union[str, Path]]) -> Iterator[Tuple[Entry, bool]]:
+        """Yield the up to date entry of each file, and whether it was read."""
+        try:
+            for file in files:
+                yield self._refresh(file)
+        finally:
+            self.conn.commit()
+
+    def scan(self, directory: Union[str, Path], pattern: str = SAVE_GLOB) -> ScanResult:
+        """Index every file matching `pattern` under `directory`, recursively.
+
+        Entries of files that are gone are dropped.
+        """
+        root = Path(directory).resolve()
+        result = ScanResult()
+        for entry, read in self.update(sorted(root.rglob(pattern))):
+            result.entries.append(entry)
+            result.hashed += read
+        found = {e.path for e in result.entries}
+        prefix = os.path.join(str(root), "")
+        gone = [
+            (path,)
+            for (path,) in self.conn.execute("SELECT path FROM files")
+            if path.startswith(prefix) and path not in found
+        ]
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", gone)
+        result.removed = len(gone)
+        return result
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """Return the paths of every hash recorded for more than one file."""
+        groups: Dict[str, List[str]] = {}
+        cur = self.conn.execute(
+            "SELECT hash, path FROM files WHERE hash IN "
+            "(SELECT hash FROM files GROUP BY hash HAVING count(*) > 1) "
+            "ORDER BY hash, path"
+        )
+        for hash_, path in cur:
+            groups.setdefault(hash_, []).append(path)
+        return groups
+
+    def select(
+        self, files: Iterable[Union[str, Path]], command: Optional[str] = None
+    ) -> Tuple[List[Path], List[Path]]:
+        """Split `files` into the ones to process and the ones to skip.
+
+        A file is skipped if an earlier file of `files` has the same payload,
+        or `command` already processed that payload (see `mark_processed`).
+        Files that aren't saves are kept, for the command to report.
+
+        Returns:
+            Tuple[List[Path], List[Path]]: The (process, skip) files.
+        """
+        files = list(files)
+        done = set()
+        if command is not None:
+            cur = self.conn.execute(
+                "SELECT hash FROM processed WHERE command = ?", (command,)
+            )
+            done = {hash_ for (hash_,) in cur}
+        process, skip = [], []
+        # consumed in full, so update commits before this returns
+        entries = list(self.update(files))
+        for file, (entry, _) in zip(files, entries):
+            if entry.hash is None:
+                process.append(Path(file))
+            elif entry.hash in done:
+                skip.append(Path(file))
+            else:
+                done.add(entry.hash)
+                process.append(Path(file))
+        return process, skip
+
+    def mark_processed(self, command: str, file: Union[str, Path]) -> None:
+        """Record that `command` processed the payload of `file`."""
+        entry = self.get(file)
+        if entry is not None and entry.hash is not None:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO processed VALUES (?, ?)",
+                    (command, entry.hash),
+                )
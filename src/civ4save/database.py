@@ -0,0 +1,405 @@
+"""Load saves into a normalised SQLite database.
+
+Each save is one row of `saves`, keyed by the SHA-1 of the file so a corpus can
+be ingested again and only new files are parsed. Everything else references
+`saves.id`: `settings`, `game_options`, `victories`, `game_state`, `players`,
+`cities`, `trade_deals`, `trades` and `plots`. Enums are stored by name, except
+in `plots` where they're stored by value to keep the table small, the `enums`
+table maps them back to names.
+
+All the games where Mehmed won on Epic:
+```
+SELECT DISTINCT saves.game
+FROM saves
+JOIN settings ON settings.save_id = saves.id
+JOIN game_state ON game_state.save_id = saves.id
+JOIN players ON players.save_id = saves.id AND players.idx = game_state.winner
+WHERE players.leader = 'LEADER_MEHMED' AND settings.game_speed = 'GAMESPEED_EPIC'
+```
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from enum import Enum
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .archive import game_key
+from .save_file import NotASaveFile, SaveFile
+from .vanilla import enums as e
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saves (
+    id INTEGER PRIMARY KEY,
+    sha1 TEXT NOT NULL UNIQUE,
+    file TEXT NOT NULL,
+    game TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS saves_game ON saves (game, turn);
+
+CREATE TABLE IF NOT EXISTS settings (
+    save_id INTEGER PRIMARY KEY REFERENCES saves (id) ON DELETE CASCADE,
+    game_type TEXT,
+    game_name TEXT,
+    map_script TEXT,
+    world_size TEXT,
+    climate TEXT,
+    sea_level TEXT,
+    start_era TEXT,
+    game_speed TEXT,
+    max_turns INTEGER,
+    advanced_start_points INTEGER,
+    num_civs INTEGER,
+    start_turn INTEGER,
+    start_year INTEGER,
+    handicap TEXT,
+    map_random_seed INTEGER,
+    soren_random_seed INTEGER,
+    culture_victory_cities INTEGER,
+    culture_victory_level TEXT,
+    grid_width INTEGER,
+    grid_height INTEGER,
+    wrap_x INTEGER,
+    wrap_y INTEGER
+);
+CREATE INDEX IF NOT EXISTS settings_game_speed ON settings (game_speed, handicap);
+
+CREATE TABLE IF NOT EXISTS game_options (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    option TEXT,
+    enabled INTEGER,
+    PRIMARY KEY (save_id, option)
+);
+
+CREATE TABLE IF NOT EXISTS victories (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    victory TEXT,
+    enabled INTEGER,
+    PRIMARY KEY (save_id, victory)
+);
+
+CREATE TABLE IF NOT EXISTS game_state (
+    save_id INTEGER PRIMARY KEY REFERENCES saves (id) ON DELETE CASCADE,
+    total_cities INTEGER,
+    total_population INTEGER,
+    nukes_exploded INTEGER,
+    circumnavigated INTEGER,
+    nukes_buildable INTEGER,
+    best_land_unit TEXT,
+    winner INTEGER,
+    victory TEXT,
+    state TEXT,
+    land_plots INTEGER,
+    owned_plots INTEGER
+);
+CREATE INDEX IF NOT EXISTS game_state_winner ON game_state (winner, victory);
+
+CREATE TABLE IF NOT EXISTS players (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    idx INTEGER,
+    name TEXT,
+    description TEXT,
+    short_desc TEXT,
+    adjective TEXT,
+    team INTEGER,
+    handicap TEXT,
+    leader TEXT,
+    civ TEXT,
+    score INTEGER,
+    rank INTEGER,
+    owned_plots INTEGER,
+    religion TEXT,
+    government TEXT,
+    legal TEXT,
+    labor TEXT,
+    economy TEXT,
+    religion_civic TEXT,
+    PRIMARY KEY (save_id, idx)
+);
+CREATE INDEX IF NOT EXISTS players_leader ON players (leader);
+CREATE INDEX IF NOT EXISTS players_civ ON players (civ);
+
+CREATE TABLE IF NOT EXISTS cities (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    player INTEGER,
+    name TEXT,
+    x INTEGER,
+    y INTEGER,
+    turn_founded INTEGER
+);
+CREATE INDEX IF NOT EXISTS cities_save ON cities (save_id, player);
+
+CREATE TABLE IF NOT EXISTS trade_deals (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    deal INTEGER,
+    first_player INTEGER,
+    second_player INTEGER,
+    initial_turn INTEGER,
+    PRIMARY KEY (save_id, deal)
+);
+
+CREATE TABLE IF NOT EXISTS trades (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    deal INTEGER,
+    from_player INTEGER,
+    item TEXT,
+    amount INTEGER
+);
+CREATE INDEX IF NOT EXISTS trades_save ON trades (save_id, deal);
+
+CREATE TABLE IF NOT EXISTS plots (
+    save_id INTEGER REFERENCES saves (id) ON DELETE CASCADE,
+    x INTEGER,
+    y INTEGER,
+    owner INTEGER,
+    plot_type INTEGER,
+    terrain_type INTEGER,
+    feature_type INTEGER,
+    bonus_type INTEGER,
+    improvement_type INTEGER,
+    route_type INTEGER,
+    hills INTEGER,
+    irrigated INTEGER,
+    food INTEGER,
+    production INTEGER,
+    commerce INTEGER,
+    PRIMARY KEY (save_id, x, y)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS enums (
+    type TEXT,
+    value INTEGER,
+    name TEXT,
+    PRIMARY KEY (type, value)
+) WITHOUT ROWID;
+"""
+
+SETTINGS_COLUMNS = (
+    "game_type",
+    "game_name",
+    "map_script",
+    "world_size",
+    "climate",
+    "sea_level",
+    "start_era",
+    "game_speed",
+    "max_turns",
+    "advanced_start_points",
+    "num_civs",
+    "start_turn",
+    "start_year",
+    "handicap",
+    "map_random_seed",
+    "soren_random_seed",
+    "culture_victory_cities",
+    "culture_victory_level",
+    "grid_width",
+    "grid_height",
+    "wrap_x",
+    "wrap_y",
+)
+GAME_STATE_COLUMNS = (
+    "total_cities",
+    "total_population",
+    "nukes_exploded",
+    "circumnavigated",
+    "nukes_buildable",
+    "best_land_unit",
+    "winner",
+    "victory",
+    "state",
+    "land_plots",
+    "owned_plots",
+)
+PLAYER_COLUMNS = (
+    "idx",
+    "name",
+    "desc",
+    "short_desc",
+    "adjective",
+    "team",
+    "handicap",
+    "leader",
+    "civ",
+    "score",
+    "rank",
+    "owned_plots",
+    "religion",
+)
+CIVIC_COLUMNS = ("government", "legal", "labor", "economy", "religion")
+PLOT_COLUMNS = (
+    "x",
+    "y",
+    "owner",
+    "plot_type",
+    "terrain_type",
+    "feature_type",
+    "bonus_type",
+    "improvement_type",
+    "route_type",
+    "hills",
+    "irrigated",
+)
+"""Columns of `PlotIndex.column` stored in `plots`, yields are split in three"""
+PLOT_ENUMS = (
+    e.PlotType,
+    e.TerrainType,
+    e.FeatureType,
+    e.BonusType,
+    e.ImprovementType,
+    e.RouteType,
+)
+
+
+def file_sha1(file: Union[str, Path]) -> str:
+    """Return the SHA-1 hex digest of the contents of `file`."""
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _value(val: Any) -> Any:
+    return val.name if isinstance(val, Enum) else val
+
+
+def _row(obj: Any, columns: Sequence[str]) -> List[Any]:
+    return [_value(getattr(obj, col)) for col in columns]
+
+
+def _insert(table: str, num_columns: int) -> str:
+    return f"INSERT INTO {table} VALUES ({', '.join('?' * num_columns)})"
+
+
+class Database:
+    """SQLite database of parsed saves."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Open (or create) the database at `path`.
+
+        Raises:
+            sqlite3.DatabaseError: If `path` was made by a newer version.
+        """
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(f"unsupported schema version {version}")
+        if version < SCHEMA_VERSION:
+            with self.conn:
+                self.conn.executescript(SCHEMA)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO enums VALUES (?, ?, ?)",
+                    [(en.__name__, m.value, m.name) for en in PLOT_ENUMS for m in en],
+                )
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def __enter__(self) -> Database:  # noqa: D105
+        return self
+
+    def __exit__(self, *exc: Any) -> None:  # noqa: D105
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.conn.close()
+
+    def has(self, sha1: str) -> bool:
+        """Whether the save with content hash `sha1` is already ingested."""
+        cur = self.conn.execute("SELECT 1 FROM saves WHERE sha1 = ?", (sha1,))
+        return cur.fetchone() is not None
+
+    def ingest(self, file: Union[str, Path]) -> Optional[int]:
+        """Load one save in a single transaction.
+
+        Returns:
+            Optional[int]: The new `saves.id`, `None` if the file was already
+                ingested.
+        """
+        sha1 = file_sha1(file)
+        if self.has(sha1):
+            return None
+        save = SaveFile(file)
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO saves (sha1, file, game, turn, version) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sha1, str(file), game_key(save), save.current_turn, save.version),
+            )
+            save_id = cur.lastrowid
+            assert save_id is not None
+            for table, rows in self._rows(save_id, save):
+                if rows:
+                    self.conn.executemany(_insert(table, len(rows[0])), rows)
+        return save_id
+
+    def ingest_many(
+        self, files: Iterable[Union[str, Path]]
+    ) -> Tuple[List[Path], List[Path], List[Path]]:
+        """Ingest `files`, carrying on past the ones that can't be parsed.
+
+        Returns:
+            Tuple[List[Path], List[Path], List[Path]]: The (ingested, skipped,
+                failed) files. Skipped files were already ingested, failed
+                ones aren't saves or their plots can't be walked.
+        """
+        ingested, skipped, failed = [], [], []
+        for file in files:
+            try:
+                save_id = self.ingest(file)
+            except (NotASaveFile, ValueError):
+                failed.append(Path(file))
+                continue
+            if save_id is None:
+                skipped.append(Path(file))
+            else:
+                ingested.append(Path(file))
+        return ingested, skipped, failed
+
+    def _rows(self, save_id: int, save: SaveFile) -> Iterable[Tuple[str, List]]:
+        """Yield the rows of each table for `save`."""
+        settings = save.settings
+        yield "settings", [[save_id, *_row(settings, SETTINGS_COLUMNS)]]
+        yield "game_options", [
+            [save_id, k, v] for k, v in settings.game_options.items()
+        ]
+        yield "victories", [[save_id, k, v] for k, v in settings.victories.items()]
+        yield "game_state", [[save_id, *_row(save.game_state, GAME_STATE_COLUMNS)]]
+
+        players = save.players.values()
+        yield "players", [
+            [save_id, *_row(p, PLAYER_COLUMNS), *_row(p.civics, CIVIC_COLUMNS)]
+            for p in players
+        ]
+        yield "cities", [
+            [save_id, p.idx, c.name, c.x, c.y, c.turn_founded]
+            for p in players
+            for c in p.cities
+        ]
+        deals = [d for p in players for d in p.trades]
+        yield "trade_deals", [
+            [save_id, n, d.first_player, d.second_player, d.initial_turn]
+            for n, d in enumerate(deals)
+        ]
+        yield "trades", [
+            [save_id, n, player, _value(t["item"]), t["amount"]]
+            for n, d in enumerate(deals)
+            for player, trades in (
+                (d.first_player, d.first_trades),
+                (d.second_player, d.second_trades),
+            )
+            for t in trades
+        ]
+
+        index = save.plot_index
+        columns = [index.column(col) for col in PLOT_COLUMNS]
+        yields = index.column("yields")
+        columns.extend(yields[n::3] for n in range(3))
+        yield "plots", [[save_id, *row] for row in zip(*columns)]
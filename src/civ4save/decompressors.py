@@ -0,0 +1,83 @@
+"""Interchangeable zlib implementations to decompress saves with.
+
+The compressed chunks of a save are one plain zlib stream, so any module with
+the `zlib.decompressobj` API inflates them to the same bytes. Decompressing is
+a fixed cost of every save read, which the accelerated implementations below
+roughly halve.
+
+Decompressors:
+    zlib: The standard library, always available.
+    isal: `isal.isal_zlib` from python-isal, `pip install civ4save[isal]`.
+    zlib-ng: `zlib_ng.zlib_ng` from python-zlib-ng, `pip install
+        civ4save[zlib-ng]`.
+
+The decompressor is picked by `SaveFile(file, decompressor=...)`, else the
+`CIV4SAVE_DECOMPRESSOR` environment variable, else `auto` (the first of isal,
+zlib-ng and zlib that is installed).
+"""
+import importlib
+import os
+from types import ModuleType
+from typing import Any, Dict, Iterable, Optional
+
+import attrs
+
+from .vanilla.plot_index import Buffer
+
+DECOMPRESSOR_ENV = "CIV4SAVE_DECOMPRESSOR"
+AUTO = "auto"
+
+# name -> module with the zlib API, the fastest first
+_MODULES = {"isal": "isal.isal_zlib", "zlib-ng": "zlib_ng.zlib_ng", "zlib": "zlib"}
+
+
+@attrs.define(slots=True)
+class Decompressor:
+    """A zlib compatible module."""
+
+    name: str
+    module: ModuleType
+
+    def decompressobj(self) -> Any:
+        """Return a new `zlib.Decompress` like object."""
+        return self.module.decompressobj()
+
+    def decompress(self, chunks: Iterable[Buffer]) -> bytes:
+        """Return the decompressed bytes of a zlib stream split in `chunks`."""
+        decompressor = self.module.decompressobj()
+        parts = [decompressor.decompress(chunk) for chunk in chunks]
+        parts.append(decompressor.flush())
+        return b"".join(parts)
+
+
+def _load(name: str) -> Optional[Decompressor]:
+    try:
+        return Decompressor(name, importlib.import_module(_MODULES[name]))
+    except ImportError:
+        return None
+
+
+DECOMPRESSORS: Dict[str, Decompressor] = {
+    d.name: d for d in map(_load, _MODULES) if d is not None
+}
+"""Every installed decompressor by name, the fastest first"""
+
+
+def get_decompressor(name: Optional[str] = None) -> Decompressor:
+    """Return the decompressor `name`, falling back to `CIV4SAVE_DECOMPRESSOR`.
+
+    Raises:
+        ValueError: If there is no decompressor called `name` or it isn't
+            installed.
+    """
+    name = name or os.environ.get(DECOMPRESSOR_ENV) or AUTO
+    if name == AUTO:
+        return next(iter(DECOMPRESSORS.values()))
+    try:
+        return DECOMPRESSORS[name]
+    except KeyError:
+        if name in _MODULES:
+            raise ValueError(f"decompressor {name} isn't installed")
+        raise ValueError(
+            f"unknown decompressor {name}, expected one of {list(_MODULES)}"
+        )
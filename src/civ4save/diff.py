@@ -0,0 +1,318 @@
+"""Structural diff of two saves of the same game, usually consecutive autosaves.
+
+Most of two consecutive saves is byte for byte identical, so rather than
+building both object graphs and walking them, `diff_saves` compares bytes first
+and only decodes what differs:
+
+- each section before the plots is compared as a byte range, players are only
+  rebuilt (which parses everything before the plots) if `init_core` or the
+  replay messages changed
+- replay messages are only ever appended to, the new ones are those past the
+  old save's messages
+- plot records are compared in runs of `PLOT_BLOCK`, a run identical to the
+  old save's is skipped with one comparison, which also gives the offsets of
+  its records without walking them. Only the records of changed runs are
+  walked, and the fixed width fields of the records that differ are decoded
+  as columns and compared column by column.
+
+Only the offsets of the sections are needed for that, the replay messages are
+stepped over rather than decoded. Opening the saves with `use_index=True` reads
+the old save's plot offsets from its sidecar index and writes the new save's,
+which leaves the diff of two big maps in the milliseconds.
+"""
+from __future__ import annotations
+
+from array import array
+from enum import IntEnum
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type
+
+import attrs
+
+from .objects import Player
+from .vanilla import enums as e
+from .vanilla.plot_index import PlotIndex, decode_columns, skip_plot
+from .vanilla.replay import read_replay_messages, replay_message_count
+from .vanilla.structure import PREFIX_SECTIONS
+
+if TYPE_CHECKING:
+    from .save_file import SaveFile
+
+PLOT_BLOCK = 64
+"""Plot records compared in one go"""
+
+PLOT_COLUMNS: Dict[str, Optional[Type[IntEnum]]] = {
+    "owner": None,
+    "plot_type": e.PlotType,
+    "terrain_type": e.TerrainType,
+    "feature_type": e.FeatureType,
+    "bonus_type": e.BonusType,
+    "improvement_type": e.ImprovementType,
+    "route_type": e.RouteType,
+}
+"""Plot fields compared, and the enum of their values"""
+
+Change = Tuple[Any, Any]
+
+
+@attrs.define(slots=True)
+class PlotChange:
+    """Fields of a plot that changed."""
+
+    x: int
+    y: int
+    changes: Dict[str, Change]
+    """Field of `PLOT_COLUMNS` -> (old, new) value"""
+
+
+@attrs.define(slots=True)
+class PlayerChange:
+    """Civics, religion and cities of a player that changed."""
+
+    idx: int
+    changes: Dict[str, Change] = attrs.field(factory=dict)
+    """religion or a `Civics` field -> (old, new) value"""
+    new_cities: List[str] = attrs.field(factory=list)
+    lost_cities: List[str] = attrs.field(factory=list)
+
+
+@attrs.define(slots=True)
+class ReplayEvent:
+    """A replay message added since the old save."""
+
+    turn: int
+    type: str
+    player: int
+    x: int
+    y: int
+    text: str
+
+
+@attrs.define(slots=True)
+class SaveDiff:
+    """What changed from one save to another."""
+
+    turns: Tuple[int, int]
+    unchanged_sections: List[str] = attrs.field(factory=list)
+    """Sections whose bytes are identical, `plots` included"""
+    plots: List[PlotChange] = attrs.field(factory=list)
+    players: List[PlayerChange] = attrs.field(factory=list)
+    events: List[ReplayEvent] = attrs.field(factory=list)
+
+    def format(self) -> str:
+        """Return the changes as text, one line per plot, player or event."""
+        lines = [f"turn {self.turns[0]} -> {self.turns[1]}"]
+        lines.append(f"unchanged sections: {', '.join(self.unchanged_sections)}")
+        lines.append(f"{len(self.plots)} plots changed")
+        for plot in self.plots:
+            lines.append(f"  ({plot.x}, {plot.y}) {_format_changes(plot.changes)}")
+        lines.append(f"{len(self.players)} players changed")
+        for player in self.players:
+            parts = [_format_changes(player.changes)] if player.changes else []
+            if player.new_cities:
+                parts.append(f"new cities: {', '.join(player.new_cities)}")
+            if player.lost_cities:
+                parts.append(f"lost cities: {', '.join(player.lost_cities)}")
+            lines.append(f"  {player.idx}: {'; '.join(parts)}")
+        lines.append(f"{len(self.events)} new replay events")
+        for ev in self.events:
+            text = f" {ev.text}" if ev.text else ""
+            lines.append(
+                f"  turn {ev.turn} player {ev.player} {ev.type} ({ev.x}, {ev.y}){text}"
+            )
+        return "\n".join(lines)
+
+
+def _format_value(value: Any) -> str:
+    return value.name if isinstance(value, IntEnum) else str(value)
+
+
+def _format_changes(changes: Dict[str, Change]) -> str:
+    return ", ".join(
+        f"{k}: {_format_value(a)} -> {_format_value(b)}"
+        for k, (a, b) in changes.items()
+    )
+
+
+def _section_ranges(offsets: Dict[str, int]) -> Dict[str, Tuple[int, int]]:
+    """Return the byte range of each section before the plots."""
+    names = PREFIX_SECTIONS + ["plots"]
+    return {
+        name: (offsets[name], offsets[names[n + 1]])
+        for n, name in enumerate(PREFIX_SECTIONS)
+    }
+
+
+def match_plots(old: PlotIndex, data: bytes, start: int) -> Tuple[array, List[int]]:
+    """Walk the plot records of `data` from `start`, skipping those of `old`.
+
+    Returns:
+        Tuple[array, List[int]]: The record boundaries, like
+            `PlotIndex.offsets`, and the indexes of the plots whose record
+            differs from `old`'s.
+
+    Raises:
+        ValueError: If the plot records can't be walked.
+    """
+    old_data, old_offsets = old.data, old.offsets
+    offsets = array("q", [start])
+    changed = []
+    pos, n, num_plots = start, 0, len(old)
+    while n < num_plots:
+        m = min(n + PLOT_BLOCK, num_plots)
+        old_start, old_end = old_offsets[n], old_offsets[m]
+        if data[pos : pos + old_end - old_start] == old_data[old_start:old_end]:
+            shift = pos - old_start
+            offsets.extend(o + shift for o in old_offsets[n + 1 : m + 1])
+            pos += old_end - old_start
+        else:
+            for i in range(n, m):
+                end = skip_plot(data, pos)
+                if data[pos:end] != old_data[old_offsets[i] : old_offsets[i + 1]]:
+                    changed.append(i)
+                offsets.append(end)
+                pos = end
+        n = m
+    return offsets, changed
+
+
+def _value(enum: Optional[Type[IntEnum]], value: int) -> Any:
+    return value if enum is None else enum(value)
+
+
+def diff_plots(
+    old: PlotIndex, new: PlotIndex, candidates: List[int]
+) -> List[PlotChange]:
+    """Compare the `PLOT_COLUMNS` of the plots `candidates` of both saves."""
+    if not candidates:
+        return []
+    names = list(PLOT_COLUMNS)
+    old_columns = decode_columns(old.data, [old.offsets[i] for i in candidates], names)
+    new_columns = decode_columns(new.data, [new.offsets[i] for i in candidates], names)
+    changes: Dict[int, Dict[str, Change]] = {}
+    for name, enum in PLOT_COLUMNS.items():
+        old_column, new_column = old_columns[name], new_columns[name]
+        if old_column == new_column:
+            continue
+        for n, (a, b) in enumerate(zip(old_column, new_column)):
+            if a != b:
+                changes.setdefault(n, {})[name] = (_value(enum, a), _value(enum, b))
+    width = new.grid_width
+    return [
+        PlotChange(candidates[n] % width, candidates[n] // width, changes[n])
+        for n in sorted(changes)
+    ]
+
+
+def _player_state(player: Player) -> Dict[str, Any]:
+    civics = player.civics
+    return dict(
+        religion=player.religion,
+        government=civics.government,
+        legal=civics.legal,
+        labor=civics.labor,
+        economy=civics.economy,
+        religion_civic=civics.religion,
+    )
+
+
+def diff_players(old: Dict[int, Player], new: Dict[int, Player]) -> List[PlayerChange]:
+    """Compare the civics, religion and cities of every player of `new`."""
+    changes = []
+    for idx, player in new.items():
+        change = PlayerChange(idx)
+        before = old.get(idx)
+        old_state = _player_state(before) if before else {}
+        old_cities = {c.name for c in before.cities} if before else set()
+        for key, value in _player_state(player).items():
+            if old_state.get(key) != value:
+                change.changes[key] = (old_state.get(key), value)
+        cities = [c.name for c in player.cities]
+        change.new_cities = [c for c in cities if c not in old_cities]
+        change.lost_cities = sorted(old_cities.difference(cities))
+        if change.changes or change.new_cities or change.lost_cities:
+            changes.append(change)
+    return changes
+
+
+def _new_messages(
+    old_data: bytes, old_start: int, new_data: bytes, new_start: int, same_start: bool
+) -> List[ReplayEvent]:
+    """Return the replay messages of `new_data` that aren't in `old_data`."""
+    if same_start:
+        skip = replay_message_count(old_data, old_start)
+        added, _ = read_replay_messages(new_data, new_start, skip)
+    else:
+        old_messages, _ = read_replay_messages(old_data, old_start)
+        seen = {(m[0], m[4], m[5]) for m in old_messages}
+        new_messages, _ = read_replay_messages(new_data, new_start)
+        added = [m for m in new_messages if (m[0], m[4], m[5]) not in seen]
+    return [
+        ReplayEvent(turn, _enum_name(e.ReplayMessageType, type_), player, x, y, text)
+        for turn, type_, x, y, player, text, _ in added
+    ]
+
+
+def _enum_name(enum: Type[IntEnum], value: int) -> str:
+    try:
+        return enum(value).name
+    except ValueError:
+        return str(value)
+
+
+def _plot_index(save: SaveFile, fields: Any, offsets: Dict[str, int]) -> PlotIndex:
+    """Return the plot index of `save`, walked from `offsets` if not indexed.
+
+    If `use_index` and the sidecar index was missing or stale, it's written.
+    """
+    if save._sidecar_index:
+        return save.plot_index
+    index = PlotIndex(
+        save._read(), offsets["plots"], fields.grid_width, fields.grid_height
+    )
+    save._build_index(offsets, index)
+    return index
+
+
+def diff_saves(old: SaveFile, new: SaveFile) -> SaveDiff:
+    """Return what changed from save `old` to save `new`, see the module docs.
+
+    Raises:
+        ValueError: If the saves have different map sizes, so can't be from
+            the same game.
+    """
+    old_data, new_data = old._read(), new._read()
+    old_fields, old_offsets = old._outline()
+    new_fields, new_offsets = new._outline()
+    old_size = old_fields.grid_width, old_fields.grid_height
+    new_size = new_fields.grid_width, new_fields.grid_height
+    if old_size != new_size:
+        raise ValueError(f"map sizes differ: {old_size} and {new_size}")
+    diff = SaveDiff((old_fields.game_turn, new_fields.game_turn))
+
+    old_ranges, new_ranges = _section_ranges(old_offsets), _section_ranges(new_offsets)
+    for name in PREFIX_SECTIONS:
+        (a, b), (c, d) = old_ranges[name], new_ranges[name]
+        if old_data[a:b] == new_data[c:d]:
+            diff.unchanged_sections.append(name)
+    unchanged = diff.unchanged_sections
+
+    if "replay_messages" not in unchanged:
+        # skip the message count, then the old messages are a prefix of the new
+        a, b = old_ranges["replay_messages"]
+        c, _ = new_ranges["replay_messages"]
+        same_start = old_data[a + 4 : b] == new_data[c + 4 : c + b - a]
+        diff.events = _new_messages(old_data, a, new_data, c, same_start)
+    if "init_core" not in unchanged or "replay_messages" not in unchanged:
+        diff.players = diff_players(old.players, new.players)
+
+    old_index = _plot_index(old, old_fields, old_offsets)
+    offsets, candidates = match_plots(old_index, new_data, new_offsets["plots"])
+    new_index = PlotIndex.from_offsets(new_data, offsets, *old_size)
+    if new.use_index and not new._sidecar_index:
+        # so diffing the next save against this one skips the plot walk
+        new._build_index(new_offsets, new_index)
+    if candidates:
+        diff.plots = diff_plots(old_index, new_index, candidates)
+    else:
+        unchanged.append("plots")
+    return diff
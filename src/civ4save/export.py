@@ -0,0 +1,129 @@
+"""Fast JSON export of `Settings`, `GameState`, `Player`, `Plot` and friends.
+
+Rather than a generic `json.JSONEncoder.default` hook that walks every object,
+each type gets a converter the first time it's seen: attrs classes convert
+their precomputed field list, Enums look their name up in a member -> name
+table. Plots can be streamed one at a time so a whole map never has to be held
+as one JSON string.
+"""
+import json
+from enum import Enum
+from typing import IO, Any, Callable, Dict, Iterable, Optional
+
+import attrs
+
+Converter = Callable[[Any], Any]
+
+_CONVERTERS: Dict[type, Converter] = {}
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _identity(obj: Any) -> Any:
+    return obj
+
+
+def _convert(obj: Any) -> Any:
+    try:
+        return _CONVERTERS[type(obj)](obj)
+    except KeyError:
+        return _make_converter(obj)(obj)
+
+
+def _convert_key(key: Any) -> Any:
+    return key.name if isinstance(key, Enum) else key
+
+
+def _convert_list(obj: Iterable) -> list:
+    return [_convert(v) for v in obj]
+
+
+def _convert_dict(obj: Dict) -> dict:
+    return {_convert_key(k): _convert(v) for k, v in obj.items()}
+
+
+def _attrs_converter(cls: type, sample: Any) -> Converter:
+    """Generate a converter specialised to the field types seen in `sample`.
+
+    Each field is converted inline (enum name table lookup, or passed through
+    for scalars) as long as it has the same type as in `sample`, anything else
+    goes through the generic `_convert`.
+    """
+    namespace: Dict[str, Any] = {"_convert": _convert}
+    lines = ["def convert(obj):"]
+    items = []
+    for n, f in enumerate(attrs.fields(cls)):
+        var, typ = f"v{n}", type(getattr(sample, f.name))
+        namespace[f"t{n}"] = typ
+        lines.append(f"    {var} = obj.{f.name}")
+        if issubclass(typ, Enum):
+            namespace[f"names{n}"] = _enum_names(typ)
+            fast = f"names{n}[{var}]"
+        elif typ in _SCALARS:
+            fast = var
+        else:
+            items.append(f"{f.name!r}: _convert({var})")
+            continue
+        fallback = f"_convert({var})"
+        items.append(f"{f.name!r}: {fast} if {var}.__class__ is t{n} else {fallback}")
+    lines.append("    return {" + ", ".join(items) + "}")
+    exec("\n".join(lines), namespace)
+    return namespace["convert"]
+
+
+def _enum_names(cls: type) -> Dict[Enum, str]:
+    """Return the member -> name table of an Enum."""
+    return {m: m.name for m in cls}  # type: ignore
+
+
+def _make_converter(obj: Any) -> Converter:
+    """Build and cache the converter for the type of `obj`."""
+    cls = type(obj)
+    converter: Converter
+    if attrs.has(cls):
+        converter = _attrs_converter(cls, obj)
+    elif issubclass(cls, Enum):
+        converter = _enum_names(cls).__getitem__
+    elif issubclass(cls, (str, int, float)) or cls is type(None):
+        converter = _identity
+    elif issubclass(cls, dict):
+        converter = _convert_dict
+    elif issubclass(cls, (list, tuple)):
+        converter = _convert_list
+    else:
+        raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+    _CONVERTERS[cls] = converter
+    return converter
+
+
+def to_jsonable(obj: Any) -> Any:
+    """Convert `obj` into plain dicts, lists and scalars for `json`."""
+    return _convert(obj)
+
+
+def dumps(obj: Any, indent: Optional[int] = None) -> str:
+    """Serialize `obj` to a JSON string."""
+    return json.dumps(_convert(obj), indent=indent)
+
+
+def dump(obj: Any, fp: IO[str], indent: Optional[int] = None) -> None:
+    """Serialize `obj` as JSON to `fp` without building the whole string."""
+    for chunk in json.JSONEncoder(indent=indent).iterencode(_convert(obj)):
+        fp.write(chunk)
+
+
+def dump_array(objs: Iterable[Any], fp: IO[str]) -> None:
+    """Stream `objs` to `fp` as a JSON array, one element per line."""
+    fp.write("[")
+    sep = "\n"
+    for obj in objs:
+        fp.write(sep)
+        fp.write(json.dumps(_convert(obj)))
+        sep = ",\n"
+    fp.write("\n]\n")
+
+
+def dump_lines(objs: Iterable[Any], fp: IO[str]) -> None:
+    """Stream `objs` to `fp` as newline delimited JSON (NDJSON)."""
+    for obj in objs:
+        fp.write(json.dumps(_convert(obj)))
+        fp.write("\n")
@@ -1,7 +1,7 @@
 """Used in `SaveFile.plots`."""
 from __future__ import annotations
 
-from typing import Any, List
+from typing import Any, Dict, List
 
 import attrs
 
@@ -53,3 +53,24 @@ class Plot:
             improvement_type,
             data.yields,
         )
+
+    @classmethod
+    def from_header(cls, data: Dict[str, Any]) -> Plot:
+        """Return `Plot` from the raw values of `PlotIndex.header`."""
+        return cls(
+            data["x"],
+            data["y"],
+            data["ownership_duration"],
+            data["improvement_duration"],
+            data["starting_plot"],
+            data["hills"],
+            data["potential_city_work"],
+            data["irrigated"],
+            data["owner"],
+            e.PlotType(data["plot_type"]),
+            e.TerrainType(data["terrain_type"]),
+            e.FeatureType(data["feature_type"]),
+            e.BonusType(data["bonus_type"]),
+            e.ImprovementType(data["improvement_type"]),
+            data["yields"],
+        )
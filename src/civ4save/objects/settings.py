@@ -59,15 +59,13 @@ class Settings:
         handicap = e.HandicapType[data.handicap]
         culture_victory_level = e.CultureLevelType[data.culture_victory_level]
 
-        game_options = {
-            e.GameOptionType(n).name: v for n, v in enumerate(data.game_options)
-        }
+        game_options = {k.name: v for k, v in data.game_options.items()}
 
         advanced_start_points = 0
         if game_options["GAMEOPTION_ADVANCED_START"]:
             advanced_start_points = data.advanced_start_points
 
-        victories = {e.VictoryType(n).name: v for n, v in enumerate(data.victories)}
+        victories = {k.name: v for k, v in data.victories.items()}
 
         num_civs = len([c for c in data.civs[:-1] if c != "NO_CIVILIZATION"])
 
@@ -0,0 +1,165 @@
+"""Decode the plot grid of a save in a process pool.
+
+Once `PlotIndex` knows where every plot record starts, decoding the fixed width
+fields of the plots is independent from plot to plot. The decompressed save is
+copied once into a `multiprocessing.shared_memory` block, each worker decodes
+the columns of a band of map rows straight from it, and the bands' columns are
+concatenated in map order. Only the plot offsets of a band and the decoded
+columns are pickled.
+
+Walking the records to find the offsets stays sequential, pass `use_index` to
+`SaveFile` to load them from the sidecar index instead. Starting the workers,
+copying the save and pickling the columns back cost more than decoding a small
+map, so maps under `MIN_PARALLEL_PLOTS` plots are decoded in process. Pass a
+`pool` to reuse the same workers across saves rather than start new ones each
+call.
+
+`shared_memory` is new in Python 3.8, older versions decode in process.
+"""
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Iterable, List, Optional, Tuple, cast
+
+from .objects import Plot
+from .vanilla.plot_index import PLOT_FIELDS, PlotIndex, decode_columns
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None  # type: ignore
+
+MIN_PARALLEL_PLOTS = 20000
+"""Smaller maps are decoded in process, about 0.35s of decoding on one core"""
+
+# Fields `Plot.from_header` reads
+PLOT_OBJECT_FIELDS = [
+    "x",
+    "y",
+    "ownership_duration",
+    "improvement_duration",
+    "starting_plot",
+    "hills",
+    "potential_city_work",
+    "irrigated",
+    "owner",
+    "plot_type",
+    "terrain_type",
+    "feature_type",
+    "bonus_type",
+    "improvement_type",
+    "yields",
+]
+
+
+def row_bands(grid_height: int, parts: int) -> List[Tuple[int, int]]:
+    """Split rows `0..grid_height` into at most `parts` (first, last + 1) bands."""
+    parts = max(1, min(parts, grid_height))
+    size, extra = divmod(grid_height, parts)
+    bands = []
+    first = 0
+    for n in range(parts):
+        last = first + size + (n < extra)
+        bands.append((first, last))
+        first = last
+    return bands
+
+
+def _decode_band(shm_name: str, starts: array, names: List[str]) -> Dict[str, array]:
+    """Decode `names` of the plots at `starts` of the shared block `shm_name`."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buf = cast(memoryview, shm.buf)
+        try:
+            return decode_columns(buf, starts, names)
+        finally:
+            buf.release()
+    finally:
+        shm.close()
+
+
+def plot_columns(
+    index: PlotIndex,
+    names: Iterable[str],
+    workers: int = 1,
+    pool: Optional[Executor] = None,
+    min_plots: Optional[int] = None,
+) -> Dict[str, array]:
+    """Return `PlotIndex.column` of each of `names`, decoded by `workers` processes.
+
+    Args:
+        index (PlotIndex): Plot offsets of the save.
+        names (Iterable[str]): Fixed width fields of `plot_index.PLOT_FIELDS`.
+        workers (int): Number of bands decoded in parallel, 1 decodes in this
+            process. Defaults to 1.
+        pool (Executor | None): Process pool to decode the bands in, left
+            running. Defaults to a new pool of `workers` processes.
+        min_plots (int | None): Maps with fewer plots are decoded in this
+            process. Defaults to `MIN_PARALLEL_PLOTS`.
+
+    Raises:
+        KeyError: If a name isn't a fixed width plot field.
+    """
+    names = list(names)
+    for name in names:
+        if name not in PLOT_FIELDS:
+            raise KeyError(name)
+    starts = index.offsets[:-1]
+    if min_plots is None:
+        min_plots = MIN_PARALLEL_PLOTS
+    if (
+        workers <= 1
+        or shared_memory is None
+        or len(starts) == 0
+        or len(starts) < min_plots
+    ):
+        return decode_columns(index.data, starts, names)
+
+    data = index.data
+    width = index.grid_width
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        cast(memoryview, shm.buf)[: len(data)] = data
+        bands = row_bands(index.grid_height, workers)
+        executor: ContextManager[Executor] = (
+            nullcontext(pool) if pool is not None else ProcessPoolExecutor(len(bands))
+        )
+        with executor as running:
+            futures = [
+                running.submit(
+                    _decode_band, shm.name, starts[first * width : last * width], names
+                )
+                for first, last in bands
+            ]
+            parts = [f.result() for f in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+    columns = parts[0]
+    for part in parts[1:]:
+        for name, column in columns.items():
+            column.extend(part[name])
+    return columns
+
+
+def plots_from_columns(columns: Dict[str, Any], num_plots: int) -> List[Plot]:
+    """Return `Plot`s from the `PLOT_OBJECT_FIELDS` columns of `plot_columns`."""
+    flags = [name for name in columns if PLOT_FIELDS[name].fmt.endswith("?")]
+    yields = columns["yields"]
+    count = len(yields) // num_plots if num_plots else 0
+    plots = []
+    for n in range(num_plots):
+        header = {name: column[n] for name, column in columns.items()}
+        for name in flags:
+            header[name] = bool(header[name])
+        header["yields"] = yields[n * count : (n + 1) * count].tolist()
+        plots.append(Plot.from_header(header))
+    return plots
+
+
+def decode_plots(
+    index: PlotIndex, workers: int = 1, pool: Optional[Executor] = None
+) -> List[Plot]:
+    """Return every `Plot` in map order, see `plot_columns`."""
+    columns = plot_columns(index, PLOT_OBJECT_FIELDS, workers, pool)
+    return plots_from_columns(columns, len(index))
@@ -0,0 +1,84 @@
+"""Opt-in instrumentation of where loading a save spends its time and memory.
+
+`SaveFile(file, profile=True)` records a `Stage` for reading and decompressing
+the file, for every top level section it parses (`section:<name>`) and for
+building each object (`settings`, `players`, `plots`, ...). `SaveFile.profile`
+holds the `Profile`, which `export.dumps` turns into JSON.
+
+Memory is measured with `tracemalloc`, which slows Python down, so the times
+are only comparable with each other, not with an unprofiled load.
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import attrs
+
+
+@attrs.define(slots=True)
+class Stage:
+    """One step of loading a save."""
+
+    name: str
+    seconds: float = 0.0
+    bytes: Optional[int] = None
+    """Bytes of the save consumed, None for stages that don't read it"""
+    peak_memory: int = 0
+    """Peak of memory allocated during the stage, in bytes"""
+
+
+def _reset_peak() -> None:
+    # reset_peak is new in Python 3.9, clearing the traces also resets the peak
+    getattr(tracemalloc, "reset_peak", tracemalloc.clear_traces)()
+
+
+@attrs.define(slots=True)
+class Profile:
+    """The stages of loading a save, in the order they ran."""
+
+    stages: List[Stage] = attrs.field(factory=list)
+
+    @contextmanager
+    def stage(self, name: str, nbytes: Optional[int] = None) -> Iterator[Stage]:
+        """Time the body of the `with` block as stage `name`.
+
+        The yielded `Stage` can be updated, e.g. with the bytes consumed once
+        they're known. Stages shouldn't be nested, the inner one resets the
+        memory peak of the outer one.
+        """
+        stage = Stage(name, bytes=nbytes)
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        _reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            stage.peak_memory = max(peak - before, 0)
+            if started:
+                tracemalloc.stop()
+            self.stages.append(stage)
+
+    @property
+    def seconds(self) -> float:
+        """Total time of every stage."""
+        return sum(s.seconds for s in self.stages)
+
+    def format(self) -> str:
+        """Return the stages as a text table."""
+        lines = [f"{'stage':26} {'ms':>10} {'bytes':>10} {'peak KB':>10}"]
+        for s in self.stages:
+            nbytes = "" if s.bytes is None else str(s.bytes)
+            lines.append(
+                f"{s.name:26} {s.seconds * 1000:10.2f} {nbytes:>10} "
+                f"{s.peak_memory / 1024:10.1f}"
+            )
+        lines.append(f"{'total':26} {self.seconds * 1000:10.2f}")
+        return "\n".join(lines)
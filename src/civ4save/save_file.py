@@ -1,16 +1,43 @@
 """Responsible for parsing a save file into useful data structures."""
+
 from __future__ import annotations
 
+import asyncio
+import io
+import os
+import struct
+import sys
 import zlib
+from array import array
+from concurrent.futures import Executor
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Union
-
-from construct import setGlobalPrintPrivateEntries
+from typing import (
+    IO,
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from construct import ConstructError, Container, setGlobalPrintPrivateEntries
 from lazy_property import LazyProperty
 
-from . import utils
+from . import parallel, utils
+from .backends import get_backend
+from .decompressors import Decompressor, get_decompressor
+from .diff import SaveDiff, diff_saves
 from .objects import GameState, Player, Plot, Settings, get_players
-from .vanilla.structure import CivBeyondSwordSave
+from .profiling import Profile, Stage
+from .save_index import SaveIndex, index_path
+from .vanilla.plot_index import PLOT_FIELDS, Buffer, PlotIndex
+from .vanilla.replay import replay_messages_end
+from .vanilla.structure import PREFIX_SECTIONS, SECTIONS, parse_section
 
 
 class NotASaveFile(Exception):
@@ -25,58 +52,324 @@ class ParseError(Exception):
     pass
 
 
-def _find_zlib_end(data: bytes, z_start: int) -> int:
-    """Used to decompress file.
+ZLIB_MAGIC = bytes.fromhex("789c")  # default compression
+CHUNK_SIZE = 65536
+"""Maximum length of a compressed chunk, the same as the game writes"""
+MAGIC_NUMBER_BASE = 48
+"""`_bytes_to_zlib_magic_number` of init_core is `z_start` minus this"""
 
-    Binary search to find byte index where incomplete data stream becomes
-    incorrect data stream. I'm not sure if the guess_limit makes sense but
-    I do want some check to an infinite loop / hang.
 
-    https://forums.civfanatics.com/threads/need-a-little-help-with-editing-civ4-save-files.452707/
-    """
-    guess_limit = 50
+def _zlib_chunks(data: bytes, z_start: int) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) byte range of each compressed chunk.
 
-    low, high = z_start, len(data)
-    prev = 0
-    guesses = 0
+    The compressed payload is not one contiguous zlib stream. It is written as
+    a series of chunks (at most 64KB each), every chunk prefixed with its INT
+    length and the whole series terminated by a zero length. The first length
+    prefix is the 4 bytes immediately before the zlib magic number.
+    """
+    pos = z_start - 4
     while True:
-        z_end = (low + high) // 2
-        if z_end == prev:
-            return z_end
-        if guesses > guess_limit:
+        if pos < 0 or pos + 4 > len(data):
             raise NotASaveFile("Could not find zlib end byte index")
-        try:
-            zlib.decompress(data[z_start:z_end])
-        except Exception as ex:
-            prev = z_end
-            if "incomplete" in ex.__str__():
-                low = z_end + 1
-            elif "invalid" in ex.__str__():
-                high = z_end - 1
-        guesses += 1
+        (chunk_sz,) = struct.unpack_from("<i", data, pos)
+        pos += 4
+        if chunk_sz == 0:
+            return
+        if chunk_sz < 0 or pos + chunk_sz > len(data):
+            raise NotASaveFile(f"Bad zlib chunk length {chunk_sz} at byte {pos - 4}")
+        yield pos, pos + chunk_sz
+        pos += chunk_sz
 
 
-def _read_savefile(file: Union[str, Path]) -> bytes:
-    """Read and decompress file.
+def _find_zlib_end(data: bytes, z_start: int) -> int:
+    """Return the byte index just past the compressed chunks.
 
-    Find the index in where the zlib magic header is, then find the end
-    of the compressed bytes. Then decompress and return the bytes.
+    This is where the uncompressed trailer of the file begins.
     """
+    z_end = z_start - 4
+    for _, z_end in _zlib_chunks(data, z_start):
+        pass
+    # skip the zero length terminator
+    return z_end + 4
+
+
+def _read_savefile(
+    file: Union[str, Path], decompressor: Optional[Decompressor] = None
+) -> bytes:
+    """Read and decompress file, see `_decompress_savefile`."""
     with open(file, "rb") as f:
-        data = f.read()
+        return _decompress_savefile(f.read(), decompressor)
 
-    magic_number = bytes.fromhex("789c")  # default compression
-    z_start = data.find(magic_number)
-    z_end = _find_zlib_end(data, z_start)
-    if z_start < 0 or z_end < 0:
+
+def _savefile_layout(data: bytes) -> Tuple[int, int]:
+    """Return where the compressed chunks start and the length of the trailer.
+
+    Both are the same in the contents of a save file and its decompressed
+    bytes, which keep the first chunk length prefix (the 4 bytes before
+    `z_start`) but none of the others.
+
+    Raises:
+        NotASaveFile: If there are no compressed chunks.
+    """
+    z_start = data.find(ZLIB_MAGIC)
+    if z_start < 0:
         raise NotASaveFile("This is not a .CivBeyondSwordSave file")
+    return z_start, len(data) - _find_zlib_end(data, z_start)
+
 
-    decomp_obj = zlib.decompressobj()
-    uncompressed_data = decomp_obj.decompress(data[z_start:z_end])
+def _decompress_savefile(
+    data: bytes, decompressor: Optional[Decompressor] = None
+) -> bytes:
+    """Decompress the contents of a save file.
+
+    Find the index in where the zlib magic header is, then strip the chunk
+    length prefixes from the compressed bytes. Then decompress and return the
+    bytes, with the uncompressed header and trailer left in place.
+
+    Args:
+        data (bytes): Contents of the save file.
+        decompressor (Decompressor | None): zlib implementation, see
+            `civ4save.decompressors`. Defaults to `get_decompressor()`.
+    """
+    z_start = data.find(ZLIB_MAGIC)
+    if z_start < 0:
+        raise NotASaveFile("This is not a .CivBeyondSwordSave file")
+    view = memoryview(data)
+    chunks = [view[start:end] for start, end in _zlib_chunks(data, z_start)]
+    z_end = _find_zlib_end(data, z_start)
+
+    decompressor = decompressor or get_decompressor()
+    uncompressed_data = decompressor.decompress(chunks)
 
     return data[:z_start] + uncompressed_data + data[z_end:]
 
 
+class _Inflater:
+    """Decompress the chunks of a save file on demand.
+
+    `data` holds the header and as much of the payload as has been asked for,
+    the decompressor keeps its state between calls so nothing is decompressed
+    twice. Once the payload is exhausted the trailer is appended. Readers that
+    only go forward can `discard` what they're done with, `data` then starts
+    at byte `offset` of the decompressed save.
+    """
+
+    STEP = 16384
+    """Minimum number of bytes decompressed at a time"""
+
+    def __init__(  # noqa: D107
+        self, contents: bytes, decompressor: Optional[Decompressor] = None
+    ) -> None:
+        self.contents = contents
+        self.z_start, self.trailer = _savefile_layout(contents)
+        view = memoryview(contents)
+        chunks = (
+            view[start:stop] for start, stop in _zlib_chunks(contents, self.z_start)
+        )
+        self._start(contents[: self.z_start], chunks, decompressor)
+
+    def _start(
+        self,
+        header: bytes,
+        chunks: Iterator[Buffer],
+        decompressor: Optional[Decompressor],
+    ) -> None:
+        self.data = bytearray(header)
+        self.offset = 0
+        self.done = False
+        self._chunks = chunks
+        self._decompressor = (decompressor or get_decompressor()).decompressobj()
+        self._input: Buffer = b""
+
+    def _read_trailer(self) -> Buffer:
+        return memoryview(self.contents)[len(self.contents) - self.trailer :]
+
+    @property
+    def end(self) -> int:
+        """Byte index just past what has been decompressed."""
+        return self.offset + len(self.data)
+
+    def ensure(self, end: int) -> None:
+        """Decompress up to byte `end` of the save, or everything."""
+        while self.end < end and not self.done:
+            if not self._input:
+                try:
+                    self._input = next(self._chunks)
+                except StopIteration:
+                    self.data += self._decompressor.flush()
+                    self.data += self._read_trailer()
+                    self.done = True
+                    continue
+            want = max(end - self.end, self.STEP)
+            self.data += self._decompressor.decompress(self._input, want)
+            self._input = self._decompressor.unconsumed_tail
+
+    def discard(self, end: int) -> None:
+        """Drop the decompressed bytes before byte `end` of the save."""
+        if end > self.offset:
+            del self.data[: end - self.offset]
+            self.offset = end
+
+    def finish(self) -> bytes:
+        """Return the whole decompressed save.
+
+        Raises:
+            ValueError: If part of it was discarded.
+        """
+        if self.offset:
+            raise ValueError("the start of the save was discarded")
+        self.ensure(sys.maxsize)
+        return bytes(self.data)
+
+
+def _read_header(file: IO[bytes]) -> bytes:
+    """Read `file` up to its first compressed chunk, see `_savefile_layout`.
+
+    `file` is left at the length prefix of the chunk.
+
+    Raises:
+        NotASaveFile: If there are no compressed chunks.
+    """
+    header = bytearray()
+    while True:
+        block = file.read(CHUNK_SIZE)
+        if not block:
+            raise NotASaveFile("This is not a .CivBeyondSwordSave file")
+        header += block
+        # the magic number may straddle two blocks
+        z_start = header.find(ZLIB_MAGIC, max(len(header) - len(block) - 1, 0))
+        if z_start >= 4:
+            file.seek(z_start - 4 - len(header), io.SEEK_CUR)
+            return bytes(header[:z_start])
+        if z_start >= 0:
+            raise NotASaveFile("Could not find zlib end byte index")
+
+
+def _read_chunks(file: IO[bytes]) -> Iterator[bytes]:
+    """Read the compressed chunks of `file` one at a time, see `_zlib_chunks`."""
+    while True:
+        prefix = file.read(4)
+        if len(prefix) < 4:
+            raise NotASaveFile("Could not find zlib end byte index")
+        (chunk_sz,) = struct.unpack("<i", prefix)
+        if chunk_sz == 0:
+            return
+        chunk = file.read(chunk_sz) if chunk_sz > 0 else b""
+        if len(chunk) != chunk_sz:
+            raise NotASaveFile(f"Bad zlib chunk length {chunk_sz}")
+        yield chunk
+
+
+class _FileInflater(_Inflater):
+    """An `_Inflater` reading the compressed chunks from an open file as needed.
+
+    Only the header and the chunk being decompressed are held, not the whole
+    file, so `contents` is empty and `trailer` is only known once `done`.
+    """
+
+    def __init__(  # noqa: D107
+        self, file: IO[bytes], decompressor: Optional[Decompressor] = None
+    ) -> None:
+        self.contents = b""
+        self._file = file
+        header = _read_header(file)
+        self.z_start, self.trailer = len(header), 0
+        self._start(header, _read_chunks(file), decompressor)
+
+    def _read_trailer(self) -> Buffer:
+        trailer = self._file.read()
+        self.trailer = len(trailer)
+        return trailer
+
+
+class _InflatingStream(io.RawIOBase):
+    """Read only stream of the decompressed save, decompressing as it's read."""
+
+    def __init__(self, inflater: _Inflater) -> None:  # noqa: D107
+        self._inflater = inflater
+        self._pos = 0
+
+    def readable(self) -> bool:  # noqa: D102
+        return True
+
+    def seekable(self) -> bool:  # noqa: D102
+        return True
+
+    def tell(self) -> int:  # noqa: D102
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:  # noqa: D102
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            self._inflater.ensure(sys.maxsize)
+            offset += self._inflater.end
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer: Any) -> int:  # noqa: D102
+        inflater = self._inflater
+        if self._pos < inflater.offset:
+            raise ValueError(f"byte {self._pos} was discarded")
+        end = self._pos + len(buffer)
+        inflater.ensure(end)
+        data = inflater.data[self._pos - inflater.offset : end - inflater.offset]
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def _slice_pieces(pieces: List[Buffer], start: int, end: int) -> Iterator[Buffer]:
+    """Yield the parts of `pieces` that make up bytes `start:end` of their concat."""
+    pos = 0
+    for piece in pieces:
+        piece_end = pos + len(piece)
+        if piece_end > start and pos < end:
+            yield memoryview(piece)[max(start - pos, 0) : min(end, piece_end) - pos]
+        pos = piece_end
+
+
+def _write_savefile(
+    out: IO[bytes], pieces: List[Buffer], z_start: int, trailer: int
+) -> None:
+    """Write a save file whose decompressed bytes are the concat of `pieces`.
+
+    The inverse of `_decompress_savefile`, `z_start` and `trailer` are the
+    `_savefile_layout` of the file. The payload is streamed through a zlib
+    compressor and written in chunks of at most `CHUNK_SIZE` as they fill. The
+    game compresses differently, so the compressed chunks (and the first chunk
+    length in the decompressed bytes) won't be the same as the original file's.
+    """
+    size = sum(len(p) for p in pieces)
+    for part in _slice_pieces(pieces, 0, z_start - 4):
+        out.write(part)
+    compressor = zlib.compressobj()
+    pending = bytearray()
+
+    def write_chunks(final: bool) -> None:
+        while len(pending) >= CHUNK_SIZE or (final and pending):
+            chunk = pending[:CHUNK_SIZE]
+            out.write(struct.pack("<i", len(chunk)))
+            out.write(chunk)
+            del pending[:CHUNK_SIZE]
+
+    for part in _slice_pieces(pieces, z_start, size - trailer):
+        pending += compressor.compress(part)
+        write_chunks(final=False)
+    pending += compressor.flush()
+    write_chunks(final=True)
+    out.write(struct.pack("<i", 0))
+    for part in _slice_pieces(pieces, size - trailer, size):
+        out.write(part)
+
+
+def _compress_savefile(data: bytes, z_start: int, trailer: int) -> bytes:
+    """Return the contents of a save file from its decompressed bytes."""
+    out = io.BytesIO()
+    _write_savefile(out, [data], z_start, trailer)
+    return out.getvalue()
+
+
 class SaveFile:
     """Wraps the parsed save file with useful methods."""
 
@@ -84,77 +377,556 @@ class SaveFile:
         self,
         file: Union[str, Path],
         debug: bool = False,
+        use_index: bool = False,
+        backend: Optional[str] = None,
+        workers: int = 1,
+        profile: bool = False,
+        decompressor: Optional[str] = None,
+        pool: Optional[Executor] = None,
     ) -> None:
         """Read and decompress the file, but do not parse anything yet.
 
         Args:
             file (str | Path): File to be parsed.
             debug (bool): Whether to print detailed debug info. Defaults to False.
+            use_index (bool): Whether to read (or write if missing) the sidecar
+                offset index next to the file. Defaults to False.
+            backend (str | None): Name of the parser in `backends.BACKENDS`.
+                Defaults to the `CIV4SAVE_BACKEND` environment variable, else
+                the fastest backend.
+            workers (int): Number of processes decoding `plots` and
+                `plot_columns` of big maps, see `civ4save.parallel`.
+                Defaults to 1.
+            profile (bool): Record the time, bytes and memory of each stage of
+                loading in `profile`, see `civ4save.profiling`. Sections are
+                then parsed one at a time. Defaults to False.
+            decompressor (str | None): Name of the zlib implementation in
+                `decompressors.DECOMPRESSORS`. Defaults to the
+                `CIV4SAVE_DECOMPRESSOR` environment variable, else the fastest
+                installed.
+            pool (Executor | None): Process pool the `workers` run in, to
+                share one between saves. Defaults to a new pool per call.
+
+        Raises:
+            ValueError: If there is no backend called `backend`, or no
+                decompressor called `decompressor` is installed.
         """
         self.file = file
+        self.use_index = use_index
+        self.backend = get_backend(backend)
+        self.decompressor = get_decompressor(decompressor)
+        self.workers = workers
+        self.pool = pool
+        self.profile: Optional[Profile] = Profile() if profile else None
         # Print everything if debug
         setGlobalPrintPrivateEntries(debug)
         self.debug = debug
 
-        self._raw_bytes: bytes
+        self._raw_bytes: bytes = b""
+        self._inflater: Optional[_Inflater] = None
+        self._section_offsets: Dict[str, int] = {"init_core": 0}
+        self._patched = False
+        self._modified: Set[str] = set()
         self._raw: Optional[Any] = None
 
         self._version: int = 0
 
+    def _open(self, data: Optional[bytes] = None) -> _Inflater:
+        """Read the file once without decompressing, `data` is its contents if read."""
+        if self._inflater is None:
+            try:
+                if data is None:
+                    with self._stage("read"):
+                        data = Path(self.file).read_bytes()
+                self._inflater = _Inflater(data, self.decompressor)
+            except Exception:
+                raise NotASaveFile(f"{self.file}")
+        return self._inflater
+
+    def _read(self, data: Optional[bytes] = None) -> bytes:
+        """Decompress the rest of the file once, `data` is its contents if read."""
+        if not self._raw_bytes:
+            inflater = self._open(data)
+            try:
+                with self._stage("decompress", len(inflater.contents)):
+                    self._raw_bytes = inflater.finish()
+            except Exception:
+                raise NotASaveFile(f"{self.file}")
+            # only needed while decompressing on demand
+            inflater.data = bytearray()
+        return self._raw_bytes
+
+    def _stream(self) -> IO[bytes]:
+        """Return a stream of the decompressed save, decompressing on demand."""
+        if self._raw_bytes:
+            return io.BytesIO(self._raw_bytes)
+        # buffered so the parsers' many small reads don't each go through Python
+        raw = _InflatingStream(self._open())
+        return io.BufferedReader(raw, buffer_size=_Inflater.STEP)
+
+    @property
+    def _contents(self) -> bytes:
+        """The file as read."""
+        return self._open().contents
+
+    @property
+    def _layout(self) -> Tuple[int, int]:
+        """`_savefile_layout` of the file."""
+        inflater = self._open()
+        return inflater.z_start, inflater.trailer
+
+    def _stage(self, name: str, nbytes: Optional[int] = None) -> ContextManager:
+        """Record stage `name` in `profile`, if profiling."""
+        if self.profile is None:
+            return nullcontext(Stage(name))
+        return self.profile.stage(name, nbytes)
+
+    def _parse_sections(self, names: List[str]) -> Tuple[Any, int]:
+        """Parse `names` one section at a time, recording each as a stage.
+
+        Returns:
+            Tuple[Any, int]: The fields of the sections and where they end.
+        """
+        data = self._read()
+        stream = io.BytesIO(data)
+        parsed = Container()
+        for name in names:
+            start = stream.tell()
+            with self._stage(f"section:{name}") as stage:
+                parsed[f"_{name}_offset"] = start
+                parsed.update(self.backend.parse_section(data, name, stream, parsed))
+                stage.bytes = stream.tell() - start
+        return parsed, stream.tell()
+
+    @classmethod
+    async def aopen(
+        cls,
+        file: Union[str, Path],
+        executor: Optional[Executor] = None,
+        full: bool = False,
+        **kwargs: Any,
+    ) -> SaveFile:
+        """Open and parse `file` without blocking the event loop.
+
+        The file is read in a thread, then decompressed and parsed in
+        `executor`. Afterwards `settings`, `game_state` and `players` (or
+        everything if `full`) are ready without further parsing.
+
+        Args:
+            file (str | Path): File to be parsed.
+            executor (Executor | None): Runs the decompress and parse. Must
+                share memory with the caller, so a thread pool, not a process
+                pool. Defaults to the loop's default executor.
+            full (bool): Also parse the whole struct for `raw`.
+                Defaults to False.
+            **kwargs: Passed on to `SaveFile`.
+
+        Raises:
+            NotASaveFile: If the file can't be decompressed.
+        """
+        loop = asyncio.get_running_loop()
+        save = cls(file, **kwargs)
+        data = await loop.run_in_executor(None, Path(file).read_bytes)
+        await loop.run_in_executor(executor, save._load, data, full)
+        return save
+
+    def _load(self, data: bytes, full: bool) -> None:
+        """Decompress `data` and parse what `aopen` promises."""
+        self._read(data)
+        if full:
+            self.raw
+        else:
+            self._prefix
+
     @property
     def raw(self) -> Any:
         """Returns the raw parsed struct."""
         if not self._raw:
+            data = self._read()
             try:
-                self._raw_bytes = _read_savefile(self.file)
-                self._raw = CivBeyondSwordSave.parse(self._raw_bytes)
+                if self.profile is not None:
+                    self._raw, _ = self._parse_sections(list(SECTIONS))
+                else:
+                    self._raw = self.backend.parse(data)
             except Exception:
                 raise NotASaveFile(f"{self.file}")
         return self._raw
 
+    @LazyProperty
+    def _prefix(self) -> Any:
+        """Parse everything before the plots, or reuse the full parse.
+
+        Settings, game state and players only need these fields, so they don't
+        pay for parsing thousands of plots.
+        """
+        if self._raw:
+            return self._raw
+        try:
+            if self.profile is not None:
+                prefix, prefix["_plots_offset"] = self._parse_sections(PREFIX_SECTIONS)
+                return prefix
+            # only the prefix is decompressed, if the file isn't already
+            return self.backend.parse_prefix_stream(self._stream())
+        except NotASaveFile:
+            raise
+        except Exception:
+            raise NotASaveFile(f"{self.file}")
+
     @property
     def version(self) -> int:
         """Returns the version of the save file, 302 for BTS vanilla."""
-        return self.raw.version
+        return self._prefix.version
 
     @property
     def current_turn(self) -> int:
         """Returns the current turn."""
-        return self.raw.game_turn
+        return self._prefix.game_turn
 
     @property
     def map_size(self) -> Tuple[int, int]:
         """Returns map grid size (width x height)."""
-        return self.raw.grid_width, self.raw.grid_height
+        return self._prefix.grid_width, self._prefix.grid_height
 
     @LazyProperty
     def settings(self) -> Settings:
         """Returns the game's settings."""
-        return Settings.from_struct(self.raw)
+        prefix = self._prefix
+        with self._stage("settings"):
+            return Settings.from_struct(prefix)
 
     @LazyProperty
     def game_state(self) -> GameState:
         """Return `GameState` object."""
-        return GameState.from_struct(self.raw)
+        prefix = self._prefix
+        with self._stage("game_state"):
+            return GameState.from_struct(prefix)
 
     @LazyProperty
     def players(self) -> Dict[int, Player]:
         """Return players Dict."""
-        return get_players(self.raw)
+        prefix = self._prefix
+        with self._stage("players"):
+            return get_players(prefix)
 
     @property
     def plots(self) -> List[Plot]:
         """Return the Plots list."""
-        return [Plot.from_struct(p) for p in self.raw.plots]
+        index = self.plot_index
+        with self._stage("plots"):
+            if self.workers > 1:
+                return parallel.decode_plots(index, self.workers, self.pool)
+            return list(self.iter_plots())
+
+    def plot_columns(self, *names: str) -> Dict[str, array]:
+        """Return the raw values of fixed width plot fields, one array per field.
+
+        Same as `PlotIndex.column` of each name, decoded by `workers` processes.
+
+        Args:
+            *names (str): Fields of `plot_index.PLOT_FIELDS`, all by default.
+        """
+        return parallel.plot_columns(
+            self.plot_index, names or list(PLOT_FIELDS), self.workers, self.pool
+        )
+
+    def iter_plots(self) -> Iterator[Plot]:
+        """Yield every `Plot` in order, decoding one record at a time."""
+        for header in self.plot_index.iter_headers():
+            yield Plot.from_header(header)
+
+    @LazyProperty
+    def _sidecar_index(self) -> Optional[SaveIndex]:
+        """Load the sidecar index if `use_index` and it's not stale."""
+        if not self.use_index:
+            return None
+        index = SaveIndex.read(index_path(self.file))
+        if index and index.is_fresh(self.file):
+            return index
+        return None
+
+    @LazyProperty
+    def plot_index(self) -> PlotIndex:
+        """Return the byte offsets of every plot record.
+
+        Only what precedes the plots is parsed if the full struct hasn't been
+        parsed yet.
+        """
+        data = self._read()
+        index = self._sidecar_index
+        if index:
+            offsets = array("q", index.plot_offsets)
+            return PlotIndex.from_offsets(
+                data, offsets, index.grid_width, index.grid_height
+            )
+        prefix = self._prefix
+        start = prefix._plots_offset
+        with self._stage("plot_index") as stage:
+            index = PlotIndex(data, start, prefix.grid_width, prefix.grid_height)
+            stage.bytes = index.end - index.start
+        return index
+
+    @LazyProperty
+    def save_index(self) -> SaveIndex:
+        """Return the byte offsets of every section and plot record.
+
+        If `use_index` the sidecar index is used when fresh, or written
+        otherwise so later opens can skip straight to any section.
+        """
+        index = self._sidecar_index
+        if index:
+            return index
+        sections = {
+            name: self._prefix[f"_{name}_offset"]
+            for name in SECTIONS
+            if f"_{name}_offset" in self._prefix
+        }
+        return self._build_index(sections, self.plot_index)
+
+    def _build_index(
+        self, sections: Dict[str, int], plot_index: PlotIndex
+    ) -> SaveIndex:
+        """Make the `SaveIndex` of known offsets, written out if `use_index`."""
+        stat = os.stat(self.file)
+        index = SaveIndex(
+            file_size=stat.st_size,
+            file_mtime_ns=stat.st_mtime_ns,
+            grid_width=plot_index.grid_width,
+            grid_height=plot_index.grid_height,
+            sections={**sections, "areas": plot_index.end},
+            plot_offsets=plot_index.offsets.tolist(),
+        )
+        if self.use_index:
+            index.write(index_path(self.file))
+        return index
+
+    def write_index(self, path: Optional[Union[str, Path]] = None) -> Path:
+        """Write the sidecar index, next to the save file by default."""
+        path = Path(path) if path else index_path(self.file)
+        self.save_index.write(path)
+        return path
+
+    def section(self, name: str) -> Any:
+        """Parse only the section `name` of `structure.SECTIONS`.
+
+        Sections before the plots are found by parsing the ones before them,
+        any section by its offset in a fresh sidecar index if `use_index`.
+        Either way the file is only decompressed up to the end of the section.
+        """
+        index = self._sidecar_index
+        if not self._raw_bytes and index:
+            stream = self._stream()
+        elif name in PREFIX_SECTIONS and not self._raw_bytes and not self.use_index:
+            return self._prefix_section(name)
+        else:
+            index = self.save_index
+            stream = io.BytesIO(self._read())
+        stream.seek(index.sections[name])
+        return parse_section(
+            name, stream, grid_width=index.grid_width, grid_height=index.grid_height
+        )
+
+    def _outline(self) -> Tuple[Any, Dict[str, int]]:
+        """Find the sections before the plots without decoding the replay messages.
+
+        The offsets come from the sidecar index if `use_index` and it's fresh,
+        then only `init_core` is parsed. Otherwise the sections are parsed one
+        by one and the replay messages, the bulk of a long game's prefix,
+        stepped over.
+
+        Returns:
+            Tuple[Any, Dict[str, int]]: `game_turn`, `grid_width` and
+                `grid_height` among others, and the offset of each section.
+        """
+        data = self._read()
+        stream = io.BytesIO(data)
+        fields = Container()
+        index = self._sidecar_index
+        try:
+            if index:
+                fields.update(
+                    self.backend.parse_section(data, "init_core", stream, fields)
+                )
+                fields.grid_width = index.grid_width
+                fields.grid_height = index.grid_height
+                return fields, index.sections
+            offsets = {}
+            for name in PREFIX_SECTIONS:
+                offsets[name] = stream.tell()
+                if name == "replay_messages":
+                    stream.seek(replay_messages_end(data, offsets[name]))
+                else:
+                    fields.update(
+                        self.backend.parse_section(data, name, stream, fields)
+                    )
+            offsets["plots"] = stream.tell()
+        except Exception:
+            raise NotASaveFile(f"{self.file}")
+        return fields, offsets
+
+    def _prefix_section(self, name: str) -> Any:
+        """Parse section `name` of `PREFIX_SECTIONS`, from the last known offset."""
+        offsets = self._section_offsets
+        names = PREFIX_SECTIONS + ["plots"]
+        target = names.index(name)
+        n = max(i for i in range(target + 1) if names[i] in offsets)
+        stream = self._stream()
+        stream.seek(offsets[names[n]])
+        try:
+            while True:
+                section = parse_section(names[n], stream)
+                n += 1
+                offsets[names[n]] = stream.tell()
+                if n > target:
+                    return section
+        except Exception:
+            raise NotASaveFile(f"{self.file}")
 
     def get_plot(self, x: int, y: int) -> Optional[Plot]:
         """Return `Plot` matching the given coordinates (x, y)."""
-        plot_index = utils.calc_plot_index(self.map_size[0], x, y)
+        index = self.plot_index
+        plot_index = utils.calc_plot_index(index.grid_width, x, y)
         try:
-            return self.plots[plot_index]
+            return Plot.from_header(index.header(plot_index))
         except IndexError:
             return None
 
+    def patch_plot(self, x: int, y: int, **fields: Any) -> None:
+        """Overwrite fixed width fields of the plot at (x, y) in place.
+
+        The new values are written straight into the decompressed save at the
+        plot's offsets, nothing is re-encoded. Values are whatever the
+        field's construct builds from, enum members, names or integers for
+        enums and a list for yields. Use `to_bytes` to get the patched file.
+
+        Example:
+            save.patch_plot(3, 7, bonus_type=e.BonusType.BONUS_GOLD)
+
+        Args:
+            x (int): Column of the plot.
+            y (int): Row of the plot.
+            **fields: New values by name, from `plot_index.PLOT_FIELDS`.
+
+        Raises:
+            KeyError: If a name isn't a fixed width plot field.
+            ValueError: If a value can't be encoded.
+            IndexError: If there is no plot at (x, y).
+        """
+        encoded = {}
+        for name, value in fields.items():
+            if name not in PLOT_FIELDS:
+                raise KeyError(name)
+            try:
+                encoded[name] = PLOT_FIELDS[name].subcon.build(value)
+            except ConstructError as ex:
+                raise ValueError(f"can't encode {value!r} as {name}: {ex}")
+        index = self.plot_index
+        if not 0 <= x < index.grid_width:
+            raise IndexError(f"x {x} out of range")
+        idx = utils.calc_plot_index(index.grid_width, x, y)
+        start, _ = index.span(idx)
+        data = self._read()
+        buffer = data if isinstance(data, bytearray) else bytearray(data)
+        # parsed from then on as is, bytearray works wherever bytes do
+        self._raw_bytes = index.data = buffer  # type: ignore
+        for name, value in encoded.items():
+            offset = start + PLOT_FIELDS[name].offset
+            buffer[offset : offset + len(value)] = value
+            if self._raw:
+                # keep the full parse in step, `write` may rebuild the plots
+                self._raw.plots[idx][name] = PLOT_FIELDS[name].subcon.parse(value)
+        self._patched = True
+
+    def mark_modified(self, *sections: str) -> None:
+        """Have `write` rebuild `sections` from `raw`, after editing them there.
+
+        Example:
+            save.raw.game_turn = 200
+            save.mark_modified("game")
+
+        Args:
+            *sections (str): Keys of `structure.SECTIONS`.
+
+        Raises:
+            KeyError: If a name isn't a section.
+        """
+        for name in sections:
+            if name not in SECTIONS:
+                raise KeyError(name)
+        self._modified.update(sections)
+
+    def _pieces(self) -> Tuple[List[Buffer], int]:
+        """Return the decompressed save in pieces, and where the payload starts.
+
+        Sections marked modified are built from `raw`, everything else is
+        sliced from the decompressed save as it was read (or patched).
+        """
+        data = self._read()
+        raw = self.raw
+        names = list(SECTIONS)
+        starts = [raw[f"_{name}_offset"] for name in names]
+        if "areas" in self._modified:
+            # the areas are the last section parsed, find where they end
+            stream = io.BytesIO(data)
+            stream.seek(raw._areas_offset)
+            self.backend.parse_section(data, "areas", stream, raw)
+            starts.append(stream.tell())
+        else:
+            starts.append(len(data))
+        view = memoryview(data)
+        pieces: List[Buffer] = []
+        z_start, _ = self._layout
+        for n, name in enumerate(names):
+            if name not in self._modified:
+                pieces.append(view[starts[n] : starts[n + 1]])
+                continue
+            if name == "init_core":
+                # the header records where the payload starts, which moves with
+                # the length of init_core
+                size = len(SECTIONS[name].build(raw))
+                z_start += size - (starts[n + 1] - starts[n])
+                raw._bytes_to_zlib_magic_number = z_start - MAGIC_NUMBER_BASE
+            pieces.append(SECTIONS[name].build(raw))
+        pieces.append(view[starts[-1] :])
+        return pieces, z_start
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the save file to `path`, with any patches or modified sections.
+
+        An unchanged save is written back byte for byte. Otherwise untouched
+        sections are copied from the decompressed save, those marked with
+        `mark_modified` are rebuilt from `raw`, and the result is streamed
+        through zlib into the original layout of uncompressed header,
+        compressed chunks and uncompressed trailer.
+        """
+        with open(path, "wb") as f:
+            self._write(f)
+
+    def to_bytes(self) -> bytes:
+        """Return what `write` would write."""
+        out = io.BytesIO()
+        self._write(out)
+        return out.getvalue()
+
+    def _write(self, out: IO[bytes]) -> None:
+        data = self._read()
+        z_start, trailer = self._layout
+        if self._modified:
+            pieces, z_start = self._pieces()
+        elif self._patched:
+            pieces = [data]
+        else:
+            out.write(self._contents)
+            return
+        _write_savefile(out, pieces, z_start, trailer)
+
+    def diff(self, other: SaveFile) -> SaveDiff:
+        """Return what changed from this save to `other`, see `civ4save.diff`.
+
+        Raises:
+            ValueError: If the saves have different map sizes.
+        """
+        return diff_saves(self, other)
+
     def get_player(self, player_idx: int) -> Optional[Player]:
         """Return `Player` at the given player idx."""
         # will raise KeyError
@@ -163,7 +935,7 @@ class SaveFile:
     def __str__(self) -> str:
         """Return string representation of the `SaveFile`."""
         v = self.version
-        sz = len(self._raw_bytes)
+        sz = len(self._read())
         try:
             n = self.file.name  # type: ignore
             return f"SaveFile(file={n}, version={v}, size={sz})"
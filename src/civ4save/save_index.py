@@ -0,0 +1,100 @@
+"""Sidecar index of the byte offsets of a save's sections and plot records.
+
+All offsets are into the decompressed save (uncompressed header followed by
+the decompressed payload) as returned by `save_file._read_savefile`. With an
+index in hand any section or plot can be parsed straight from its offset
+without first walking everything before it.
+"""
+from __future__ import annotations
+
+import json
+import os
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import attrs
+
+INDEX_SUFFIX = ".c4idx"
+INDEX_VERSION = 1
+
+
+def index_path(file: Union[str, Path]) -> Path:
+    """Return the default sidecar index path of a save file."""
+    return Path(f"{file}{INDEX_SUFFIX}")
+
+
+@attrs.define(slots=True)
+class SaveIndex:
+    """Byte offsets of every top level section and plot record of a save."""
+
+    file_size: int
+    """Size of the (compressed) save file, used to detect a stale index"""
+    file_mtime_ns: int
+    """Modification time of the save file, used to detect a stale index"""
+    grid_width: int
+    grid_height: int
+    sections: Dict[str, int]
+    """Offset of each section in `structure.SECTIONS`"""
+    plot_offsets: List[int]
+    """Record boundaries, plot `n` spans `plot_offsets[n]:plot_offsets[n + 1]`"""
+
+    def is_fresh(self, file: Union[str, Path]) -> bool:
+        """Whether `file` is unchanged since the index was made."""
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (self.file_size, self.file_mtime_ns)
+
+    def to_json(self) -> str:
+        """Serialize to JSON, plots are stored as record sizes to stay small."""
+        offsets = self.plot_offsets
+        return json.dumps(
+            dict(
+                version=INDEX_VERSION,
+                file_size=self.file_size,
+                file_mtime_ns=self.file_mtime_ns,
+                grid_width=self.grid_width,
+                grid_height=self.grid_height,
+                sections=self.sections,
+                plot_sizes=[b - a for a, b in zip(offsets, offsets[1:])],
+            ),
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> SaveIndex:
+        """Load from `to_json` output.
+
+        Raises:
+            ValueError: If the text is not a supported index.
+        """
+        data = json.loads(text)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"unsupported index version {data.get('version')}")
+        sections = data["sections"]
+        plot_offsets = list(accumulate([sections["plots"], *data["plot_sizes"]]))
+        return cls(
+            file_size=data["file_size"],
+            file_mtime_ns=data["file_mtime_ns"],
+            grid_width=data["grid_width"],
+            grid_height=data["grid_height"],
+            sections=sections,
+            plot_offsets=plot_offsets,
+        )
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the index to `path`."""
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def read(cls, path: Union[str, Path]) -> Optional[SaveIndex]:
+        """Read the index at `path`, `None` if missing or unreadable."""
+        try:
+            with open(path) as f:
+                return cls.from_json(f.read())
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # valid JSON of the wrong shape raises the last three
+            return None
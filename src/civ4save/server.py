@@ -0,0 +1,296 @@
+"""Local HTTP service answering queries about the saves in a folder.
+
+Saves are parsed in a process pool so the event loop never waits on construct,
+and the parsed settings, game state, players and plots are kept in an LRU
+cache so repeated queries about a save cost a dict lookup. A cached save is
+parsed again when its file changes. The plots are encoded to JSON in the pool
+too, so thousands of `Plot` objects are never pickled back, and listing the
+folder and encoding responses run in threads.
+
+Endpoints, all `GET` and all returning JSON:
+```
+/saves                          names of the saves under the served folder
+/saves/<name>/settings
+/saves/<name>/game_state
+/saves/<name>/players
+/saves/<name>/players/<idx>
+/saves/<name>/plots?x0=&y0=&x1=&y1=   plots inside the (inclusive) box
+```
+Only the stdlib is used, the HTTP handling is just enough for local tools.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import attrs
+from construct import ConstructError
+
+from . import export
+from .objects import GameState, Player, Settings
+from .save_file import NotASaveFile, SaveFile
+
+SAVE_SUFFIX = ".CivBeyondSwordSave"
+MAX_REQUEST_LINE = 8192
+"""Longest request or header line, longer ones are refused"""
+
+Response = Tuple[HTTPStatus, Any]
+
+
+class HTTPError(Exception):
+    """Raised by a route to answer with an error status."""
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:  # noqa: D107
+        super().__init__(message)
+        self.status = status
+
+
+@attrs.define(slots=True)
+class Encoded:
+    """A response body already encoded to JSON."""
+
+    text: str
+
+
+@attrs.define(slots=True)
+class CachedSave:
+    """Everything the server answers about one save."""
+
+    stat: Tuple[int, int]
+    """Size and mtime of the file when it was parsed"""
+    settings: Settings
+    game_state: GameState
+    players: Dict[int, Player]
+    plots: List[str]
+    """JSON of each plot, in map order"""
+
+
+def load_save(file: str) -> CachedSave:
+    """Parse `file`, run in the process pool so it must be picklable."""
+    stat = os.stat(file)
+    save = SaveFile(file)
+    return CachedSave(
+        (stat.st_size, stat.st_mtime_ns),
+        save.settings,
+        save.game_state,
+        save.players,
+        [export.dumps(plot) for plot in save.iter_plots()],
+    )
+
+
+def _encode(body: Any) -> bytes:
+    text = body.text if isinstance(body, Encoded) else export.dumps(body)
+    return text.encode()
+
+
+def _int_arg(query: Dict[str, List[str]], name: str, default: int) -> int:
+    try:
+        return int(query[name][0])
+    except KeyError:
+        return default
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer")
+
+
+class SaveServer:
+    """Serve the saves under `root`."""
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        cache_size: int = 16,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        """Serve saves from `root`.
+
+        Args:
+            root (str | Path): Folder of saves, subfolders are served too.
+            cache_size (int): Number of parsed saves kept in memory.
+                Defaults to 16.
+            executor (Executor | None): Where saves are parsed. Defaults to a
+                `ProcessPoolExecutor` with one worker per CPU.
+        """
+        self.root = Path(root).resolve()
+        self.cache_size = cache_size
+        self.executor = executor or ProcessPoolExecutor()
+        self._cache: OrderedDict[Path, CachedSave] = OrderedDict()
+        self._loading: Dict[Tuple[Path, Tuple[int, int]], asyncio.Future] = {}
+
+    def _resolve(self, name: str) -> Path:
+        """Return the save `name` under `root`, refusing paths outside it."""
+        path = (self.root / name).resolve()
+        if self.root not in path.parents or not path.is_file():
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no save named {name}")
+        return path
+
+    async def get(self, path: Path) -> CachedSave:
+        """Return the cached parse of `path`, parsing it if missing or stale."""
+        st = os.stat(path)
+        stat = (st.st_size, st.st_mtime_ns)
+        hit = self._cache.get(path)
+        if hit is not None and hit.stat == stat:
+            self._cache.move_to_end(path)
+            return hit
+        key = (path, stat)
+        future: Optional[asyncio.Future] = self._loading.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, load_save, str(path))
+            self._loading[key] = future
+            try:
+                cached: CachedSave = await asyncio.shield(future)
+            finally:
+                del self._loading[key]
+            self._cache[path] = cached
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return cached
+        return await asyncio.shield(future)
+
+    async def route(self, target: str) -> Response:
+        """Answer a `GET` of `target`."""
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        if parts[0] != "saves":
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no route {url.path}")
+        if len(parts) == 1:
+            loop = asyncio.get_running_loop()
+            return HTTPStatus.OK, await loop.run_in_executor(None, self._list_saves)
+        if len(parts) < 3:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no route {url.path}")
+        *name, what = parts[1:]
+        idx = -1
+        if what.isdigit() and len(name) > 1 and name[-1] == "players":
+            *name, _ = name
+            idx = int(what)
+            what = "player"
+        path = self._resolve("/".join(name))
+        try:
+            save = await self.get(path)
+        except (NotASaveFile, ConstructError, ValueError) as ex:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, f"can't parse: {ex}")
+
+        if what == "settings":
+            return HTTPStatus.OK, save.settings
+        elif what == "game_state":
+            return HTTPStatus.OK, save.game_state
+        elif what == "players":
+            return HTTPStatus.OK, save.players
+        elif what == "player":
+            if idx not in save.players:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"no player {idx}")
+            return HTTPStatus.OK, save.players[idx]
+        elif what == "plots":
+            return HTTPStatus.OK, self._plots(save, parse_qs(url.query))
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"no route {url.path}")
+
+    def _list_saves(self) -> List[str]:
+        """Return the paths of the saves under `root`, relative to it."""
+        saves = self.root.rglob(f"*{SAVE_SUFFIX}")
+        return sorted(str(p.relative_to(self.root)) for p in saves)
+
+    def _plots(self, save: CachedSave, query: Dict[str, List[str]]) -> Encoded:
+        """Return the plots in the box x0 <= x <= x1, y0 <= y <= y1."""
+        width, height = save.settings.grid_width, save.settings.grid_height
+        x0 = max(_int_arg(query, "x0", 0), 0)
+        y0 = max(_int_arg(query, "y0", 0), 0)
+        x1 = min(_int_arg(query, "x1", width - 1), width - 1)
+        y1 = min(_int_arg(query, "y1", height - 1), height - 1)
+        plots = []
+        for y in range(y0, y1 + 1):
+            plots.extend(save.plots[y * width + x0 : y * width + x1 + 1])
+        return Encoded(f"[{','.join(plots)}]")
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer the requests of one connection."""
+        try:
+            while True:
+                # answered if readline refuses a line over MAX_REQUEST_LINE
+                status = HTTPStatus.BAD_REQUEST
+                try:
+                    request = await reader.readline()
+                    if not request:
+                        break
+                    status = HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        key, _, val = line.decode("latin-1").partition(":")
+                        headers[key.strip().lower()] = val.strip()
+                except ValueError:
+                    error = {"error": f"line longer than {MAX_REQUEST_LINE} bytes"}
+                    await self._respond(writer, status, error, False)
+                    break
+                try:
+                    method, target, version = request.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {}, False)
+                    break
+                keep_alive = version == "HTTP/1.1" and (
+                    headers.get("connection", "").lower() != "close"
+                )
+                try:
+                    if method != "GET":
+                        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "only GET")
+                    status, body = await self.route(target)
+                except HTTPError as ex:
+                    status, body = ex.status, {"error": str(ex)}
+                except Exception as ex:
+                    status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(ex)}
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        body: Any,
+        keep_alive: bool,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(None, _encode, body)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> Any:
+        """Start listening, returns the `asyncio.Server`."""
+        return await asyncio.start_server(
+            self.handle, host, port, limit=MAX_REQUEST_LINE
+        )
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        """Run the server until interrupted."""
+
+        async def main() -> None:
+            server = await self.start(host, port)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown()
@@ -0,0 +1,181 @@
+"""Scan a save as a stream of section and plot events, in constant memory.
+
+`SaveFile` holds the whole decompressed save, and the full parse on top of it,
+which is wasteful when all that's wanted is an aggregate such as terrain
+counts. `iter_events` instead decompresses the save a bit at a time and yields:
+
+- a `SectionEvent` with the fields of each section before the plots
+- a `PlotEvent` with the raw fixed width fields of every plot, in map order
+- a `SectionEvent` for the areas
+
+The file is read one compressed chunk at a time and decompressed bytes are
+dropped as soon as they've been parsed, so memory use depends on the biggest
+section before the plots (mostly the replay messages), not on the map or file
+size. Nothing after the areas is read.
+
+Example:
+    terrain = Counter()
+    for event in iter_events(file):
+        if isinstance(event, PlotEvent):
+            terrain[event.header["terrain_type"]] += 1
+"""
+
+import io
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterator, Optional, Union
+
+import attrs
+from construct import Container
+
+from .backends import Backend, get_backend
+from .decompressors import get_decompressor
+from .save_file import NotASaveFile, _FileInflater, _Inflater, _InflatingStream
+from .vanilla.plot_index import TruncatedPlot, _unpack_header, skip_plot
+from .vanilla.structure import PREFIX_SECTIONS
+
+# decompressed ahead of a plot record at first, doubled while it doesn't fit
+_LOOKAHEAD = 4096
+
+
+@attrs.define(slots=True)
+class SectionEvent:
+    """A section of `structure.SECTIONS` has been parsed."""
+
+    name: str
+    offset: int
+    """Byte index of the section in the decompressed save"""
+    fields: Container
+
+
+@attrs.define(slots=True)
+class PlotEvent:
+    """A plot record has been read."""
+
+    index: int
+    """Plot number, the plot is at (index % grid_width, index // grid_width)"""
+    offset: int
+    """Byte index of the record in the decompressed save"""
+    header: Dict[str, Any]
+    """Raw values of the fixed width fields, see `PlotIndex.header`"""
+
+
+Event = Union[SectionEvent, PlotEvent]
+
+
+def _parse_section(
+    backend: Backend, inflater: _Inflater, name: str, offset: int, parsed: Container
+) -> SectionEvent:
+    """Parse section `name` at `offset`, then drop the bytes before its end."""
+    stream = io.BufferedReader(_InflatingStream(inflater), _Inflater.STEP)
+    stream.seek(offset)
+    fields = backend.parse_section(b"", name, stream, parsed)
+    inflater.discard(stream.tell())
+    return SectionEvent(name, offset, fields)
+
+
+def _iter_plots(
+    inflater: _Inflater, offset: int, grid_width: int, grid_height: int
+) -> Generator[PlotEvent, None, int]:
+    """Yield every plot starting at `offset`, return where the last one ends."""
+    lookahead = _LOOKAHEAD
+    for n in range(grid_width * grid_height):
+        while True:
+            inflater.ensure(offset + lookahead)
+            pos = offset - inflater.offset
+            try:
+                end = skip_plot(inflater.data, pos)
+                break
+            except TruncatedPlot:
+                if inflater.done:
+                    raise
+                lookahead *= 2
+        header = _unpack_header(inflater.data, pos)
+        expected = (n % grid_width, n // grid_width)
+        if (header["x"], header["y"]) != expected:
+            raise ValueError(
+                f"plot {n} at byte {offset} is at ({header['x']}, {header['y']}), "
+                f"expected {expected}"
+            )
+        yield PlotEvent(n, offset, header)
+        offset += end - pos
+        if offset - inflater.offset > _Inflater.STEP:
+            inflater.discard(offset)
+    return offset
+
+
+def iter_events(
+    file: Union[str, Path],
+    plots: bool = True,
+    backend: Optional[str] = None,
+    decompressor: Optional[str] = None,
+) -> Iterator[Event]:
+    """Yield the events of `file` as it's decompressed, see the module docs.
+
+    Args:
+        file (str | Path): Save to scan.
+        plots (bool): Also yield the plots and the areas, otherwise stop after
+            the sections before them. Defaults to True.
+        backend (str | None): Name of the parser in `backends.BACKENDS`, see
+            `SaveFile`.
+        decompressor (str | None): Name of the zlib implementation in
+            `decompressors.DECOMPRESSORS`, see `SaveFile`.
+
+    Raises:
+        NotASaveFile: If `file` isn't a save file.
+        ValueError: If the plot records can't be walked, or there is no such
+            backend or decompressor.
+    """
+    parser = get_backend(backend)
+    zlib = get_decompressor(decompressor)
+    with open(file, "rb") as f:
+        try:
+            inflater = _FileInflater(f, zlib)
+        except Exception:
+            raise NotASaveFile(f"{file}")
+        parsed = Container()
+        offset = 0
+        for name in PREFIX_SECTIONS:
+            try:
+                event = _parse_section(parser, inflater, name, offset, parsed)
+            except Exception:
+                raise NotASaveFile(f"{file}")
+            # later sections only need grid_width and grid_height from these
+            if name == "map":
+                parsed.update(event.fields)
+            offset = inflater.offset
+            yield event
+        if not plots:
+            return
+        offset = yield from _iter_plots(
+            inflater, offset, parsed.grid_width, parsed.grid_height
+        )
+        try:
+            yield _parse_section(parser, inflater, "areas", offset, parsed)
+        except Exception:
+            raise NotASaveFile(f"{file}")
+
+
+def scan(
+    file: Union[str, Path],
+    on_section: Optional[Callable[[SectionEvent], Any]] = None,
+    on_plot: Optional[Callable[[PlotEvent], Any]] = None,
+    **kwargs: Any,
+) -> None:
+    """Call `on_section` and `on_plot` with the events of `file`.
+
+    Args:
+        file (str | Path): Save to scan.
+        on_section (Callable | None): Called with each `SectionEvent`.
+        on_plot (Callable | None): Called with each `PlotEvent`, the plots are
+            skipped if None.
+        **kwargs: `backend` and `decompressor`, see `iter_events`.
+
+    Raises:
+        NotASaveFile: If `file` isn't a save file.
+        ValueError: If the plot records can't be walked.
+    """
+    for event in iter_events(file, plots=on_plot is not None, **kwargs):
+        if isinstance(event, PlotEvent):
+            on_plot(event)  # type: ignore
+        elif on_section is not None:
+            on_section(event)
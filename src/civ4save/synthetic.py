@@ -0,0 +1,158 @@
+"""Generate saves of any size from a real one, for scaling benchmarks.
+
+The bundled saves top out at a few thousand plots. To see how parsing scales
+with the map size, the number of players, replay messages or deals, a real
+save (the template) is parsed with `CivBeyondSwordSave`, resized and built
+back with the same struct:
+
+- plots are the template's plots repeated in map order, with their x and y set
+  to the new positions
+- player slots are copies of the template's players, cycled
+- replay messages and deals are the template's, cycled, with the players of
+  dropped slots remapped onto the remaining ones
+
+Everything after the parsed struct (the remaining areas, units, cities, ...)
+is copied from the template as is, so only civ4save is guaranteed to read the
+result, not the game.
+"""
+import io
+from pathlib import Path
+from typing import List, Optional, Union
+
+from construct import Container
+
+from .save_file import (
+    MAGIC_NUMBER_BASE,
+    _compress_savefile,
+    _decompress_savefile,
+    _savefile_layout,
+)
+from .vanilla.structure import MAX_PLAYERS, SECTIONS, CivBeyondSwordSave
+
+# Fields of init_core and game with one value per player slot
+PLAYER_FIELDS = [
+    "leader_names",
+    "civ_descriptions",
+    "civ_short_descriptions",
+    "civ_adjectives",
+    "emails",
+    "smtp_hosts",
+    "white_flags",
+    "_mystery",
+    "flag_decals",
+    "civs",
+    "leaders",
+    "handicaps",
+    "colors",
+    "art_style",
+    "slot_statuses",
+    "slot_claims",
+    "playable_civs",
+    "minor_nation_civs",
+    "ai_player_rank",
+    "ai_player_score",
+]
+BARBARIAN = MAX_PLAYERS - 1
+
+
+def _cycle(items: List, count: int) -> List:
+    """Return the first `count` items of `items` repeated."""
+    if count and not items:
+        raise ValueError("the template has none to repeat")
+    return [items[n % len(items)] for n in range(count)]
+
+
+def _resize_plots(save: Container, width: int, height: int) -> None:
+    template = list(save.plots)
+    plots = []
+    for n, plot in enumerate(_cycle(template, width * height)):
+        plot = Container(plot)
+        plot.x, plot.y = n % width, n // width
+        plots.append(plot)
+    save.grid_width, save.grid_height = width, height
+    save.plots = plots
+
+
+def _resize_players(save: Container, count: int) -> List[int]:
+    """Fill the first `count` slots, return the new slot of each template slot."""
+    used = [n for n in range(BARBARIAN) if save.civs[n] != "NO_CIVILIZATION"]
+    if not 0 < count <= BARBARIAN:
+        raise ValueError(f"players must be between 1 and {BARBARIAN}, got {count}")
+    empty = [n for n in range(BARBARIAN) if n not in used]
+    if count < BARBARIAN and not empty:
+        raise ValueError("the template has no empty player slot to copy")
+    for field in PLAYER_FIELDS:
+        template = list(save[field])
+        values = list(template)
+        for n in range(BARBARIAN):
+            values[n] = template[used[n % len(used)] if n < count else empty[0]]
+        save[field] = values
+    save.teams = [n if n < count else save.teams[n] for n in range(MAX_PLAYERS)]
+    slots = list(range(MAX_PLAYERS))
+    for n in used:
+        slots[n] = n % count
+    return slots
+
+
+def _remap(player: int, slots: List[int]) -> int:
+    return slots[player] if 0 <= player < len(slots) else player
+
+
+def synthesize(
+    template: Union[str, Path],
+    grid_width: Optional[int] = None,
+    grid_height: Optional[int] = None,
+    players: Optional[int] = None,
+    replay_messages: Optional[int] = None,
+    deals: Optional[int] = None,
+) -> bytes:
+    """Return the contents of a save file made from `template` with a new size.
+
+    Args:
+        template (str | Path): Real save to copy.
+        grid_width (int | None): Map width in plots. Defaults to the template's.
+        grid_height (int | None): Map height in plots. Defaults to the
+            template's.
+        players (int | None): Number of players, not counting the barbarians.
+            Defaults to the template's.
+        replay_messages (int | None): Number of replay messages. Defaults to
+            the template's.
+        deals (int | None): Number of deals. Defaults to the template's.
+
+    Raises:
+        NotASaveFile: If `template` isn't a save file.
+        ValueError: If the template has no plots, replay messages or deals to
+            repeat, or `players` is out of range.
+    """
+    raw = Path(template).read_bytes()
+    data = _decompress_savefile(raw)
+    stream = io.BytesIO(data)
+    save = CivBeyondSwordSave.parse_stream(stream)
+    rest = data[stream.tell() :]
+    _, trailer = _savefile_layout(raw)
+
+    save.replay_messages = [Container(m) for m in save.replay_messages]
+    slots = list(range(MAX_PLAYERS))
+    if players is not None:
+        slots = _resize_players(save, players)
+    for message in save.replay_messages:
+        message.player = _remap(message.player, slots)
+    for deal in save.deals:
+        deal["first_player"] = _remap(deal["first_player"], slots)
+        deal["second_player"] = _remap(deal["second_player"], slots)
+    if grid_width is not None or grid_height is not None:
+        width = save.grid_width if grid_width is None else grid_width
+        height = save.grid_height if grid_height is None else grid_height
+        _resize_plots(save, width, height)
+    if replay_messages is not None:
+        save.replay_messages = _cycle(save.replay_messages, replay_messages)
+        save._sz_replay_messages = replay_messages
+    if deals is not None:
+        save.deals = [dict(d, _id=n) for n, d in enumerate(_cycle(save.deals, deals))]
+        save._sz_deals = deals
+
+    # the compressed chunks start after CvGameAI's flag and the first chunk
+    # length, which is parsed as `_game_ai_pad`
+    z_start = len(SECTIONS["init_core"].build(save)) + 8
+    save._bytes_to_zlib_magic_number = z_start - MAGIC_NUMBER_BASE
+    return _compress_savefile(CivBeyondSwordSave.build(save) + rest, z_start, trailer)
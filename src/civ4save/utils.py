@@ -7,16 +7,26 @@ from enum import Enum, EnumMeta
 from pathlib import Path
 from typing import Any, Dict, Iterator, Tuple, Union
 
+import attrs
 import xmltodict
 
+from . import export
+
 
 class CustomJsonEncoder(json.JSONEncoder):
-    """Enable serializing dataclasses and Enums."""
+    """Enable serializing dataclasses, attrs classes and Enums.
+
+    attrs classes go through `civ4save.export`, so they give the same JSON
+    (Enums by name, IntEnums included) and it's much faster for the classes in
+    `civ4save.objects`.
+    """
 
     def default(self, o: Any) -> Union[dict, str, json.JSONEncoder]:
         """Override default."""
         if is_dataclass(o):
             return asdict(o)
+        elif attrs.has(type(o)):
+            return export.to_jsonable(o)
         elif isinstance(o, Enum):
             return o.name
         return super().default(o)
@@ -0,0 +1,103 @@
+"""Compile the save structs with construct and cache the generated parsers.
+
+`Struct.compile()` generates a Python module specialised to the struct, which
+parses several times faster than the interpreted struct but takes a while to
+generate. The module source is cached on disk, keyed by everything it's
+generated from, so later runs only have to exec it. Anything going wrong falls
+back to the interpreted struct.
+
+Compiled structs are only used for parsing.
+"""
+import hashlib
+import os
+import sys
+import types
+import warnings
+from pathlib import Path
+from typing import Any, Optional
+
+import construct
+from construct import Construct
+
+from . import enums, structure
+
+CACHE_ENV = "CIV4SAVE_CACHE_DIR"
+
+
+def cache_dir() -> Path:
+    """Return the folder compiled parsers are cached in.
+
+    `CIV4SAVE_CACHE_DIR` if set, else `civ4save` in the user's cache folder.
+    """
+    if os.getenv(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV])
+    base = os.getenv("XDG_CACHE_HOME") or os.getenv("LOCALAPPDATA")
+    return Path(base or Path.home() / ".cache") / "civ4save"
+
+
+def _cache_key(name: str) -> str:
+    """Hash everything the generated source depends on."""
+    sha1 = hashlib.sha1()
+    sha1.update(f"{name} {construct.__version__} {sys.version}".encode())
+    sha1.update(f"{structure.MAX_PLAYERS}".encode())
+    for module in (structure, enums):
+        sha1.update(Path(module.__file__).read_bytes())  # type: ignore
+    return sha1.hexdigest()[:16]
+
+
+def cache_path(name: str) -> Path:
+    """Return the cache file of the compiled struct `name`."""
+    return cache_dir() / f"{name}-{_cache_key(name)}.py"
+
+
+def _load(source: str, filename: str, struct: Construct) -> Construct:
+    """Exec generated `source` the way `Construct.compile` does."""
+    module = types.ModuleType(Path(filename).stem)
+    exec(compile(source, filename, "exec"), module.__dict__)
+    compiled = module.compiled
+    compiled.source = source
+    compiled.module = module
+    compiled.defersubcon = struct
+    return compiled
+
+
+def compile_struct(name: str, struct: Construct, use_cache: bool = True) -> Construct:
+    """Return the compiled parser of `struct`, from the cache when possible.
+
+    The cache is keyed on `name` and the source of `structure.py`, so `name`
+    must always mean the same struct and that struct must be built only from
+    what `structure.py` defines.
+
+    Args:
+        name (str): Names the struct in the cache.
+        struct (Construct): Struct to compile.
+        use_cache (bool): Read and write the on disk cache. Defaults to True.
+
+    Returns:
+        Construct: The compiled struct, or `struct` itself if it can't be
+            compiled.
+    """
+    path: Optional[Path] = None
+    if use_cache:
+        try:
+            path = cache_path(name)
+            return _load(path.read_text(), str(path), struct)
+        except OSError:
+            pass
+        except Exception as ex:
+            warnings.warn(f"ignoring broken compiled parser cache {path}: {ex}")
+    try:
+        compiled: Any = struct.compile()
+    except Exception as ex:
+        warnings.warn(f"can't compile {name}, using the interpreted struct: {ex}")
+        return struct
+    # a parser calling back into struct instances can't be loaded from source
+    if path is not None and "linkedparsers[" not in compiled.source:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(compiled.source)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return compiled
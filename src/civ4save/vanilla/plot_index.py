@@ -0,0 +1,310 @@
+"""Walk the CvPlot records of a decompressed save without fully parsing them.
+
+Every plot record starts with a fixed width block (`plot_flag` through
+`yields`) followed by a dozen length prefixed arrays. Only the length prefixes
+are needed to find where the next record starts, so the walker reads those
+with `struct` and skips the array bodies. The resulting per-plot offsets make
+it possible to decode any single plot, or any subset of the fixed width fields
+for every plot, on demand.
+"""
+from __future__ import annotations
+
+import io
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+import attrs
+from construct import Construct, Enum
+
+from .structure import MAX_PLAYERS, MAX_TEAMS, CvPlot
+
+_CHAR = struct.Struct("<b")
+_INT = struct.Struct("<i")
+
+# (length prefix, element size) of each array following the fixed width block,
+# in the order they appear in `CvPlot`.
+_ARRAYS: List[Tuple[struct.Struct, int]] = [
+    (_CHAR, 4),  # culture
+    (_CHAR, 2),  # found_value
+    (_CHAR, 1),  # player_city_radius
+    (_CHAR, 4),  # plot_group
+    (_CHAR, 2),  # visibility
+    (_CHAR, 2),  # stolen_visibility
+    (_CHAR, 2),  # blockaded
+    (_CHAR, 1),  # revealed_owner
+    (_CHAR, 1),  # river_crossings
+    (_CHAR, 1),  # revealed
+    (_CHAR, 2),  # revealed_improvement_type
+    (_CHAR, 2),  # revealed_route_type
+    (_INT, 1),  # plot_script_data
+    (_INT, 2),  # build_progress
+]
+# (nested array count, element size) of culture_range_cities, invisible_visibles
+_NESTED_ARRAYS: List[Tuple[int, int]] = [(MAX_PLAYERS, 1), (MAX_TEAMS, 2)]
+_IDINFO_SIZE = 8
+# `struct` format -> `array` typecode of the same width (array's l/L are 8 bytes
+# on most 64 bit platforms, struct's standard sizes are always 4)
+_TYPECODES = {"?": "b", "b": "b", "h": "h", "H": "H", "l": "i", "L": "I"}
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class TruncatedPlot(ValueError):
+    """Raised when a plot record runs past the end of the data."""
+
+
+@attrs.define(slots=True, frozen=True)
+class PlotField:
+    """A fixed width field of `CvPlot` and where it lives in the record."""
+
+    name: str
+    offset: int
+    """Byte offset from the start of the plot record"""
+    size: int
+    subcon: Construct
+    fmt: str
+    """`struct` format of the raw value(s), used for columns"""
+
+
+def _format_of(subcon: Construct) -> str:
+    """Return the `struct` format string of a fixed width construct."""
+    count = getattr(subcon, "count", 1)
+    if count != 1:
+        subcon = subcon.subcon
+    if isinstance(subcon, Enum):
+        subcon = subcon.subcon
+    fmt = getattr(subcon, "fmtstr", "<?")  # Flag has no fmtstr
+    return f"<{count}{fmt[1:]}" if count != 1 else fmt
+
+
+def _plot_fields() -> Dict[str, PlotField]:
+    """Collect the fixed width fields at the start of `CvPlot`."""
+    fields = {}
+    offset = 0
+    for sc in CvPlot.subcons:
+        try:
+            size = sc.sizeof()
+        except Exception:
+            break
+        if size == 0:
+            # Tell
+            continue
+        fields[sc.name] = PlotField(
+            sc.name, offset, size, sc.subcon, _format_of(sc.subcon)
+        )
+        offset += size
+    return fields
+
+
+PLOT_FIELDS = _plot_fields()
+PLOT_HEADER_SIZE = sum(f.size for f in PLOT_FIELDS.values())
+
+# All the fixed width fields in one go, for `PlotIndex.header`
+_HEADER = struct.Struct("<" + "".join(f.fmt[1:] for f in PLOT_FIELDS.values()))
+
+
+def _header_slices() -> List[Tuple[str, int, int]]:
+    """Return (name, first value, number of values) of each field in `_HEADER`."""
+    slices = []
+    n = 0
+    for f in PLOT_FIELDS.values():
+        count = struct.calcsize(f.fmt) // struct.calcsize("<" + f.fmt[-1])
+        slices.append((f.name, n, count))
+        n += count
+    return slices
+
+
+_HEADER_SLICES = _header_slices()
+
+
+def _unpack_header(data: Buffer, pos: int) -> Dict[str, Any]:
+    values = _HEADER.unpack_from(data, pos)
+    return {
+        name: values[n] if count == 1 else list(values[n : n + count])
+        for name, n, count in _HEADER_SLICES
+    }
+
+
+def skip_plot(data: Buffer, pos: int) -> int:
+    """Return the byte index where the plot record starting at `pos` ends.
+
+    Raises:
+        ValueError: If a length prefix is negative.
+        TruncatedPlot: If the record runs past the end of `data`.
+    """
+    start = pos
+    pos += PLOT_HEADER_SIZE
+    try:
+        for prefix, item_size in _ARRAYS:
+            (sz,) = prefix.unpack_from(data, pos)
+            if sz < 0:
+                raise ValueError(f"negative array length in plot at byte {start}")
+            pos += prefix.size + sz * item_size
+        for count, item_size in _NESTED_ARRAYS:
+            (sz,) = _CHAR.unpack_from(data, pos)
+            pos += 1
+            if sz > 0:
+                for _ in range(count):
+                    (sz,) = _INT.unpack_from(data, pos)
+                    pos += 4 + max(sz, 0) * item_size
+        (sz_units,) = _INT.unpack_from(data, pos)
+    except struct.error:
+        raise TruncatedPlot(f"plot at byte {start} runs past end of data")
+    if sz_units < 0:
+        raise ValueError(f"negative units length in plot at byte {start}")
+    pos += 4 + sz_units * _IDINFO_SIZE
+    if pos > len(data):
+        raise TruncatedPlot(f"plot at byte {start} runs past end of data")
+    return pos
+
+
+def decode_columns(
+    data: Buffer, starts: Sequence[int], names: Iterable[str]
+) -> Dict[str, array]:
+    """Return `PlotIndex.column` of each of `names` for the plots at `starts`.
+
+    `data` can be any buffer, such as the memoryview of a shared memory block.
+    """
+    columns = {}
+    for name in names:
+        f = PLOT_FIELDS[name]
+        unpack = struct.Struct(f.fmt).unpack_from
+        column = array(_TYPECODES[f.fmt[-1]])
+        for start in starts:
+            column.extend(unpack(data, start + f.offset))
+        columns[name] = column
+    return columns
+
+
+def walk_plots(data: bytes, start: int, num_plots: int) -> array:
+    """Return the record boundaries of `num_plots` consecutive plots.
+
+    Plot `n` spans `data[offsets[n]:offsets[n + 1]]`, so the returned array
+    has `num_plots + 1` entries.
+    """
+    offsets = array("q", [start])
+    pos = start
+    for _ in range(num_plots):
+        pos = skip_plot(data, pos)
+        offsets.append(pos)
+    return offsets
+
+
+class PlotIndex:
+    """Per-plot byte offsets into a decompressed save.
+
+    Plots are stored row by row, so the plot at (x, y) is record
+    `grid_width * y + x`.
+    """
+
+    def __init__(
+        self, data: bytes, start: int, grid_width: int, grid_height: int
+    ) -> None:
+        """Walk the plot records beginning at byte `start` of `data`.
+
+        Args:
+            data (bytes): Decompressed save file.
+            start (int): Byte index of the first plot record.
+            grid_width (int): Width of the map.
+            grid_height (int): Height of the map.
+        """
+        self.data = data
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.offsets = walk_plots(data, start, grid_width * grid_height)
+
+    @classmethod
+    def from_offsets(
+        cls, data: bytes, offsets: array, grid_width: int, grid_height: int
+    ) -> PlotIndex:
+        """Create from already known record boundaries, skipping the walk."""
+        if len(offsets) != grid_width * grid_height + 1:
+            raise ValueError("offsets don't match grid size")
+        index = cls.__new__(cls)
+        index.data = data
+        index.grid_width = grid_width
+        index.grid_height = grid_height
+        index.offsets = offsets
+        return index
+
+    def __len__(self) -> int:
+        """Return number of plots."""
+        return len(self.offsets) - 1
+
+    @property
+    def start(self) -> int:
+        """Byte index of the first plot record."""
+        return self.offsets[0]
+
+    @property
+    def end(self) -> int:
+        """Byte index just past the last plot record."""
+        return self.offsets[-1]
+
+    def span(self, idx: int) -> Tuple[int, int]:
+        """Return the (start, end) byte range of plot `idx`."""
+        if not 0 <= idx < len(self):
+            raise IndexError(f"plot index {idx} out of range")
+        return self.offsets[idx], self.offsets[idx + 1]
+
+    def record(self, idx: int) -> bytes:
+        """Return the raw bytes of plot `idx`."""
+        start, end = self.span(idx)
+        return self.data[start:end]
+
+    def parse(self, idx: int) -> Any:
+        """Fully parse plot `idx` with `CvPlot`, same as the main struct would."""
+        start, _ = self.span(idx)
+        stream = io.BytesIO(self.data)
+        stream.seek(start)
+        return CvPlot.parse_stream(
+            stream, grid_width=self.grid_width, grid_height=self.grid_height
+        )
+
+    def fields(self, idx: int, *names: str) -> Dict[str, Any]:
+        """Decode only the named fields of plot `idx`.
+
+        Fixed width fields are decoded straight from their offset, anything
+        else falls back to parsing the whole record.
+        """
+        start, _ = self.span(idx)
+        if all(n in PLOT_FIELDS for n in names):
+            values = {}
+            for n in names:
+                f = PLOT_FIELDS[n]
+                offset = start + f.offset
+                values[n] = f.subcon.parse(self.data[offset : offset + f.size])
+            return values
+        parsed = self.parse(idx)
+        return {n: parsed[n] for n in names}
+
+    def header(self, idx: int) -> Dict[str, Any]:
+        """Return the raw (integer) values of the fixed width fields of plot `idx`.
+
+        Unlike `fields` enums aren't decoded, which makes this the fastest way
+        to read a plot.
+        """
+        start, _ = self.span(idx)
+        return _unpack_header(self.data, start)
+
+    def iter_headers(self) -> Iterator[Dict[str, Any]]:
+        """Yield `header` of every plot in order."""
+        data = self.data
+        for start in self.offsets[:-1]:
+            yield _unpack_header(data, start)
+
+    def column(self, name: str) -> array:
+        """Return the raw values of a fixed width field for every plot.
+
+        Enums are left as their integer values and multi-value fields (yields)
+        are flattened, `len(column) == len(self) * count`. The array item size
+        matches the field width so it can be handed to other libraries as is.
+        """
+        return decode_columns(self.data, self.offsets[:-1], [name])[name]
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        """Iterate the (start, end) byte range of every plot."""
+        offsets = self.offsets
+        for n in range(len(self)):
+            yield offsets[n], offsets[n + 1]
@@ -0,0 +1,61 @@
+"""Read the CvReplayMessage records of a decompressed save with `struct`.
+
+A replay message is five INTs, a length prefixed UTF-16 string and one more INT
+(`ReplayMessage` in `structure`). Decoding them with construct is most of the
+time it takes to parse the sections before the plots, so the readers that care
+about speed unpack the raw values here instead and name the enums themselves.
+"""
+import struct
+from typing import List, Tuple
+
+from .plot_index import Buffer
+
+REPLAY_HEAD = struct.Struct("<6i")  # turn, type, plot_x, plot_y, player, _sz
+_INT = struct.Struct("<i")
+
+RawReplayMessage = Tuple[int, int, int, int, int, str, int]
+"""turn, type, plot_x, plot_y, player, text, e_color"""
+
+
+def read_replay_messages(
+    data: Buffer, pos: int, skip: int = 0
+) -> Tuple[List[RawReplayMessage], int]:
+    """Read the replay_messages section starting at byte `pos` of `data`.
+
+    Args:
+        data (Buffer): Decompressed save.
+        pos (int): Start of the section.
+        skip (int): The first `skip` messages are only stepped over, not
+            decoded or returned. Defaults to 0.
+
+    Returns:
+        Tuple[List[RawReplayMessage], int]: The raw values of every message,
+            and the byte index where the section ends.
+
+    Raises:
+        struct.error: If the section runs past the end of `data`.
+    """
+    (count,) = _INT.unpack_from(data, pos)
+    pos += _INT.size
+    messages = []
+    for n in range(count):
+        turn, type_, plot_x, plot_y, player, size = REPLAY_HEAD.unpack_from(data, pos)
+        start = pos + REPLAY_HEAD.size
+        pos = start + size * 2 + _INT.size
+        if n < skip:
+            continue
+        text = bytes(data[start : pos - _INT.size]).decode("utf_16_le").rstrip("\x00")
+        (color,) = _INT.unpack_from(data, pos - _INT.size)
+        messages.append((turn, type_, plot_x, plot_y, player, text, color))
+    return messages, pos
+
+
+def replay_message_count(data: Buffer, pos: int) -> int:
+    """Return the number of messages of the replay_messages section at `pos`."""
+    (count,) = _INT.unpack_from(data, pos)
+    return count
+
+
+def replay_messages_end(data: Buffer, pos: int) -> int:
+    """Return where the replay_messages section at `pos` ends, decoding nothing."""
+    return read_replay_messages(data, pos, replay_message_count(data, pos))[1]
@@ -3,17 +3,21 @@
 Notes:
     - Everything is little endian bc x86.
 """
+
+import abc
 import os
 from enum import EnumMeta
-from typing import Any, Dict, Iterable, List, Union
+from typing import IO, Any, Dict, Iterable, List, Union
 
+import construct
 from construct import (
     Adapter,
     Array,
+    Bytes,
     Computed,
+    Construct,
     Enum,
     Flag,
-    GreedyRange,
     IfThenElse,
     Int8sl,
     Int8ul,
@@ -21,13 +25,13 @@ from construct import (
     Int16ul,
     Int32sl,
     Int32ul,
-    LazyArray,
-    PaddedString,
-    Padding,
+    ListContainer,
     Pass,
-    StopIf,
+    RangeError,
+    StringEncoded,
     Struct,
     Tell,
+    ValidationError,
     this,
 )
 
@@ -39,6 +43,112 @@ MAX_PLAYERS = int(os.getenv("MAX_PLAYERS", 19))
 MAX_TEAMS = MAX_PLAYERS
 NUM_YIELD_TYPES = 3
 
+# Names the code generated by `_emitparse` below can use
+_COMPILED_IMPORTS = """
+    from civ4save.vanilla import enums as civ4save_enums
+    from civ4save.vanilla import structure as civ4save_structure
+
+    def civ4save_read_padded(io, length, encoding):
+        data = io.read(length)
+        if len(data) != length:
+            raise StreamError(f"expected {length} bytes, found {len(data)}")
+        return data.decode(encoding).rstrip("\\x00")
+"""
+
+
+# Versions of construct classes that `Struct.compile()` turns into plain Python
+# instead of calling back into the interpreted instance.
+class PaddedString(StringEncoded):
+    """`construct.PaddedString` that compiles to a single read and decode."""
+
+    def __init__(self, length: Any, encoding: str) -> None:  # noqa: D107
+        super().__init__(construct.PaddedString(length, encoding).subcon, encoding)
+        self.length = length
+
+    def _emitparse(self, code: Any) -> str:
+        code.append(_COMPILED_IMPORTS)
+        return f"civ4save_read_padded(io, {self.length}, {self.encoding!r})"
+
+
+class LazyArray(construct.LazyArray):
+    """`construct.LazyArray` that compiles to an eager `Array`.
+
+    Elements are only skipped without parsing when interpreted, compiled
+    parsing is fast enough to not need it.
+    """
+
+    def _emitparse(self, code: Any) -> str:
+        return Array(self.count, self.subcon)._emitparse(code)
+
+
+class PlotArray(Array):
+    """Exactly `grid_width * grid_height` plots, each checked to be in map order.
+
+    Plots are written row by row, so plot `n` must be at
+    `(n % grid_width, n // grid_width)`. A plot anywhere else means the records
+    before it were misparsed, which raises instead of returning garbage.
+    """
+
+    def __init__(self, subcon: Construct) -> None:  # noqa: D107
+        super().__init__(this.grid_width * this.grid_height, subcon)
+
+    def _parse(self, stream: IO[bytes], context: Any, path: str) -> List:
+        width, height = context.grid_width, context.grid_height
+        if width < 0 or height < 0:
+            raise RangeError(f"invalid map size {width}x{height}", path=path)
+        plots = ListContainer()
+        for n in range(width * height):
+            context._index = n
+            plot = self.subcon._parsereport(stream, context, path)
+            check_plot_position(plot, n, width)
+            plots.append(plot)
+        return plots
+
+    def _emitparse(self, code: Any) -> str:
+        code.append(_COMPILED_IMPORTS)
+        fname = f"parse_plots_{code.allocateId()}"
+        code.append(f"""
+            def {fname}(io, this):
+                width, height = this['grid_width'], this['grid_height']
+                if width < 0 or height < 0:
+                    raise RangeError(f"invalid map size {{width}}x{{height}}")
+                plots = ListContainer()
+                for n in range(width * height):
+                    plot = {self.subcon._compileparse(code)}
+                    civ4save_structure.check_plot_position(plot, n, width)
+                    plots.append(plot)
+                return plots
+        """)
+        return f"{fname}(io, this)"
+
+
+def check_plot_position(plot: Any, n: int, width: int) -> None:
+    """Raise `ValidationError` unless `plot` is the `n`th plot of the map."""
+    expected = (n % width, n // width)
+    if (plot.x, plot.y) != expected:
+        raise ValidationError(
+            f"plot {n} at byte {plot._plot_start_index} is at "
+            f"({plot.x}, {plot.y}), expected {expected}"
+        )
+
+
+class CompilableAdapter(Adapter, metaclass=abc.ABCMeta):
+    """Adapter whose decoding can be inlined by `Struct.compile()`.
+
+    Subclasses implement `_emitdecode`, returning the source of an expression
+    equal to `_decode` of the parsed `obj`. The expression can use the modules
+    `civ4save_enums` and `civ4save_structure`.
+    """
+
+    @abc.abstractmethod
+    def _emitdecode(self, obj: str) -> str:
+        """Return the source of `_decode` applied to the expression `obj`."""
+
+    def _emitparse(self, code: Any) -> str:
+        code.append(_COMPILED_IMPORTS)
+        return self._emitdecode(f"({self.subcon._compileparse(code)})")
+
+
 # Type Aliases
 INT = Int32sl
 UINT = Int32ul
@@ -60,28 +170,53 @@ CHAR_FLAG_ARRAY = Struct("_sz" / CHAR, "arr" / Flag[this._sz])
 INT_SHORT_ARRAY = Struct("_sz" / INT, "arr" / SHORT[this._sz])
 
 
-class StringAdapter(Adapter):
+def _encode_string(string: str, wide: bool) -> Dict[str, Any]:
+    """Return the fields of `WSTRING` (if `wide`) or `STRING` holding `string`."""
+    if wide:
+        return dict(_sz=len(string.encode("utf_16_le")) // 2, string=string)
+    return dict(_sz=len(string.encode("utf_8")), string=string)
+
+
+class StringAdapter(CompilableAdapter):
     """Just want the actual string don't care about _sz."""
 
     def _decode(self, obj: Any, *args: Any) -> str:
         return obj.string
 
+    def _encode(self, obj: str, *args: Any) -> Dict[str, Any]:
+        return _encode_string(obj, self.subcon is WSTRING)
 
-class WStringArrayAdapter(Adapter):
-    """Eventually need to support _encode."""
+    def _emitdecode(self, obj: str) -> str:
+        return f"{obj}['string']"
+
+
+class WStringArrayAdapter(CompilableAdapter):
+    """Array of `WSTRING` as a list of str."""
 
     def _decode(self, obj: Iterable, *args: Any) -> List[str]:
         return [s.string for s in obj]
 
+    def _encode(self, obj: Iterable[str], *args: Any) -> List[Dict[str, Any]]:
+        return [_encode_string(s, wide=True) for s in obj]
+
+    def _emitdecode(self, obj: str) -> str:
+        return f"[s['string'] for s in {obj}]"
 
-class StringArrayAdapter(Adapter):
-    """Eventually need to support _encode."""
+
+class StringArrayAdapter(CompilableAdapter):
+    """Array of `STRING` as a list of str."""
 
     def _decode(self, obj: Iterable, *args: Any) -> List[str]:
         return [s.string for s in obj]
 
+    def _encode(self, obj: Iterable[str], *args: Any) -> List[Dict[str, Any]]:
+        return [_encode_string(s, wide=False) for s in obj]
+
+    def _emitdecode(self, obj: str) -> str:
+        return f"[s['string'] for s in {obj}]"
 
-class EnumArrayAdapter(Adapter):
+
+class EnumArrayAdapter(CompilableAdapter):
     """Make Enum arrays more useful.
 
     Used when an array is of len(Enum) and each element of the array is a value
@@ -97,44 +232,130 @@ class EnumArrayAdapter(Adapter):
         return {self._enum(n): val for n, val in enumerate(obj)}
 
     def _encode(self, obj: Dict, *args: Any) -> List[int]:
-        # TODO: ensure sorted by enum value writing same order as read
-        return [v for k, v in list(obj.items())]
+        # written in the order read, whatever order the dict is in
+        return [obj[k] for k in sorted(obj, key=int)]
+
+    def _emitdecode(self, obj: str) -> str:
+        enum = f"civ4save_enums.{self._enum.__name__}"
+        return f"{{{enum}(n): val for n, val in enumerate({obj})}}"
+
 
+def _decode_vote_outcomes(obj: Iterable) -> Dict:
+    return {e.VoteType(n): e.PlayerVoteType(val) for n, val in enumerate(obj)}
 
-class VoteOutcomeAdapter(Adapter):
+
+class VoteOutcomeAdapter(CompilableAdapter):
     """VoteOutcome is a hash map in the source code."""
 
     def _decode(self, obj: Iterable, *args: Any) -> Dict:
-        return {e.VoteType(n): e.PlayerVoteType(val) for n, val in enumerate(obj)}
+        return _decode_vote_outcomes(obj)
+
+    def _encode(self, obj: Dict, *args: Any) -> List[int]:
+        return [int(obj[k]) for k in sorted(obj, key=int)]
+
+    def _emitdecode(self, obj: str) -> str:
+        return f"civ4save_structure._decode_vote_outcomes({obj})"
+
+
+def _process_trades(trades: List[Any]) -> List[dict]:
+    player_trades = []
+    for trade in trades:
+        amount = 1
+        item: Union[e.BonusType, e.TradeableItem] = e.TradeableItem[trade.item]
+        if item.name in {"TRADE_GOLD", "TRADE_GOLD_PER_TURN"}:
+            amount = trade.extra_data
+        elif item.name == "TRADE_RESOURCES":
+            item = e.BonusType(trade.extra_data)
+        player_trades.append(dict(item=item, amount=amount))
+    return player_trades
+
+
+_TRADE_DEFAULTS = dict(extra_data=0, offering=False, hidden=False, _pad=bytes(2))
+
+
+def _raw_trades(trades: List[Any]) -> List[Dict[str, Any]]:
+    return [dict({k: t[k] for k in _TRADE_DEFAULTS}, item=str(t.item)) for t in trades]
+
+
+def _decode_deals(obj: Iterable) -> List:
+    deals = []
+    for deal in obj:
+        trade_deal = dict(
+            first_player=deal.first_player,
+            second_player=deal.second_player,
+            initial_game_turn=deal.initial_game_turn,
+            first_trades=_process_trades(deal.first_trades),
+            second_trades=_process_trades(deal.second_trades),
+            # what _process_trades drops, for _encode_deals
+            _flag=deal._flag,
+            _id=deal.id,
+            _first_trades=_raw_trades(deal.first_trades),
+            _second_trades=_raw_trades(deal.second_trades),
+        )
+        deals.append(trade_deal)
+    return deals
+
+
+def _encode_trades(trades: List[dict], raw: List[Dict[str, Any]]) -> List[Dict]:
+    encoded = []
+    for n, trade in enumerate(trades):
+        item = trade["item"]
+        if isinstance(item, e.BonusType):
+            item = e.TradeableItem.TRADE_RESOURCES
+        fields = dict(_TRADE_DEFAULTS, item=item.name)
+        if n < len(raw) and raw[n]["item"] == item.name:
+            fields.update(raw[n])
+        if isinstance(trade["item"], e.BonusType):
+            fields["extra_data"] = int(trade["item"])
+        elif item.name in {"TRADE_GOLD", "TRADE_GOLD_PER_TURN"}:
+            fields["extra_data"] = trade["amount"]
+        encoded.append(fields)
+    return encoded
+
+
+def _encode_deals(deals: Iterable[dict]) -> List[Dict[str, Any]]:
+    """Inverse of `_decode_deals`.
+
+    Deals decoded from a save are rebuilt exactly. Deals made from scratch, or
+    trades whose item changed, get defaults for what `_process_trades` drops:
+    the deal's index as its id, False offering and hidden flags and 0 extra
+    data for items other than gold and resources.
+    """
+    encoded = []
+    for n, deal in enumerate(deals):
+        first_trades = _encode_trades(
+            deal["first_trades"], deal.get("_first_trades", [])
+        )
+        second_trades = _encode_trades(
+            deal["second_trades"], deal.get("_second_trades", [])
+        )
+        encoded.append(
+            dict(
+                _flag=deal.get("_flag", 0),
+                id=deal.get("_id", n),
+                initial_game_turn=deal["initial_game_turn"],
+                first_player=deal["first_player"],
+                second_player=deal["second_player"],
+                _sz_first_trades=len(first_trades),
+                first_trades=first_trades,
+                _sz_second_trades=len(second_trades),
+                second_trades=second_trades,
+            )
+        )
+    return encoded
 
 
-class DealsAdapter(Adapter):
+class DealsAdapter(CompilableAdapter):
     """The traded item could be a BonusType or TradeableItem."""
 
     def _decode(self, obj: Iterable, *args: Any) -> List:
-        def _process_trades(trades: List[Any]) -> List[dict]:
-            player_trades = []
-            for trade in trades:
-                amount = 1
-                item: Union[e.BonusType, e.TradeableItem] = e.TradeableItem[trade.item]
-                if item.name in {"TRADE_GOLD", "TRADE_GOLD_PER_TURN"}:
-                    amount = trade.extra_data
-                elif item.name == "TRADE_RESOURCES":
-                    item = e.BonusType(trade.extra_data)
-                player_trades.append(dict(item=item, amount=amount))
-            return player_trades
-
-        deals = []
-        for deal in obj:
-            trade_deal = dict(
-                first_player=deal.first_player,
-                second_player=deal.second_player,
-                initial_game_turn=deal.initial_game_turn,
-                first_trades=_process_trades(deal.first_trades),
-                second_trades=_process_trades(deal.second_trades),
-            )
-            deals.append(trade_deal)
-        return deals
+        return _decode_deals(obj)
+
+    def _encode(self, obj: Iterable, *args: Any) -> List:
+        return _encode_deals(obj)
+
+    def _emitdecode(self, obj: str) -> str:
+        return f"civ4save_structure._decode_deals({obj})"
 
 
 CvPlot = Struct(
@@ -142,8 +363,6 @@ CvPlot = Struct(
     "plot_flag" / UINT,
     "x" / SHORT,
     "y" / SHORT,
-    # check to avoid the plots array bug
-    StopIf(this._.grid_width == (this.x - 1) and this._.grid_height == (this.y - 1)),
     "area_id" / INT,
     "feature_variety" / SHORT,
     "ownership_duration" / SHORT,
@@ -200,7 +419,8 @@ CvPlot = Struct(
             # this._._sz_culture_range_cities,
             MAX_PLAYERS,
             Struct(
-                "_sz_crc" / INT, IfThenElse(this._sz_crc > 0, CHAR[this._sz_crc], Pass)
+                "_sz_crc" / INT,
+                "values" / IfThenElse(this._sz_crc > 0, CHAR[this._sz_crc], Pass),
             ),
         ),
         Pass,
@@ -213,7 +433,8 @@ CvPlot = Struct(
             # this._._sz_invisible_visibility,
             MAX_TEAMS,
             Struct(
-                "_sz_iv" / INT, IfThenElse(this._sz_iv > 0, SHORT[this._sz_iv], Pass)
+                "_sz_iv" / INT,
+                "values" / IfThenElse(this._sz_iv > 0, SHORT[this._sz_iv], Pass),
             ),
         ),
         Pass,
@@ -229,9 +450,8 @@ TradeData = Struct(
     "item" / Enum(INT, e.TradeableItem),
     "extra_data" / INT,  # could be BonusType or amount of gold/turn
     "offering" / Flag,
-    Padding(1),
     "hidden" / Flag,
-    Padding(1),
+    "_pad" / Bytes(2),  # uninitialized, kept to rebuild the same bytes
 )
 
 # used in vote_selections and votes_triggered structs
@@ -243,8 +463,12 @@ VoteOption = Struct(
     "text" / StringAdapter(WSTRING),
 )
 
-# main Struct
-CivBeyondSwordSave = Struct(
+# Top level sections of the save, in file order. Each section only refers to its
+# own fields (except plots which needs grid_width and grid_height from CvMap) so
+# it can also be parsed on its own from its offset.
+
+# Uncompressed header and CvInitCore
+CvInitCore = Struct(
     "version" / INT,
     "_save_bits" / Array(8, INT),
     "_bytes_to_zlib_magic_number" / INT,
@@ -300,6 +524,10 @@ CivBeyondSwordSave = Struct(
     "slot_claims" / INT[MAX_PLAYERS],
     "playable_civs" / Flag[MAX_PLAYERS],
     "minor_nation_civs" / Flag[MAX_PLAYERS],
+)
+
+# CvGameAI and the start of CvGame
+CvGame = Struct(
     # BEGIN CvGameAI
     "_game_ai_flag" / UINT,
     "_game_ai_pad" / INT,
@@ -376,6 +604,10 @@ CivBeyondSwordSave = Struct(
     "cities_destroyed" / WStringArrayAdapter(WSTRING[this._sz_cities_destroyed]),
     "_sz_gp_born" / INT,
     "great_people_born" / WStringArrayAdapter(WSTRING[this._sz_gp_born]),
+)
+
+# CvGame deals free list
+CvDeals = Struct(
     "_deals_num_slots" / INT,
     "_deals_last_index" / INT,
     "_deals_free_list_head" / INT,
@@ -400,6 +632,10 @@ CivBeyondSwordSave = Struct(
             ),
         )
     ),
+)
+
+# CvGame vote selection and triggered vote free lists
+CvVotes = Struct(
     "_vote_selections_num_slots" / INT,
     "_vote_selections_last_index" / INT,
     "_vote_selections_free_list_head" / INT,
@@ -435,20 +671,25 @@ CivBeyondSwordSave = Struct(
     ),
     "map_random_seed" / UINT,
     "soren_random_seed" / UINT,
+)
+
+# CvGame replay messages
+ReplayMessage = Struct(
+    "turn" / INT,
+    "type" / Enum(INT, e.ReplayMessageType),
+    "plot_x" / INT,
+    "plot_y" / INT,
+    "player" / INT,
+    "text" / StringAdapter(WSTRING),
+    "e_color" / Enum(INT, e.ColorValsType),
+)
+CvReplayMessages = Struct(
     "_sz_replay_messages" / INT,
-    "replay_messages"
-    / LazyArray(
-        this._sz_replay_messages,
-        Struct(
-            "turn" / INT,
-            "type" / Enum(INT, e.ReplayMessageType),
-            "plot_x" / INT,
-            "plot_y" / INT,
-            "player" / INT,
-            "text" / StringAdapter(WSTRING),
-            "e_color" / Enum(INT, e.ColorValsType),
-        ),
-    ),
+    "replay_messages" / LazyArray(this._sz_replay_messages, ReplayMessage),
+)
+
+# Rest of CvGame
+CvGameMisc = Struct(
     "num_sessions" / INT,
     "_sz_plot_extra_yields" / INT,
     "plot_extra_yields"
@@ -498,7 +739,10 @@ CivBeyondSwordSave = Struct(
     ),
     "num_culture_victory_cities" / INT,
     "culture_victory_level" / Enum(INT, e.CultureLevelType),
-    # BEGIN CvMap
+)
+
+# CvMap up to the plots
+CvMap = Struct(
     "_map_flag" / UINT,
     "_map_unknown" / CHAR[8],
     "grid_width" / INT,
@@ -513,13 +757,15 @@ CivBeyondSwordSave = Struct(
     "bonus_counts" / EnumArrayAdapter(e.BonusType, INT[get_enum_length(e.BonusType)]),
     "bonus_counts_on_land"
     / EnumArrayAdapter(e.BonusType, INT[get_enum_length(e.BonusType)]),
-    "plots" / GreedyRange(CvPlot),
-    # raise StopFieldError if len(plots) != grid_width * grid_height
-    StopIf(
-        (this.plots[-1].x, this.plots[-1].y)  # type:ignore
-        != (this.grid_width - 1, this.grid_height - 1)
-    ),
-    # BEGIN CvArea
+)
+
+# CvMap plots
+CvPlots = Struct(
+    "plots" / PlotArray(CvPlot),
+)
+
+# CvArea
+CvAreas = Struct(
     "_areas_num_slots" / INT,
     "_areas_last_index" / INT,
     "_areas_free_list_head" / INT,
@@ -569,3 +815,63 @@ CivBeyondSwordSave = Struct(
         ),
     ),
 )
+
+SECTIONS: Dict[str, Struct] = {
+    "init_core": CvInitCore,
+    "game": CvGame,
+    "deals": CvDeals,
+    "votes": CvVotes,
+    "replay_messages": CvReplayMessages,
+    "game_misc": CvGameMisc,
+    "map": CvMap,
+    "plots": CvPlots,
+    "areas": CvAreas,
+}
+
+
+def _with_offsets(sections: Iterable[str]) -> List[Construct]:
+    """Concat the subcons of `sections`, each preceded by a `Tell` of its offset."""
+    subcons: List[Construct] = []
+    for name in sections:
+        subcons.append(f"_{name}_offset" / Tell)
+        subcons.extend(SECTIONS[name].subcons)
+    return subcons
+
+
+def section_struct(name: str, context: Iterable[str] = ()) -> Struct:
+    """Return section `name` as a struct of its own.
+
+    Args:
+        name (str): Key of `SECTIONS`.
+        context (Iterable[str]): Fields from earlier sections the section
+            depends on, plots needs grid_width and grid_height. They're read
+            from the context passed to `parse_stream`.
+    """
+    return Struct(
+        *(key / Computed(this._[key]) for key in context),
+        *SECTIONS[name].subcons,
+    )
+
+
+def parse_section(name: str, stream: IO[bytes], **context: Any) -> Any:
+    """Parse section `name` starting at the current position of `stream`.
+
+    Args:
+        name (str): Key of `SECTIONS`.
+        stream (IO[bytes]): Decompressed save, positioned at the section offset.
+        **context: Fields from earlier sections the section depends on, plots
+            needs grid_width and grid_height.
+    """
+    return section_struct(name, context).parse_stream(stream, **context)
+
+
+# main Struct
+CivBeyondSwordSave = Struct(*_with_offsets(SECTIONS))
+
+# Everything before the first plot record. Enough to find the plots and walk
+# them with `plot_index.PlotIndex` without parsing the whole save.
+PREFIX_SECTIONS = list(SECTIONS)[: list(SECTIONS).index("plots")]
+CivBeyondSwordSavePrefix = Struct(
+    *_with_offsets(PREFIX_SECTIONS),
+    "_plots_offset" / Tell,
+)
@@ -0,0 +1,322 @@
+"""Watch a saves folder and parse every new autosave as soon as it's written.
+
+Consecutive autosaves of a game share most of their bytes. `IncrementalParser`
+keeps the sections of the previous save and only parses the ones that changed:
+a section whose bytes are identical is reused as is, and replay messages, which
+are only ever appended to, are only parsed from the first new message. Plots
+are compared record by record so only the plots that changed are published.
+
+The folder is polled rather than watched with inotify to stay portable and
+dependency free, a save is parsed once its size and mtime are unchanged for one
+poll interval so half written files are never read.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from construct import ConstructError, Container
+
+from . import export
+from .archive import settings_key
+from .objects import GameState, Plot, Settings, get_players
+from .save_file import NotASaveFile, _read_savefile
+from .vanilla.plot_index import PlotIndex
+from .vanilla.structure import PREFIX_SECTIONS, ReplayMessage, parse_section
+
+SAVE_SUFFIX = ".CivBeyondSwordSave"
+
+Event = Dict[str, Any]
+Publisher = Callable[[Event], None]
+
+_INT = struct.Struct("<i")
+
+MAX_PENDING = 4 * 1024 * 1024
+"""Bytes queued for a socket client before it's dropped as too slow"""
+
+
+def _strip_io(parsed: Container) -> Container:
+    """Drop the stream construct keeps in `_io` so old saves can be freed."""
+    parsed.pop("_io", None)
+    return parsed
+
+
+class IncrementalParser:
+    """Parse consecutive saves of a game, reusing what didn't change."""
+
+    def __init__(self) -> None:  # noqa: D107
+        self._sections: Dict[str, Tuple[bytes, Container]] = {}
+        self._messages = b""
+        self._replay: List[Container] = []
+        self._plots: Optional[Tuple[bytes, PlotIndex]] = None
+        self._game: Optional[str] = None
+
+    def _parse_replay(self, data: bytes, stream: IO[bytes]) -> Tuple[Container, bool]:
+        """Parse replay messages, only decoding those added since the last save."""
+        start = stream.tell()
+        (count,) = _INT.unpack_from(data, start)
+        pos = start + _INT.size
+        old = self._messages
+        reused = bool(old) and count >= len(self._replay) and data.startswith(old, pos)
+        if reused:
+            messages = list(self._replay)
+            stream.seek(pos + len(old))
+        else:
+            messages = []
+            stream.seek(pos)
+        for _ in range(count - len(messages)):
+            messages.append(_strip_io(ReplayMessage.parse_stream(stream)))
+        self._messages = data[pos : stream.tell()]
+        self._replay = messages
+        return Container(_sz_replay_messages=count, replay_messages=messages), reused
+
+    def parse_prefix(self, data: bytes) -> Tuple[Container, List[str]]:
+        """Parse everything before the plots of the decompressed save `data`.
+
+        Returns:
+            Tuple[Container, List[str]]: Same fields as parsing
+                `CivBeyondSwordSavePrefix` and the names of the sections reused
+                from the previous save.
+        """
+        stream = io.BytesIO(data)
+        prefix = Container()
+        reused = []
+        for name in PREFIX_SECTIONS:
+            start = stream.tell()
+            if name == "replay_messages":
+                parsed, was_reused = self._parse_replay(data, stream)
+            else:
+                prev = self._sections.get(name)
+                was_reused = prev is not None and data.startswith(prev[0], start)
+                if prev is not None and was_reused:
+                    parsed = prev[1]
+                    stream.seek(start + len(prev[0]))
+                else:
+                    parsed = _strip_io(parse_section(name, stream))
+                    self._sections[name] = (data[start : stream.tell()], parsed)
+            if was_reused:
+                reused.append(name)
+            prefix[f"_{name}_offset"] = start
+            prefix.update(parsed)
+        prefix["_plots_offset"] = stream.tell()
+        return prefix, reused
+
+    def _changed_plots(self, game: str, data: bytes, index: PlotIndex) -> List[int]:
+        """Return the indexes of the plots that differ from the previous save."""
+        prev = self._plots
+        self._plots = (data, index)
+        if prev is None or game != self._game or len(prev[1]) != len(index):
+            return list(range(len(index)))
+        prev_data, prev_index = prev
+        changed = []
+        for n, (start, end) in enumerate(index):
+            prev_start, prev_end = prev_index.span(n)
+            if data[start:end] != prev_data[prev_start:prev_end]:
+                changed.append(n)
+        return changed
+
+    def update(self, file: Union[str, Path]) -> Event:
+        """Parse `file` and return its settings, state, players and changed plots.
+
+        Raises:
+            NotASaveFile: If `file` isn't a save.
+            ConstructError: If `file` can't be parsed.
+        """
+        start = time.perf_counter()
+        data = _read_savefile(file)
+        prefix, reused = self.parse_prefix(data)
+        settings = Settings.from_struct(prefix)
+        players = get_players(prefix)
+        game = settings_key(settings, players)
+        index = PlotIndex(
+            data, prefix._plots_offset, settings.grid_width, settings.grid_height
+        )
+        changed = self._changed_plots(game, data, index)
+        self._game = game
+        return dict(
+            event="save",
+            file=str(file),
+            game=game,
+            turn=prefix.game_turn,
+            reused=reused,
+            settings=settings,
+            game_state=GameState.from_struct(prefix),
+            players=list(players.values()),
+            plots=[Plot.from_header(index.header(n)) for n in changed],
+            seconds=round(time.perf_counter() - start, 3),
+        )
+
+
+class Watcher:
+    """Poll a folder for new or rewritten saves."""
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        interval: float = 0.25,
+        existing: bool = False,
+    ) -> None:
+        """Watch `directory`.
+
+        Args:
+            directory (str | Path): Folder to watch, usually `single/auto`.
+            interval (float): Seconds between polls. Defaults to 0.25.
+            existing (bool): Also parse the saves already in the folder, oldest
+                first. Defaults to False.
+        """
+        self.directory = Path(directory)
+        self.interval = interval
+        self.parser = IncrementalParser()
+        self._pending: Dict[Path, Tuple[int, int]] = {}
+        self._done: Dict[Path, Tuple[int, int]] = {} if existing else self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        found = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(SAVE_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    found[Path(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def poll(self) -> List[Path]:
+        """Return the new saves that stopped changing since the last poll."""
+        scanned = self._scan()
+        # forget deleted saves, autosaves are rotated so the folder never fills
+        self._done = {p: st for p, st in self._done.items() if p in scanned}
+        current = {p: st for p, st in scanned.items() if self._done.get(p) != st}
+        ready = [p for p, st in current.items() if self._pending.get(p) == st]
+        ready.sort(key=lambda p: current[p][1])
+        for path in ready:
+            self._done[path] = current.pop(path)
+        self._pending = current
+        return ready
+
+    def __iter__(self) -> Iterator[Event]:
+        """Yield an event for every new save, forever."""
+        while True:
+            for path in self.poll():
+                try:
+                    yield self.parser.update(path)
+                except (NotASaveFile, ConstructError, ValueError, OSError) as ex:
+                    yield dict(event="error", file=str(path), error=str(ex))
+            time.sleep(self.interval)
+
+
+def stream_publisher(fp: IO[str]) -> Publisher:
+    """Write each event to `fp` as one line of JSON."""
+
+    def publish(event: Event) -> None:
+        fp.write(export.dumps(event))
+        fp.write("\n")
+        fp.flush()
+
+    return publish
+
+
+class SocketPublisher:
+    """Send each event as one line of JSON to every client of a TCP socket.
+
+    Publishing never blocks on a client: each has a queue that a background
+    thread sends as its socket drains, and a client that falls `MAX_PENDING`
+    bytes behind is dropped.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """Listen on `host`:`port`, port 0 picks a free port (see `address`)."""
+        self._server = socket.socket()
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen()
+        self.address: Tuple[str, int] = self._server.getsockname()[:2]
+        self._clients: Dict[socket.socket, bytearray] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # written to so the thread's select picks up newly queued events
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_w.setblocking(False)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        """Accept clients and send them what's queued until closed."""
+        try:
+            while True:
+                with self._lock:
+                    if self._closed:
+                        return
+                    waiting = [c for c, queued in self._clients.items() if queued]
+                try:
+                    readable, writable, _ = select.select(
+                        [self._server, self._wake_r], waiting, []
+                    )
+                except (OSError, ValueError):
+                    return
+                if self._wake_r in readable:
+                    self._wake_r.recv(4096)
+                if self._server in readable:
+                    try:
+                        client, _ = self._server.accept()
+                    except OSError:
+                        return
+                    client.setblocking(False)
+                    with self._lock:
+                        self._clients[client] = bytearray()
+                with self._lock:
+                    for client in writable:
+                        if client in self._clients:
+                            self._send(client)
+        finally:
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _send(self, client: socket.socket) -> None:
+        """Send what the socket takes of `client`'s queue, with the lock held."""
+        queued = self._clients[client]
+        try:
+            sent = client.send(queued)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(client)
+            return
+        del queued[:sent]
+
+    def _drop(self, client: socket.socket) -> None:
+        client.close()
+        del self._clients[client]
+
+    def __call__(self, event: Event) -> None:
+        """Queue `event` for the connected clients, dropping dead or slow ones."""
+        line = (json.dumps(export.to_jsonable(event)) + "\n").encode()
+        with self._lock:
+            for client, queued in list(self._clients.items()):
+                if len(queued) + len(line) > MAX_PENDING:
+                    self._drop(client)
+                    continue
+                queued += line
+                self._send(client)
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:  # already woken, or closed
+            pass
+
+    def close(self) -> None:
+        """Stop listening and disconnect every client."""
+        with self._lock:
+            self._closed = True
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+        self._server.close()
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
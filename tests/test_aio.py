@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from civ4save import NotASaveFile, SaveFile, aiter_saves
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+
+
+def test_aopen():
+    save = asyncio.run(SaveFile.aopen(GANDHI))
+    assert save.settings == SaveFile(GANDHI).settings
+    assert save.current_turn == 331
+
+    with pytest.raises(NotASaveFile):
+        asyncio.run(SaveFile.aopen("tests/saves/not-a-real.CivBeyondSwordSave"))
+
+
+def test_aiter_saves():
+    async def load(**kwargs):
+        return [s async for s in aiter_saves("tests/saves", concurrency=2, **kwargs)]
+
+    saves = asyncio.run(load(pattern="[bGm]*", skip_invalid=True))
+    assert sorted(s.current_turn for s in saves) == [86, 295, 331]
+
+    with pytest.raises(NotASaveFile):
+        asyncio.run(load(pattern="not-a-real*"))
+
+
+def test_aiter_saves_options():
+    async def load():
+        return [
+            s
+            async for s in aiter_saves(
+                "tests/saves", pattern="G*", backend="struct", decompressor="zlib"
+            )
+        ]
+
+    (save,) = asyncio.run(load())
+    assert save.backend.name == "struct"
+    assert save.decompressor.name == "zlib"
+    assert save.settings == SaveFile(GANDHI).settings
@@ -0,0 +1,95 @@
+import copy
+
+import pytest
+
+from civ4save import SaveFile
+from civ4save.archive import (
+    Archive,
+    ArchiveError,
+    apply_delta,
+    encode_delta,
+    turn_state,
+)
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+MEHMED = "tests/saves/mehmed-epic.CivBeyondSwordSave"
+
+
+def _next_turn(state, turn):
+    nxt = copy.deepcopy(state)
+    nxt.turn = turn
+    for n in (3, 500, 1000):
+        nxt.plots["owner"][n] = 1
+        nxt.plots["improvement_type"][n] = 2
+    nxt.players[0]["score"] += turn
+    del nxt.players[max(nxt.players)]
+    return nxt
+
+
+def test_delta():
+    state = turn_state(SaveFile(GANDHI))
+    nxt = _next_turn(state, 332)
+    delta = encode_delta(state, nxt)
+    assert list(delta["plots"]) == ["owner", "improvement_type"]
+    assert delta["players"] == {0: {"score": nxt.players[0]["score"]}}
+    assert apply_delta(state, 332, state.file, delta) == nxt
+
+
+def test_archive(tmp_path):
+    path = tmp_path / "game.c4a"
+    arc = Archive(path, keyframe_interval=2)
+    assert arc.add([GANDHI]) == [331]
+    assert arc.add([GANDHI]) == []
+    with pytest.raises(ArchiveError):
+        arc.add([MEHMED])
+
+    first = turn_state(SaveFile(GANDHI))
+    states = [first]
+    for turn in (332, 333, 334):
+        states.append(_next_turn(states[-1], turn))
+    arc._write(states)
+
+    reopened = Archive(path)
+    assert reopened.keyframe_interval == 2
+    assert reopened.turns == [331, 332, 333, 334]
+    assert reopened.turn(333) == states[2]
+    assert list(reopened) == states
+
+
+def test_archive_append(tmp_path, monkeypatch):
+    first = turn_state(SaveFile(GANDHI))
+    states = [first]
+    for turn in range(332, 337):
+        states.append(_next_turn(states[-1], turn))
+    arc = Archive(tmp_path / "game.c4a", keyframe_interval=4)
+    arc._write(states[:5])
+
+    decoded = []
+    decode = Archive._decode
+    monkeypatch.setattr(
+        Archive, "_decode", lambda self, *a: decoded.append(a[1]) or decode(self, *a)
+    )
+    arc._append(states[5:])
+    assert decoded == [4]  # only since the last keyframe
+    monkeypatch.undo()
+
+    reopened = Archive(tmp_path / "game.c4a")
+    assert reopened.turns == list(range(331, 337))
+    assert list(reopened) == states
+
+    later = tmp_path / "later.CivBeyondSwordSave"
+    save = SaveFile(GANDHI)
+    save.raw.game_turn = 340
+    save.mark_modified("init_core")
+    save.write(later)
+    assert reopened.add([later]) == [340]
+    assert Archive(tmp_path / "game.c4a").turn(340).turn == 340
+
+
+def test_archive_add_validates_first(tmp_path):
+    path = tmp_path / "game.c4a"
+    arc = Archive(path)
+    with pytest.raises(ArchiveError):
+        arc.add([GANDHI, MEHMED])
+    assert arc.game is None and not path.exists()
+    assert arc.add([MEHMED]) == [SaveFile(MEHMED).current_turn]
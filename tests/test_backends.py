@@ -0,0 +1,107 @@
+# Every backend must give the same results as the reference construct backend.
+import functools
+from pathlib import Path
+
+import pytest
+from construct import Container
+
+from civ4save import NotASaveFile, SaveFile
+from civ4save.backends import BACKEND_ENV, BACKENDS, Backend, get_backend
+from civ4save.vanilla.structure import WSTRING, CompilableAdapter
+
+REFERENCE = "construct"
+SAVES = [
+    str(p)
+    for p in sorted(Path("tests/saves").glob("*.CivBeyondSwordSave"))
+    if not p.name.startswith("not-a-real")
+]
+OTHERS = [name for name in BACKENDS if name != REFERENCE]
+
+
+def _plain(val):
+    """Turn lazy arrays into lists so they compare by value."""
+    if isinstance(val, Container):
+        return {k: _plain(v) for k, v in val.items() if k != "_io"}
+    if isinstance(val, (list, tuple)) or type(val).__name__.startswith("Lazy"):
+        return [_plain(v) for v in val]
+    return val
+
+
+def _assert_same(ref, other):
+    assert _plain(ref) == _plain(other)
+
+
+@pytest.mark.parametrize("backend", OTHERS)
+@pytest.mark.parametrize("file", SAVES)
+def test_prefix(file, backend):
+    ref = SaveFile(file, backend=REFERENCE)
+    save = SaveFile(file, backend=backend)
+    _assert_same(ref._prefix, save._prefix)
+    assert ref.settings == save.settings
+    assert ref.game_state == save.game_state
+    assert ref.players == save.players
+
+
+@functools.lru_cache(maxsize=None)
+def _reference_raw(file):
+    """The reference parse of `file`, shared by the other backends' tests."""
+    try:
+        return _plain(SaveFile(file, backend=REFERENCE).raw)
+    except NotASaveFile:
+        return None
+
+
+@pytest.mark.parametrize("backend", OTHERS)
+@pytest.mark.parametrize("file", SAVES)
+def test_full_parse(file, backend):
+    ref = _reference_raw(file)
+    if ref is None:
+        # plots the structure can't parse, the other backends mustn't either
+        with pytest.raises(NotASaveFile):
+            SaveFile(file, backend=backend).raw
+        return
+    assert ref == _plain(SaveFile(file, backend=backend).raw)
+
+
+def test_get_backend(monkeypatch):
+    monkeypatch.setenv(BACKEND_ENV, REFERENCE)
+    assert get_backend().name == REFERENCE
+    assert get_backend("struct").name == "struct"
+    monkeypatch.delenv(BACKEND_ENV)
+    assert get_backend().name in BACKENDS
+    with pytest.raises(ValueError):
+        SaveFile("tests/saves/mehmed-epic.CivBeyondSwordSave", backend="nope")
+
+
+def test_compiled_cache(monkeypatch, tmp_path):
+    from civ4save.save_file import _read_savefile
+    from civ4save.vanilla.compiled import CACHE_ENV, cache_path, compile_struct
+    from civ4save.vanilla.structure import CivBeyondSwordSavePrefix
+
+    monkeypatch.setenv(CACHE_ENV, str(tmp_path))
+    data = _read_savefile("tests/saves/bismark-emperor-turn86.CivBeyondSwordSave")
+    compiled = compile_struct("prefix", CivBeyondSwordSavePrefix)
+    assert cache_path("prefix").parent == tmp_path
+    assert cache_path("prefix").is_file()
+    cached = compile_struct("prefix", CivBeyondSwordSavePrefix)
+    assert cached is not compiled
+    _assert_same(compiled.parse(data), cached.parse(data))
+    _assert_same(CivBeyondSwordSavePrefix.parse(data), cached.parse(data))
+
+
+def test_backend_must_implement_parse():
+    class PrefixOnly(Backend):
+        def parse_prefix(self, data):
+            return Container()
+
+    with pytest.raises(TypeError):
+        PrefixOnly()
+
+
+def test_compilable_adapter_must_emit_decode():
+    class Upper(CompilableAdapter):
+        def _decode(self, obj, context, path):
+            return obj.upper()
+
+    with pytest.raises(TypeError):
+        Upper(WSTRING)
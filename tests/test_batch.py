@@ -0,0 +1,80 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from civ4save import NotASaveFile, SaveFile, batch, iter_batch
+
+SAVES = [
+    "tests/saves/bismark-emperor-turn86.CivBeyondSwordSave",
+    "tests/saves/not-a-real.CivBeyondSwordSave",
+    "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave",
+]
+
+
+def test_iter_batch():
+    results = list(iter_batch(SAVES, workers=2, skip_invalid=True))
+    assert [r.file for r in results] == [SAVES[0], SAVES[2]]
+    for result in results:
+        with result:
+            save = SaveFile(result.file)
+            assert result.settings == save.settings
+            assert result.players == save.players
+            assert result.data == save._read()
+            assert result.plot_offsets.tolist() == save.plot_index.offsets.tolist()
+            yields = result.columns["yields"]
+            assert yields.tolist() == save.plot_index.column("yields").tolist()
+            owner = result.column("owner")
+    # copies outlive the shared memory
+    assert owner == save.plot_index.column("owner")
+
+
+def test_iter_batch_columns():
+    (result,) = iter_batch(SAVES[:1], workers=1, columns=["x", "y"])
+    with result:
+        assert list(result.columns) == ["x", "y"]
+        assert result.columns["x"][:3].tolist() == [0, 1, 2]
+    (result,) = iter_batch(SAVES[:1], workers=1, columns=[])
+    with result:
+        assert result.columns == {} and result.plot_offsets is None
+
+
+def test_iter_batch_invalid():
+    with pytest.raises(NotASaveFile):
+        for result in iter_batch(SAVES, workers=1):
+            result.close()
+
+
+def test_iter_batch_spawn():
+    ctx = multiprocessing.get_context("spawn")
+    results = iter_batch(SAVES, workers=2, skip_invalid=True, mp_context=ctx)
+    for result, file in zip(results, [SAVES[0], SAVES[2]]):
+        with result:
+            assert result.file == file
+            assert result.data == SaveFile(file)._read()
+
+
+def test_parse_record_keeps_handle():
+    # on Windows the block would be freed with its last handle
+    record = batch.parse_record(SAVES[0], columns=[])
+    assert record.block.name in batch._held
+    with batch.BatchResult(record) as result:
+        assert len(result.data) > 0
+    assert record.block.name not in batch._held
+
+
+def test_iter_batch_window(monkeypatch):
+    submitted = []
+
+    class Counting(ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):
+            submitted.append(args[2])
+            return super().submit(*args, **kwargs)
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", Counting)
+    results = iter_batch([SAVES[0]] * 10, workers=1, columns=[])
+    with next(results):
+        # the window of 2, then the next one once a result is handed out
+        assert len(submitted) == batch.WINDOW_PER_WORKER + 1
+    results.close()
+    assert len(submitted) == batch.WINDOW_PER_WORKER + 1
@@ -35,6 +35,25 @@ def test_parse():
 
     result = runner.invoke(cli, ["parse", "--json", file])
     assert result.exit_code == 0
+    assert json.loads(result.output)["game_speed"] == "GAMESPEED_NORMAL"
+
+    result = runner.invoke(cli, ["parse", "--player", 0, "--json", file])
+    assert result.exit_code == 0
+    assert json.loads(result.output)["leader"] == "LEADER_BISMARCK"
+
+    result = runner.invoke(cli, ["parse", "--plots", "--json", file])
+    assert result.exit_code == 0
+    assert len(json.loads(result.output)) == 84 * 52
+
+    result = runner.invoke(cli, ["parse", "--plots", "--ndjson", file])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 84 * 52
+    assert json.loads(lines[-1])["x"] == 83
+
+    result = runner.invoke(cli, ["parse", "--list-players", "--ndjson", file])
+    assert result.exit_code == 0
+    assert json.loads(result.output.splitlines()[0])["leader"] == "LEADER_BISMARCK"
 
 
 def test_gamefiles():
@@ -0,0 +1,48 @@
+import pytest
+
+from civ4save import SaveFile
+from civ4save.columnar import export_save, plot_table, replay_table
+
+pa = pytest.importorskip("pyarrow")
+
+
+def test_plot_table():
+    save = SaveFile("tests/saves/bismark-emperor-turn86.CivBeyondSwordSave")
+    table = plot_table(save)
+    assert table.num_rows == 4368
+    plots = save.plots
+    for n in (0, 1000, 4367):
+        row = table.slice(n, 1).to_pylist()[0]
+        plot = plots[n]
+        assert (row["x"], row["y"]) == (plot.x, plot.y)
+        assert row["terrain_type"] == plot.terrain_type.name
+        assert row["hills"] == plot.hills
+        assert [
+            row["yield_food"],
+            row["yield_production"],
+            row["yield_commerce"],
+        ] == list(plot.yields)
+
+
+def test_replay_table():
+    save = SaveFile("tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave")
+    table = replay_table(save)
+    assert "_plot_index" not in vars(save)
+    messages = save._prefix.replay_messages
+    assert table.num_rows == len(messages)
+    last = table.slice(table.num_rows - 1).to_pylist()[0]
+    msg = messages[len(messages) - 1]
+    assert (last["turn"], last["type"]) == (msg.turn, msg.type)
+    assert last["text"] == msg.text
+
+
+def test_export_save(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    save = SaveFile("tests/saves/mehmed-epic.CivBeyondSwordSave")
+    written = export_save(save, tmp_path)
+    assert set(written) == {"plots", "players", "deals", "replay_messages"}
+    plots = written["plots"]
+    assert plots.parts[-3].startswith("game=")
+    assert plots.parts[-2] == "turn=295"
+    assert pq.read_table(plots).num_rows == 104 * 64
+    assert export_save(save, tmp_path) == written
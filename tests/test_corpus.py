@@ -0,0 +1,83 @@
+import os
+import shutil
+
+from click.testing import CliRunner
+
+from civ4save.cli import cli
+from civ4save.corpus import INDEX_NAME, CorpusIndex, payload_hash
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+MEHMED = "tests/saves/mehmed-epic.CivBeyondSwordSave"
+NOT_A_SAVE = "tests/saves/not-a-real.CivBeyondSwordSave"
+
+
+def _corpus(tmp_path):
+    shutil.copy(GANDHI, tmp_path / "gandhi.CivBeyondSwordSave")
+    shutil.copy(GANDHI, tmp_path / "upload.CivBeyondSwordSave")
+    (tmp_path / "auto").mkdir()
+    shutil.copy(MEHMED, tmp_path / "auto" / "mehmed.CivBeyondSwordSave")
+    shutil.copy(NOT_A_SAVE, tmp_path / "broken.CivBeyondSwordSave")
+    return sorted(tmp_path.rglob("*.CivBeyondSwordSave"))
+
+
+def test_payload_hash():
+    contents = open(GANDHI, "rb").read()
+    # only the compressed chunks count, not the uncompressed header or trailer
+    changed = b"\0" + contents[1:-1] + b"\0"
+    assert payload_hash(changed) == payload_hash(contents)
+    assert payload_hash(contents) != payload_hash(open(MEHMED, "rb").read())
+
+
+def test_scan(tmp_path):
+    files = _corpus(tmp_path)
+    with CorpusIndex.for_directory(tmp_path) as index:
+        result = index.scan(tmp_path)
+        assert [e.path for e in result.entries] == [str(f) for f in files]
+        assert (result.hashed, result.duplicates, result.invalid) == (4, 1, 1)
+        gandhi = index.get(tmp_path / "gandhi.CivBeyondSwordSave")
+        assert gandhi.probe.turn == 331
+        assert gandhi.probe.game_speed == "GAMESPEED_NORMAL"
+        assert list(index.duplicates().values()) == [
+            [str(tmp_path / "gandhi.CivBeyondSwordSave"), str(files[-1])]
+        ]
+
+        # only the changed file is read again, the removed one is dropped
+        os.remove(tmp_path / "upload.CivBeyondSwordSave")
+        shutil.copy(GANDHI, tmp_path / "auto" / "mehmed.CivBeyondSwordSave")
+        result = index.scan(tmp_path)
+        assert (result.hashed, result.duplicates, result.removed) == (1, 1, 1)
+
+
+def test_select(tmp_path):
+    files = _corpus(tmp_path)
+    with CorpusIndex(tmp_path / "index.db") as index:
+        process, skip = index.select(files, "ingest")
+        assert skip == [tmp_path / "upload.CivBeyondSwordSave"]
+        assert len(process) == 3
+        # committed, other connections see the entries
+        with CorpusIndex(tmp_path / "index.db") as other:
+            assert other.get(files[0]) is not None
+        index.mark_processed("ingest", tmp_path / "gandhi.CivBeyondSwordSave")
+        process, skip = index.select(files, "ingest")
+        assert len(skip) == 2
+        process, skip = index.select(files, "export")
+        assert len(skip) == 1
+
+
+def test_cli(tmp_path):
+    _corpus(tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(cli, ["index", "--duplicates", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "4 read, 0 unchanged, 1 duplicates" in result.output
+    result = runner.invoke(cli, ["index", str(tmp_path)])
+    assert "0 read, 4 unchanged" in result.output
+
+    index = str(tmp_path / INDEX_NAME)
+    db = str(tmp_path / "saves.db")
+    saves = [str(tmp_path / f"{n}.CivBeyondSwordSave") for n in ("gandhi", "upload")]
+    result = runner.invoke(cli, ["ingest", "--index", index, db, *saves])
+    assert result.exit_code == 0
+    assert "Ingested 1 saves, skipped 1" in result.output
+    result = runner.invoke(cli, ["ingest", "--index", index, db, *saves])
+    assert "Ingested 0 saves, skipped 2" in result.output
@@ -0,0 +1,46 @@
+import shutil
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from civ4save import SaveFile
+from civ4save.cli import cli
+from civ4save.database import Database
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+NOT_A_SAVE = "tests/saves/not-a-real.CivBeyondSwordSave"
+
+
+def test_ingest(tmp_path):
+    copy = tmp_path / "copy.CivBeyondSwordSave"
+    shutil.copy(GANDHI, copy)
+    with Database(tmp_path / "saves.db") as db:
+        assert db.ingest(GANDHI) is not None
+        ingested, skipped, failed = db.ingest_many([GANDHI, NOT_A_SAVE, copy])
+        assert (ingested, len(skipped), failed) == ([], 2, [Path(NOT_A_SAVE)])
+        winner = db.conn.execute(
+            "SELECT players.leader, game_state.victory FROM game_state "
+            "JOIN players ON players.save_id = game_state.save_id "
+            "AND players.idx = game_state.winner"
+        ).fetchall()
+        assert winner == [("LEADER_GANDHI", "VICTORY_CULTURAL")]
+        (num_plots,) = db.conn.execute("SELECT count(*) FROM plots").fetchone()
+        assert num_plots == 64 * 40
+
+    save = SaveFile(GANDHI)
+    plot = save.get_plot(10, 20)
+    with Database(tmp_path / "saves.db") as db:
+        row = db.conn.execute(
+            "SELECT enums.name, food, production, commerce FROM plots "
+            "JOIN enums ON enums.type = 'TerrainType' "
+            "AND enums.value = plots.terrain_type WHERE x = 10 AND y = 20"
+        ).fetchone()
+    assert row == (plot.terrain_type.name, *plot.yields)
+
+
+def test_cli_reports_failed(tmp_path):
+    db = str(tmp_path / "saves.db")
+    result = CliRunner().invoke(cli, ["ingest", db, NOT_A_SAVE, GANDHI])
+    assert result.exit_code == 0
+    assert "Ingested 1 saves, skipped 0, failed 1" in result.output
+    assert f"not a save: {NOT_A_SAVE}" in result.output
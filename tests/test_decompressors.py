@@ -0,0 +1,45 @@
+# Every installed decompressor must give the same bytes as the standard library.
+from pathlib import Path
+
+import pytest
+
+from civ4save import SaveFile
+from civ4save.decompressors import (
+    _MODULES,
+    DECOMPRESSOR_ENV,
+    DECOMPRESSORS,
+    get_decompressor,
+)
+from civ4save.save_file import _decompress_savefile
+
+SAVES = [
+    str(p)
+    for p in sorted(Path("tests/saves").glob("*.CivBeyondSwordSave"))
+    if not p.name.startswith("not-a-real")
+]
+
+
+@pytest.mark.parametrize("name", list(DECOMPRESSORS))
+@pytest.mark.parametrize("file", SAVES)
+def test_same_bytes(file, name):
+    contents = Path(file).read_bytes()
+    expected = _decompress_savefile(contents, DECOMPRESSORS["zlib"])
+    assert _decompress_savefile(contents, DECOMPRESSORS[name]) == expected
+    save = SaveFile(file, decompressor=name)
+    # on demand decompression goes through the decompressor objects
+    assert save.settings == SaveFile(file, decompressor="zlib").settings
+    assert save._read() == expected
+
+
+def test_get_decompressor(monkeypatch):
+    monkeypatch.setenv(DECOMPRESSOR_ENV, "zlib")
+    assert get_decompressor().name == "zlib"
+    monkeypatch.delenv(DECOMPRESSOR_ENV)
+    assert get_decompressor().name == list(DECOMPRESSORS)[0]
+    assert get_decompressor("auto").name == list(DECOMPRESSORS)[0]
+    with pytest.raises(ValueError):
+        SaveFile("tests/saves/mehmed-epic.CivBeyondSwordSave", decompressor="nope")
+    for name in _MODULES:
+        if name not in DECOMPRESSORS:
+            with pytest.raises(ValueError, match="isn't installed"):
+                get_decompressor(name)
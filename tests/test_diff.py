@@ -0,0 +1,107 @@
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+from civ4save import SaveFile
+from civ4save.cli import cli
+from civ4save.diff import match_plots
+from civ4save.save_index import index_path
+from civ4save.synthetic import synthesize
+from civ4save.vanilla import enums as e
+from civ4save.vanilla.structure import PREFIX_SECTIONS
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+MEHMED = "tests/saves/mehmed-epic.CivBeyondSwordSave"
+
+
+def test_diff_plots(tmp_path):
+    save = SaveFile(GANDHI)
+    save.patch_plot(3, 4, owner=2, bonus_type="BONUS_GOLD")
+    save.patch_plot(63, 39, improvement_type="IMPROVEMENT_MINE")
+    edited = tmp_path / "edited.CivBeyondSwordSave"
+    save.write(edited)
+
+    diff = SaveFile(GANDHI).diff(SaveFile(edited))
+    assert diff.turns == (331, 331)
+    assert diff.unchanged_sections == PREFIX_SECTIONS
+    assert [(p.x, p.y) for p in diff.plots] == [(3, 4), (63, 39)]
+    old_owner = SaveFile(GANDHI).get_plot(3, 4).owner
+    assert diff.plots[0].changes == {
+        "owner": (old_owner, 2),
+        "bonus_type": (e.BonusType.NO_BONUS, e.BonusType.BONUS_GOLD),
+    }
+    assert diff.plots[1].changes["improvement_type"][1] == (
+        e.ImprovementType.IMPROVEMENT_MINE
+    )
+    assert diff.players == [] and diff.events == []
+
+
+def test_diff_same():
+    diff = SaveFile(GANDHI).diff(SaveFile(GANDHI))
+    assert diff.unchanged_sections == PREFIX_SECTIONS + ["plots"]
+    assert (diff.plots, diff.players, diff.events) == ([], [], [])
+
+
+def test_diff_replay_messages(tmp_path):
+    old = SaveFile(GANDHI)
+    count = old._prefix._sz_replay_messages
+    longer = tmp_path / "longer.CivBeyondSwordSave"
+    longer.write_bytes(synthesize(GANDHI, replay_messages=count + 3))
+    new = SaveFile(longer)
+
+    diff = old.diff(new)
+    assert "replay_messages" not in diff.unchanged_sections
+    assert "plots" in diff.unchanged_sections
+    first = old._prefix.replay_messages[0]
+    assert len(diff.events) == 3
+    assert (diff.events[0].turn, diff.events[0].text) == (first.turn, first.text)
+
+    # the plots moved, their offsets come from the old save's
+    offsets, changed = match_plots(
+        old.plot_index, new._read(), new._prefix._plots_offset
+    )
+    assert changed == []
+    assert offsets == new.plot_index.offsets
+
+
+def test_diff_other_game():
+    with pytest.raises(ValueError):
+        SaveFile(GANDHI).diff(SaveFile(MEHMED))
+
+
+def test_diff_use_index(tmp_path):
+    old = tmp_path / "old.CivBeyondSwordSave"
+    shutil.copy(GANDHI, old)
+    save = SaveFile(GANDHI)
+    save.patch_plot(3, 4, bonus_type="BONUS_GOLD")
+    new = tmp_path / "new.CivBeyondSwordSave"
+    save.write(new)
+
+    expected = SaveFile(old).diff(SaveFile(new))
+    assert not index_path(old).exists()
+    # both sidecar indexes are written, then used
+    for _ in range(2):
+        diff = SaveFile(old, use_index=True).diff(SaveFile(new, use_index=True))
+        assert diff == expected
+        assert index_path(old).exists() and index_path(new).exists()
+    assert SaveFile(new, use_index=True).save_index == SaveFile(new).save_index
+
+
+def test_cli(tmp_path):
+    old = tmp_path / "old.CivBeyondSwordSave"
+    shutil.copy(GANDHI, old)
+    save = SaveFile(GANDHI)
+    save.patch_plot(3, 4, bonus_type="BONUS_GOLD")
+    edited = tmp_path / "edited.CivBeyondSwordSave"
+    save.write(edited)
+    runner = CliRunner()
+    result = runner.invoke(cli, ["diff", "--no-use-index", str(old), str(edited)])
+    assert result.exit_code == 0
+    assert "bonus_type: NO_BONUS -> BONUS_GOLD" in result.output
+    assert not index_path(old).exists()
+    result = runner.invoke(cli, ["diff", str(old), str(edited)])
+    assert "bonus_type: NO_BONUS -> BONUS_GOLD" in result.output
+    assert index_path(old).exists() and index_path(edited).exists()
+    result = runner.invoke(cli, ["diff", "--no-use-index", GANDHI, MEHMED])
+    assert result.exit_code == 1
@@ -0,0 +1,55 @@
+import io
+import json
+
+import pytest
+
+from civ4save import SaveFile, export
+from civ4save.objects import Plot
+from civ4save.utils import CustomJsonEncoder
+from civ4save.vanilla import enums as e
+
+
+@pytest.fixture(scope="module")
+def save():
+    return SaveFile("tests/saves/bismark-emperor-turn86.CivBeyondSwordSave")
+
+
+def test_to_jsonable(save):
+    settings = export.to_jsonable(save.settings)
+    assert settings["game_speed"] == "GAMESPEED_NORMAL"
+    assert settings["grid_width"] == 84
+    assert settings["handicap"] == save.settings.handicap.name
+
+    players = export.to_jsonable(save.players)
+    assert players[0]["civ"] == "CIVILIZATION_GERMANY"
+    assert players[0]["civics"]["government"] == save.players[0].civics.government.name
+    assert json.loads(export.dumps(save.players))["0"] == players[0]
+
+
+def test_same_as_json_encoder(save):
+    # `parse --json` and anything using the encoder must give the same JSON
+    objs = [save.settings, save.game_state, save.players, save.get_plot(3, 4)]
+    for obj in objs:
+        assert json.dumps(obj, cls=CustomJsonEncoder) == export.dumps(obj)
+
+
+def test_converter_falls_back_on_other_types():
+    plot = Plot(0, 0, 0, 0, False, False, True, False, -1, e.PlotType.PLOT_LAND,
+                e.TerrainType.TERRAIN_GRASS, e.FeatureType.NO_FEATURE,
+                e.BonusType.NO_BONUS, e.ImprovementType.NO_IMPROVEMENT, [1, 2, 0])
+    assert export.to_jsonable(plot)["terrain_type"] == "TERRAIN_GRASS"
+    plot.terrain_type = 3
+    plot.owner = e.PlotType.PLOT_LAND
+    converted = export.to_jsonable(plot)
+    assert converted["terrain_type"] == 3
+    assert converted["owner"] == "PLOT_LAND"
+
+    with pytest.raises(TypeError):
+        export.dumps(object())
+
+
+def test_dump_array(save):
+    plots = [save.get_plot(x, 0) for x in range(10)]
+    out = io.StringIO()
+    export.dump_array(plots, out)
+    assert json.loads(out.getvalue()) == [export.to_jsonable(p) for p in plots]
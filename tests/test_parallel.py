@@ -0,0 +1,53 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from civ4save import SaveFile, parallel
+from civ4save.parallel import row_bands
+
+FILE = "tests/saves/bismark-emperor-turn86.CivBeyondSwordSave"
+
+
+def test_row_bands():
+    assert row_bands(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert row_bands(2, 8) == [(0, 1), (1, 2)]
+    assert row_bands(5, 1) == [(0, 5)]
+
+
+def test_workers_match_sequential(monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_PARALLEL_PLOTS", 0)
+    save = SaveFile(FILE)
+    pooled = SaveFile(FILE, workers=3)
+    assert pooled.plot_columns() == save.plot_columns()
+    assert pooled.plot_columns("owner", "yields") == {
+        "owner": save.plot_index.column("owner"),
+        "yields": save.plot_index.column("yields"),
+    }
+    plots = pooled.plots
+    assert plots == save.plots
+    assert [type(p.hills) for p in plots[:3]] == [bool] * 3
+    with pytest.raises(KeyError):
+        pooled.plot_columns("units")
+
+
+def test_small_maps_in_process(monkeypatch):
+    def fail(*args):
+        raise AssertionError("started a pool")
+
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", fail)
+    save = SaveFile(FILE, workers=4)
+    assert len(save.plot_index) < parallel.MIN_PARALLEL_PLOTS
+    assert save.plot_columns("owner") == {"owner": save.plot_index.column("owner")}
+
+
+def test_shared_pool():
+    save = SaveFile(FILE)
+    expected = save.plot_columns("owner", "yields")
+    with ProcessPoolExecutor(2) as pool:
+        for _ in range(2):
+            columns = parallel.plot_columns(
+                save.plot_index, ["owner", "yields"], 2, pool, min_plots=0
+            )
+            assert columns == expected
+        # left running for the next save
+        assert pool.submit(abs, -1).result() == 1
@@ -1,6 +1,25 @@
+import os
+import shutil
+import struct
+
 import pytest
+from construct import ValidationError
 
 from civ4save import NotASaveFile, SaveFile
+from civ4save.backends import BACKENDS
+from civ4save.objects import Plot
+from civ4save.save_file import MAGIC_NUMBER_BASE, _decompress_savefile
+from civ4save.save_index import SaveIndex, index_path
+from civ4save.vanilla import enums as e
+from civ4save.vanilla.structure import SECTIONS
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+SAVES = [
+    "tests/saves/bismark-emperor-turn86.CivBeyondSwordSave",
+    "tests/saves/churchill-random-roll.CivBeyondSwordSave",
+    "tests/saves/mehmed-epic.CivBeyondSwordSave",
+    GANDHI,
+]
 
 
 def test_bad_file():
@@ -31,3 +50,222 @@ def test_completed_game():
     save = SaveFile("tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave")
     assert save.game_state.winner == 0
     assert save.game_state.victory.name == "VICTORY_CULTURAL"
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "bismark-emperor-turn86.CivBeyondSwordSave",
+        "Gandhi-culture-win-t331.CivBeyondSwordSave",
+        "mehmed-epic.CivBeyondSwordSave",
+    ]
+)
+def test_plot_index(filename):
+    save = SaveFile(f"tests/saves/{filename}")
+    index = save.plot_index
+    width, height = save.map_size
+    assert len(index) == len(save.raw.plots) == width * height
+
+    for n, plot in enumerate(save.raw.plots):
+        assert index.span(n) == (plot._plot_start_index, plot._plot_end_index)
+    assert list(index.column("terrain_type")) == [
+        int(p.terrain_type) for p in save.raw.plots
+    ]
+
+    assert save.plots == [Plot.from_struct(p) for p in save.raw.plots]
+
+    plot = save.get_plot(width - 1, height - 1)
+    assert (plot.x, plot.y) == (width - 1, height - 1)
+    assert index.fields(1, "x", "y") == {"x": 1, "y": 0}
+    assert save.get_plot(0, height) is None
+
+
+def test_save_index(tmp_path):
+    file = tmp_path / "bismark.CivBeyondSwordSave"
+    shutil.copy("tests/saves/bismark-emperor-turn86.CivBeyondSwordSave", file)
+
+    save = SaveFile(file, use_index=True)
+    index = save.save_index
+    assert index_path(file).exists()
+    assert index.sections["init_core"] == 0
+    assert list(index.sections) == list(SECTIONS)
+    assert index.sections["plots"] == save.plot_index.start
+    assert index.sections["areas"] == save.plot_index.end
+
+    reopened = SaveFile(file, use_index=True)
+    assert reopened._sidecar_index == index
+    assert reopened.get_plot(10, 20) == save.get_plot(10, 20)
+    assert reopened.section("map").grid_width == 84
+    deals = reopened.section("deals").deals
+    assert deals == save.raw.deals
+
+    # only decompressed up to the section
+    indexed = SaveFile(file, use_index=True)
+    assert indexed.section("deals").deals == save.raw.deals
+    assert not indexed._raw_bytes
+    assert indexed._inflater.end < index.sections["plots"]
+
+    os.utime(file, ns=(0, 0))
+    assert SaveFile(file, use_index=True)._sidecar_index is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not json",
+        "[]",
+        '{"version": 1}',
+        '{"version": 1, "sections": [], "plot_sizes": []}',
+        '{"version": 1, "sections": {"plots": 0}, "plot_sizes": ["a"]}',
+    ],
+)
+def test_corrupt_save_index(tmp_path, text):
+    file = tmp_path / "bismark.CivBeyondSwordSave"
+    shutil.copy("tests/saves/bismark-emperor-turn86.CivBeyondSwordSave", file)
+    index_path(file).write_text(text)
+    assert SaveIndex.read(index_path(file)) is None
+    save = SaveFile(file, use_index=True)
+    assert save._sidecar_index is None
+    assert save.section("map").grid_width == 84
+    # replaced by a good one
+    assert SaveIndex.read(index_path(file)) == save.save_index
+
+
+def test_iter_plots_skips_full_parse():
+    save = SaveFile("tests/saves/churchill-random-roll.CivBeyondSwordSave")
+    plots = save.iter_plots()
+    first = next(plots)
+    assert (first.x, first.y) == (0, 0)
+    assert sum(1 for _ in plots) == 84 * 52 - 1
+    assert save._raw is None
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_misplaced_plot(backend):
+    save = SaveFile("tests/saves/churchill-random-roll.CivBeyondSwordSave")
+    data = bytearray(save._read())
+    start, _ = save.plot_index.span(10)
+    struct.pack_into("<h", data, start + 4, 11)  # x of plot 10
+    with pytest.raises(ValidationError, match="plot 10 .* expected \\(10, 0\\)"):
+        BACKENDS[backend].parse(bytes(data))
+
+
+def test_profile():
+    file = "tests/saves/churchill-random-roll.CivBeyondSwordSave"
+    save = SaveFile(file, profile=True)
+    assert save.players == SaveFile(file).players
+    names = [s.name for s in save.profile.stages]
+    assert names[:3] == ["read", "decompress", "section:init_core"]
+    assert names[-1] == "players"
+    sections = [s for s in save.profile.stages if s.name.startswith("section:")]
+    assert sum(s.bytes for s in sections) == save.plot_index.start
+    assert all(s.seconds > 0 and s.peak_memory >= 0 for s in save.profile.stages)
+    assert save.profile.format().splitlines()[-1].startswith("total")
+    assert SaveFile(file).profile is None
+
+
+def test_patch_plot(tmp_path):
+    save = SaveFile(GANDHI)
+    before = save.get_plot(3, 4)
+    save.patch_plot(
+        3,
+        4,
+        bonus_type=e.BonusType.BONUS_GOLD,
+        improvement_type="IMPROVEMENT_MINE",
+        owner=2,
+        yields=[1, 2, 3],
+    )
+    plot = save.get_plot(3, 4)
+    assert plot.bonus_type == e.BonusType.BONUS_GOLD
+    assert plot.improvement_type == e.ImprovementType.IMPROVEMENT_MINE
+    assert plot.owner == 2
+    assert save.raw.plots[4 * save.map_size[0] + 3].yields == [1, 2, 3]
+    assert plot.terrain_type == before.terrain_type
+
+    file = tmp_path / "patched.CivBeyondSwordSave"
+    file.write_bytes(save.to_bytes())
+    patched = SaveFile(file)
+    assert patched.plots == save.plots
+    assert patched.settings == SaveFile(GANDHI).settings
+
+    with pytest.raises(KeyError):
+        save.patch_plot(3, 4, units=[])
+    with pytest.raises(ValueError):
+        save.patch_plot(3, 4, bonus_type="BONUS_NOPE")
+    with pytest.raises(IndexError):
+        save.patch_plot(save.map_size[0], 0, owner=1)
+
+
+@pytest.mark.parametrize("file", SAVES)
+def test_write_round_trip(file, tmp_path):
+    original = open(file, "rb").read()
+    save = SaveFile(file)
+    save.write(tmp_path / "copy.CivBeyondSwordSave")
+    assert (tmp_path / "copy.CivBeyondSwordSave").read_bytes() == original
+
+    # rebuilt sections are byte for byte the same, only the compression and
+    # with it the first chunk length differ
+    save.mark_modified(*SECTIONS)
+    data = _decompress_savefile(save.to_bytes())
+    expected = bytearray(save._read())
+    z_start, _ = save._layout
+    expected[z_start - 4 : z_start] = data[z_start - 4 : z_start]
+    assert data == expected
+
+
+@pytest.mark.parametrize("file", SAVES)
+def test_write_rebuilt_round_trip(file, tmp_path):
+    # every section rebuilt from `raw`, written, read back the same
+    save = SaveFile(file)
+    save.mark_modified(*SECTIONS)
+    copy = tmp_path / "copy.CivBeyondSwordSave"
+    save.write(copy)
+    rebuilt = SaveFile(copy)
+    z_start, _ = save._layout
+    assert rebuilt._layout == save._layout
+    # only the first chunk length, which depends on the compression, differs
+    data, expected = rebuilt._read(), save._read()
+    assert data[: z_start - 4] == expected[: z_start - 4]
+    assert data[z_start:] == expected[z_start:]
+    assert rebuilt.settings == save.settings
+    assert rebuilt.players == save.players
+    assert rebuilt.plots == save.plots
+
+
+def test_write_modified(tmp_path):
+    save = SaveFile(GANDHI)
+    save.raw.leader_names[0] = "Mahatma Gandhi the Longer Named"
+    save.raw.game_turn = 400
+    save.patch_plot(0, 0, owner=3)
+    save.mark_modified("init_core", "game")
+    file = tmp_path / "edited.CivBeyondSwordSave"
+    save.write(file)
+
+    edited = SaveFile(file)
+    z_start, _ = edited._layout
+    assert z_start > SaveFile(GANDHI)._layout[0]
+    assert edited.raw._bytes_to_zlib_magic_number == z_start - MAGIC_NUMBER_BASE
+    assert edited.players[0].name == "Mahatma Gandhi the Longer Named"
+    assert edited.current_turn == 400
+    assert edited.get_plot(0, 0).owner == 3
+    assert edited.players[1] == SaveFile(GANDHI).players[1]
+    with pytest.raises(KeyError):
+        save.mark_modified("units")
+
+
+def test_incremental_decompression():
+    file = "tests/saves/mehmed-epic.CivBeyondSwordSave"
+    save = SaveFile(file)
+    game = save.section("game")
+    assert len(save._inflater.data) < 32 * 1024
+    assert save.section("votes").map_random_seed == 2769346297
+    assert save.section("init_core").game_turn == save.current_turn
+
+    assert save.settings == SaveFile(file).settings
+    assert len(save._inflater.data) < save._prefix._plots_offset + 32 * 1024
+    assert not save._raw_bytes
+    assert game.elapsed_game_turns == save._prefix.elapsed_game_turns
+
+    # carries on from where it stopped
+    assert save._read() == _decompress_savefile(open(file, "rb").read())
+    assert save.section("deals").deals == save.raw.deals
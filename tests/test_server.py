@@ -0,0 +1,91 @@
+import asyncio
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from civ4save import SaveFile
+from civ4save.export import to_jsonable
+from civ4save.server import MAX_REQUEST_LINE, SaveServer
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+
+
+async def _get(port, *targets):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    for target in targets:
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            key, _, val = line.partition(":")
+            headers[key.lower()] = val.strip()
+        body = await reader.readexactly(int(headers["content-length"]))
+        responses.append((status, json.loads(body)))
+    writer.close()
+    return responses
+
+
+def test_server(tmp_path):
+    shutil.copy(GANDHI, tmp_path / "gandhi.CivBeyondSwordSave")
+    save = SaveFile(GANDHI)
+
+    async def main():
+        server = SaveServer(tmp_path, cache_size=1, executor=ThreadPoolExecutor())
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        responses = await _get(
+            port,
+            "/saves",
+            "/saves/gandhi.CivBeyondSwordSave/game_state",
+            "/saves/gandhi.CivBeyondSwordSave/players/0",
+            "/saves/gandhi.CivBeyondSwordSave/plots?x0=2&y0=3&x1=4&y1=5",
+            "/saves/../gandhi.CivBeyondSwordSave/settings",
+            "/saves/gandhi.CivBeyondSwordSave/plots?x0=a",
+        )
+        listener.close()
+        return responses
+
+    names, state, player, plots, outside, bad_arg = asyncio.run(main())
+    assert names == (200, ["gandhi.CivBeyondSwordSave"])
+    assert state == (200, to_jsonable(save.game_state))
+    assert player[1]["leader"] == "LEADER_GANDHI"
+    assert plots[0] == 200
+    assert [(p["x"], p["y"]) for p in plots[1]] == [
+        (x, y) for y in range(3, 6) for x in range(2, 5)
+    ]
+    assert outside[0] == 404
+    assert bad_arg[0] == 400
+
+
+async def _send(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    status = int((await reader.readline()).split()[1])
+    rest = await reader.read()
+    writer.close()
+    return status, rest
+
+
+def test_server_long_lines(tmp_path):
+    async def main():
+        server = SaveServer(tmp_path, executor=ThreadPoolExecutor())
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        long_target = f"GET /saves/{'a' * MAX_REQUEST_LINE} HTTP/1.1\r\n\r\n"
+        long_header = f"GET /saves HTTP/1.1\r\nX-Pad: {'a' * MAX_REQUEST_LINE}\r\n\r\n"
+        responses = [
+            await _send(port, long_target.encode()),
+            await _send(port, long_header.encode()),
+            await _send(port, b"GET /saves HTTP/1.1\r\nConnection: close\r\n\r\n"),
+        ]
+        listener.close()
+        return responses
+
+    (target, _), (header, _), (ok, body) = asyncio.run(main())
+    assert target == 400
+    assert header == 431
+    assert ok == 200 and body.endswith(b"[]")
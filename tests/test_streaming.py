@@ -0,0 +1,84 @@
+import pytest
+
+from civ4save import NotASaveFile, SaveFile, streaming
+from civ4save.save_file import _compress_savefile
+from civ4save.streaming import PlotEvent, SectionEvent, iter_events, scan
+from civ4save.vanilla.plot_index import PLOT_HEADER_SIZE
+
+CHURCHILL = "tests/saves/churchill-random-roll.CivBeyondSwordSave"
+
+
+def _strip_io(value):
+    if isinstance(value, dict):
+        return {k: _strip_io(v) for k, v in value.items() if k != "_io"}
+    if isinstance(value, list):
+        return [_strip_io(v) for v in value]
+    return value
+
+
+def test_iter_events():
+    save = SaveFile(CHURCHILL)
+    events = list(iter_events(CHURCHILL))
+    sections = [e for e in events if isinstance(e, SectionEvent)]
+    plots = [e for e in events if isinstance(e, PlotEvent)]
+
+    assert [s.name for s in sections][-2:] == ["map", "areas"]
+    for section in sections:
+        # sections parsed by SaveFile also have grid_width and grid_height
+        expected = _strip_io(save.section(section.name))
+        fields = _strip_io(section.fields)
+        assert fields == {k: expected[k] for k in fields}
+    headers = list(save.plot_index.iter_headers())
+    assert [p.header for p in plots] == headers
+    assert [p.index for p in plots] == list(range(len(headers)))
+    assert [p.offset for p in plots] == list(save.plot_index.offsets[:-1])
+    assert sections[-1].offset == save.plot_index.offsets[-1]
+
+
+def test_iter_events_without_plots():
+    events = list(iter_events(CHURCHILL, plots=False))
+    assert events[-1].name == "map"
+    assert all(isinstance(e, SectionEvent) for e in events)
+
+
+def test_scan():
+    sections, plots = [], []
+    scan(CHURCHILL, on_section=sections.append, on_plot=plots.append)
+    map_ = sections[-2].fields
+    assert sections[-1].name == "areas"
+    assert len(plots) == map_.grid_width * map_.grid_height
+
+
+def test_iter_events_bad_file():
+    with pytest.raises(NotASaveFile):
+        list(iter_events("tests/saves/not-a-real.CivBeyondSwordSave"))
+
+
+@pytest.mark.parametrize("backend", ["construct", "struct", "compiled"])
+def test_iter_events_backends(backend):
+    events = list(iter_events(CHURCHILL, backend=backend, decompressor="zlib"))
+    expected = list(iter_events(CHURCHILL))
+    assert [e.offset for e in events] == [e.offset for e in expected]
+    assert _strip_io(events[-1].fields) == _strip_io(expected[-1].fields)
+
+
+def test_iter_events_corrupt_plot(tmp_path, monkeypatch):
+    save = SaveFile(CHURCHILL)
+    data = bytearray(save._read())
+    # length prefix of the first array of the 10th plot
+    data[save.plot_index.offsets[10] + PLOT_HEADER_SIZE] = 0xFF
+    corrupt = tmp_path / "corrupt.CivBeyondSwordSave"
+    corrupt.write_bytes(_compress_savefile(bytes(data), *save._layout))
+
+    inflaters = []
+
+    class Recording(streaming._FileInflater):
+        def __init__(self, *args):
+            super().__init__(*args)
+            inflaters.append(self)
+
+    monkeypatch.setattr(streaming, "_FileInflater", Recording)
+    with pytest.raises(ValueError, match="negative"):
+        list(iter_events(corrupt))
+    # raised right away, not once the rest of the save was decompressed
+    assert not inflaters[0].done
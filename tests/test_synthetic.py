@@ -0,0 +1,47 @@
+import pytest
+
+from civ4save import SaveFile
+from civ4save.save_file import MAGIC_NUMBER_BASE, _decompress_savefile
+from civ4save.synthetic import synthesize
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+
+
+def test_synthesize(tmp_path):
+    file = tmp_path / "big.CivBeyondSwordSave"
+    file.write_bytes(
+        synthesize(
+            GANDHI,
+            grid_width=30,
+            grid_height=20,
+            players=7,
+            replay_messages=3000,
+            deals=50,
+        )
+    )
+    save = SaveFile(file)
+    assert (save.raw.grid_width, save.raw.grid_height) == (30, 20)
+    assert len(save.plots) == 600
+    assert save.get_plot(29, 19).x == 29
+    assert len(save.players) == 8  # and the barbarians
+    assert len(save.raw.replay_messages) == 3000
+    assert len(save.raw.deals) == 50
+    assert save.players[6].name == SaveFile(GANDHI).players[1].name
+    # init_core got longer, the header must point at the moved payload
+    z_start, _ = save._layout
+    assert z_start != SaveFile(GANDHI)._layout[0]
+    assert save.raw._bytes_to_zlib_magic_number == z_start - MAGIC_NUMBER_BASE
+
+
+def test_synthesize_unchanged():
+    original = _decompress_savefile(open(GANDHI, "rb").read())
+    data = _decompress_savefile(synthesize(GANDHI))
+    # only the first chunk length differs
+    z_start = original.find(bytes.fromhex("789c"))
+    assert data[: z_start - 4] == original[: z_start - 4]
+    assert data[z_start:] == original[z_start:]
+
+
+def test_synthesize_invalid():
+    with pytest.raises(ValueError):
+        synthesize(GANDHI, players=0)
@@ -0,0 +1,86 @@
+import json
+import shutil
+import socket
+import time
+
+from civ4save import SaveFile, watch
+from civ4save.watch import IncrementalParser, SocketPublisher, Watcher
+
+GANDHI = "tests/saves/Gandhi-culture-win-t331.CivBeyondSwordSave"
+
+
+def test_incremental_parser():
+    parser = IncrementalParser()
+    first = parser.update(GANDHI)
+    assert first["reused"] == []
+    assert len(first["plots"]) == 64 * 40
+
+    again = parser.update(GANDHI)
+    assert again["reused"] == [
+        "init_core",
+        "game",
+        "deals",
+        "votes",
+        "replay_messages",
+        "game_misc",
+        "map",
+    ]
+    assert again["plots"] == []
+    save = SaveFile(GANDHI)
+    assert again["settings"] == save.settings
+    assert again["game_state"] == save.game_state
+    assert again["players"] == list(save.players.values())
+
+
+def test_watcher_poll(tmp_path):
+    shutil.copy(GANDHI, tmp_path / "old.CivBeyondSwordSave")
+    watcher = Watcher(tmp_path)
+    assert watcher.poll() == []
+
+    new = tmp_path / "new.CivBeyondSwordSave"
+    shutil.copy(GANDHI, new)
+    assert watcher.poll() == []  # not settled yet
+    assert watcher.poll() == [new]
+    assert watcher.poll() == []
+
+    new.unlink()
+    assert watcher.poll() == []
+    assert list(watcher._done) == [tmp_path / "old.CivBeyondSwordSave"]
+
+
+def _wait_for_clients(publisher, count):
+    for _ in range(100):  # wait for the accept thread
+        if len(publisher._clients) == count:
+            return
+        time.sleep(0.01)
+
+
+def test_socket_publisher():
+    publisher = SocketPublisher()
+    with socket.create_connection(publisher.address) as client:
+        _wait_for_clients(publisher, 1)
+        publisher(dict(event="save", turn=1))
+        line = client.makefile().readline()
+    publisher.close()
+    assert json.loads(line) == {"event": "save", "turn": 1}
+
+
+def test_socket_publisher_slow_client(monkeypatch):
+    monkeypatch.setattr(watch, "MAX_PENDING", 1024 * 1024)
+    publisher = SocketPublisher()
+    event = dict(event="save", text="x" * 64 * 1024)
+    with socket.create_connection(publisher.address) as stalled:
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        _wait_for_clients(publisher, 1)
+        start = time.perf_counter()
+        for _ in range(200):  # far more than the socket buffers hold
+            publisher(event)
+        assert time.perf_counter() - start < 5
+        assert publisher._clients == {}
+
+        with socket.create_connection(publisher.address) as client:
+            _wait_for_clients(publisher, 1)
+            publisher(event)
+            line = client.makefile().readline()
+    publisher.close()
+    assert json.loads(line) == event